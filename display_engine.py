@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# Retained-mode display helpers for the Pirate Audio ST7789 240×240
+# Shared by the fast_boot_monkey_midi*.py variants
+
+import sys, os, time, threading
+from collections import OrderedDict
+
+# ---------------------- BOX HELPERS ----------------------
+# Boxes are (x0, y0, x1, y1) with x1/y1 exclusive, like PIL crop()
+
+def _overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def _area(b):
+    return max(0, b[2] - b[0]) * max(0, b[3] - b[1])
+
+def merge_boxes(boxes):
+    out = [b for b in boxes if _area(b)]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(out)):
+            for j in range(i + 1, len(out)):
+                if _overlap(out[i], out[j]):
+                    out[i] = _union(out[i], out.pop(j))
+                    merged = True
+                    break
+            if merged: break
+    return out
+
+def panel_box(box, w, h, rotation):
+    # Map an image-space box onto panel RAM coordinates, matching the
+    # numpy.rot90(image, rotation // 90) done by st7789.image_to_data()
+    x0, y0, x1, y1 = box
+    for _ in range((rotation // 90) % 4):
+        x0, y0, x1, y1 = y0, w - x1, y1, w - x0
+        w, h = h, w
+    return x0, y0, x1, y1
+
+# ---------------------- PARTIAL PUSH ----------------------
+def push_region(disp, img, box):
+    if isinstance(img, Framebuffer565):
+        return img.push(disp, box)
+    rotation = getattr(disp, "_rotation", 0)
+    data = disp.image_to_data(img.crop(box), rotation)
+    x0, y0, x1, y1 = panel_box(box, img.width, img.height, rotation)
+    disp.set_window(x0, y0, x1 - 1, y1 - 1)
+    for i in range(0, len(data), 4096):
+        disp.data(data[i:i + 4096])
+
+# ---------------------- RGB565 FRAMEBUFFER ----------------------
+numpy = None
+
+def color565(c):
+    return ((c[0] & 0xF8) << 8) | ((c[1] & 0xFC) << 3) | (c[2] >> 3)
+
+class Framebuffer565:
+    # Optional panel-native frame: a preallocated big-endian RGB565 array
+    # that stands in for both `img` and `draw` (rectangle/ellipse/text/paste
+    # with ImageDraw's inclusive coordinates). Sprites are converted once
+    # when cached, fills are written as 16-bit words, and push() sends the
+    # changed rows to SPI without building a PIL image or converting it.
+    def __init__(self, width, height):
+        global numpy
+        import numpy
+        self.width, self.height = width, height
+        self.buf = numpy.zeros((height, width), dtype=">u2")
+
+    def _box(self, xy):
+        x0, y0, x1, y1 = [int(v) for v in xy]
+        return max(0, x0), max(0, y0), min(self.width, x1 + 1), min(self.height, y1 + 1)
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        x0, y0, x1, y1 = self._box(xy)
+        if x1 <= x0 or y1 <= y0: return
+        if fill is not None:
+            self.buf[y0:y1, x0:x1] = color565(fill)
+        if outline is not None:
+            c = color565(outline)
+            self.buf[y0:min(y1, y0 + width), x0:x1] = c
+            self.buf[max(y0, y1 - width):y1, x0:x1] = c
+            self.buf[y0:y1, x0:min(x1, x0 + width)] = c
+            self.buf[y0:y1, max(x0, x1 - width):x1] = c
+
+    def ellipse(self, xy, fill=None):
+        x0, y0, x1, y1 = self._box(xy)
+        if fill is None or x1 <= x0 or y1 <= y0: return
+        from PIL import Image, ImageDraw
+        m = Image.new("1", (x1 - x0, y1 - y0))
+        ImageDraw.Draw(m).ellipse((xy[0] - x0, xy[1] - y0, xy[2] - x0, xy[3] - y0), fill=1)
+        self.buf[y0:y1, x0:x1][numpy.array(m, dtype=bool)] = color565(fill)
+
+    def from_image(self, image):
+        pb = numpy.asarray(image.convert("RGB"), dtype=numpy.uint16)
+        out = numpy.empty(pb.shape[:2], dtype=">u2")
+        out[...] = ((pb[..., 0] & 0xF8) << 8) | ((pb[..., 1] & 0xFC) << 3) | (pb[..., 2] >> 3)
+        return out
+
+    def to_image(self, box):
+        from PIL import Image
+        px = self.buf[box[1]:box[3], box[0]:box[2]].astype(numpy.uint16)
+        rgb = numpy.dstack(((px >> 8) & 0xF8, (px >> 3) & 0xFC, (px << 3) & 0xF8)).astype(numpy.uint8)
+        return Image.fromarray(rgb, "RGB")
+
+    def paste(self, spr, xy):
+        x, y = xy
+        h, w = spr.shape
+        sx, sy = max(0, -x), max(0, -y)
+        x1, y1 = min(self.width, x + w), min(self.height, y + h)
+        if x1 <= x + sx or y1 <= y + sy: return
+        self.buf[y + sy:y1, x + sx:x1] = spr[sy:y1 - y, sx:x1 - x]
+
+    def text(self, xy, text, font=None, fill=(255, 255, 255)):
+        # Uncached path (fades, one-off screens): blend over what is there
+        from PIL import ImageDraw
+        l, t, r, b = font.getbbox(text)
+        box = self._box((xy[0] + min(l, 0), xy[1] + min(t, 0), xy[0] + r - 1, xy[1] + b - 1))
+        if box[2] <= box[0] or box[3] <= box[1]: return
+        patch = self.to_image(box)
+        ImageDraw.Draw(patch).text((xy[0] - box[0], xy[1] - box[1]), text, font=font, fill=fill)
+        self.buf[box[1]:box[3], box[0]:box[2]] = self.from_image(patch)
+
+    def push(self, disp, box):
+        rotation = getattr(disp, "_rotation", 0)
+        x0, y0, x1, y1 = box
+        px = self.buf[y0:y1, x0:x1]
+        if rotation: px = numpy.rot90(px, rotation // 90)
+        # Unrotated full-width rows are already contiguous (a view); rot90 is strided, so a rotated push costs one copy of the region
+        raw = memoryview(numpy.ascontiguousarray(px).view(numpy.uint8).reshape(-1))
+        px0, py0, px1, py1 = panel_box(box, self.width, self.height, rotation)
+        disp.set_window(px0, py0, px1 - 1, py1 - 1)
+        for i in range(0, len(raw), 4096):
+            disp.data(raw[i:i + 4096])
+
+# ---------------------- REGION RENDERER ----------------------
+class RegionRenderer:
+    # Each frame is described as a z-ordered list of (name, box, key, draw_fn).
+    # A region is redrawn only when its key or box changed since the last
+    # frame, or when it overlaps something that was redrawn/cleared. Only the
+    # touched rectangles are sent to the panel.
+    def __init__(self, disp, img, draw, bg=(0, 0, 0), full_ratio=0.6):
+        self.disp = disp; self.img = img; self.draw = draw; self.bg = bg
+        self.full_ratio = full_ratio
+        self.prev = {}
+        self.fb565 = isinstance(img, Framebuffer565)
+        self.partial_ok = hasattr(disp, "set_window") and (self.fb565 or hasattr(disp, "image_to_data"))
+        self.frames = self.pushed_px = 0
+
+    def invalidate(self):
+        self.prev = {}
+
+    def push_all(self):
+        if self.fb565: self.img.push(self.disp, (0, 0, self.img.width, self.img.height))
+        else: self.disp.display(self.img)
+
+    def render(self, regions):
+        cur, dirty, cleared = {}, set(), []
+        for i, (name, box, key, _fn) in enumerate(regions):
+            cur[name] = (box, key)
+            old = self.prev.get(name)
+            if old != (box, key):
+                dirty.add(i)
+                if old and old[0] != box: cleared.append(old[0])
+        for name, (box, _key) in self.prev.items():
+            if name not in cur: cleared.append(box)
+        if not dirty and not cleared:
+            return False
+
+        # Anything under a cleared or redrawn box must be redrawn too
+        grew = True
+        while grew:
+            grew = False
+            touched = cleared + [regions[i][1] for i in dirty]
+            for i, r in enumerate(regions):
+                if i not in dirty and any(_overlap(r[1], b) for b in touched):
+                    dirty.add(i); grew = True
+
+        boxes = merge_boxes(cleared + [regions[i][1] for i in sorted(dirty)])
+        for b in boxes:
+            self.draw.rectangle((b[0], b[1], b[2] - 1, b[3] - 1), fill=self.bg)
+        for i in sorted(dirty):
+            regions[i][3]()
+        self.prev = cur
+
+        try:
+            px = sum(_area(b) for b in boxes)
+            if not self.partial_ok or px > self.full_ratio * self.img.width * self.img.height:
+                self.push_all(); px = self.img.width * self.img.height
+            else:
+                for b in boxes: push_region(self.disp, self.img, b)
+            self.frames += 1; self.pushed_px += px
+        except Exception as e:
+            print("disp.display failed:", e)
+            self.invalidate()
+        return True
+
+# ---------------------- REDRAW SCHEDULER ----------------------
+class RedrawScheduler:
+    # State changes call request(); the single render loop sleeps in wait()
+    # until one arrives or until the deadline the last frame asked for
+    # (fades, message timeouts, blinking). Idle means no frames at all.
+    def __init__(self):
+        self._wake = threading.Event()
+
+    def request(self):
+        self._wake.set()
+
+    def wait(self, timeout=None):
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def wrap(self, fn):
+        def handler():
+            try: fn()
+            finally: self.request()
+        return handler
+
+# ---------------------- FRAME PACER ----------------------
+class FramePacer:
+    # Frame-rate policy driven by how long ago the last button press or MIDI
+    # event was: full rate while active (or while something animates), at
+    # most one frame per idle_s once idle_after passes, and backlight off
+    # with no frames at all after blank_after (0 = never). The state is a
+    # pure function of `last`, so a render process only needs that value.
+    def __init__(self, wake=None, active_s=0.06, idle_s=1.0, idle_after=10.0, blank_after=120.0, report_s=30.0):
+        self.wake = wake; self.backlight = None
+        self.active_s = active_s; self.idle_s = idle_s
+        self.idle_after = idle_after; self.blank_after = blank_after
+        self.last = time.time(); self.blanked = False
+        self.report_s = report_s; self._reporting = False
+        self._t_frame = 0.0; self._t0 = 0.0
+        self.frames = 0; self.render_s = 0.0; self.blank_s = 0.0; self._blank_since = 0.0
+
+    def state(self, now):
+        quiet = now - self.last
+        if self.blank_after and quiet >= self.blank_after: return "blank"
+        return "idle" if quiet >= self.idle_after else "active"
+
+    def activity(self):
+        # Cheap enough for the MIDI callback; only wakes the loop from blank
+        now = time.time()
+        asleep = self.blank_after and now - self.last >= self.blank_after
+        self.last = now
+        if asleep and self.wake: self.wake()
+
+    def wrap(self, fn):
+        # Button handler: a press on a blank screen only turns it back on
+        def handler():
+            if self.state(time.time()) == "blank": self.activity(); return
+            self.activity()
+            try: fn()
+            finally:
+                if self.wake: self.wake()
+        return handler
+
+    def due(self, now, animating=False):
+        # 0 = draw now, else seconds until a frame may be drawn (None = not until woken)
+        if not self._reporting and self.report_s:
+            self._reporting = True
+            threading.Thread(target=self._report_loop, daemon=True).start()
+        st = self.state(now)
+        if st == "blank":
+            if not self.blanked:
+                self.blanked = True; self._blank_since = now
+                if self.backlight: self.backlight(False)
+            return None
+        if self.blanked:
+            self.blanked = False; self.blank_s += now - self._blank_since
+            if self.backlight: self.backlight(True)
+        interval = self.active_s if st == "active" or animating else self.idle_s
+        if now - self._t_frame < interval: return interval - (now - self._t_frame)
+        self._t_frame = now; self._t0 = time.perf_counter()
+        return 0
+
+    def done(self, wake, now):
+        # Call after the frame was pushed with the delay the frame asked for
+        self.render_s += time.perf_counter() - self._t0; self.frames += 1
+        if self.blank_after:
+            to_blank = self.last + self.blank_after - now
+            wake = to_blank if wake is None else min(wake, to_blank)
+        return wake
+
+    def _report_loop(self):
+        while True:
+            f0, r0, b0, t0 = self.frames, self.render_s, self.blank_s, time.time()
+            time.sleep(self.report_s)
+            now = time.time(); span = now - t0
+            blank = min(span, self.blank_s - b0 + (now - max(self._blank_since, t0) if self.blanked else 0.0))
+            n = self.frames - f0; r = self.render_s - r0
+            print(f"display {self.state(now)}: {n / span:.2f} fps, render {r * 1000 / max(n, 1):.1f} ms/frame, "
+                  f"{100 * r / span:.1f}% busy, backlight off {100 * blank / span:.0f}%")
+
+# ---------------------- SPRITE CACHE ----------------------
+class SpriteCache:
+    # Pre-rendered text keyed by (text, font, fg, bg). A frame then becomes
+    # mostly img.paste() blits instead of re-rasterizing the same menu
+    # strings with FreeType every time. LRU eviction above max_bytes.
+    def __init__(self, img, max_bytes=1024 * 1024):
+        self.img = img; self.max_bytes = max_bytes
+        self.fb565 = isinstance(img, Framebuffer565)
+        self._items = OrderedDict(); self.bytes = 0
+        self.hits = self.misses = 0
+
+    def _render(self, text, font, fg, bg):
+        from PIL import Image, ImageDraw
+        l, t, r, b = font.getbbox(text)
+        ox, oy = min(l, 0), min(t, 0)
+        if r <= ox or b <= oy: return None
+        spr = Image.new("RGB", (r - ox, b - oy), bg)
+        ImageDraw.Draw(spr).text((-ox, -oy), text, font=font, fill=fg)
+        if self.fb565:
+            # Stored panel-ready: converted to RGB565 once, not every frame
+            return self.img.from_image(spr), ox, oy, spr.width, spr.height, spr.width * spr.height * 2
+        return spr, ox, oy, spr.width, spr.height, spr.width * spr.height * 3
+
+    def sprite(self, text, font, fg, bg):
+        key = (text, font, fg, bg)
+        entry = self._items.get(key)
+        if entry is not None:
+            self._items.move_to_end(key); self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._render(text, font, fg, bg)
+        self._items[key] = entry
+        if entry:
+            self.bytes += entry[5]
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _key, old = self._items.popitem(last=False)
+                if old: self.bytes -= old[5]
+        return entry
+
+    def text(self, xy, text, font, fg, bg=(0, 0, 0), clip=None):
+        # Same pixels as draw.text(xy, text, font=font, fill=fg) drawn over bg;
+        # clip keeps the sprite's bg from spilling past a filled box
+        entry = self.sprite(text, font, fg, bg)
+        if not entry: return
+        spr, ox, oy, w, h, _n = entry
+        x, y = xy[0] + ox, xy[1] + oy
+        if clip:
+            box = (max(0, clip[0] - x), max(0, clip[1] - y), min(w, clip[2] - x), min(h, clip[3] - y))
+            if box[2] <= box[0] or box[3] <= box[1]: return
+            spr = spr[box[1]:box[3], box[0]:box[2]] if self.fb565 else spr.crop(box)
+            x += box[0]; y += box[1]
+        self.img.paste(spr, (x, y))
+
+# ---------------------- RENDER PROCESS ----------------------
+class RenderProcess:
+    # Optional split: the PIL work and the SPI transfer run in a forked
+    # child pinned to its own core, so a slow frame never holds the GIL the
+    # MIDI callback needs. The parent only sends the UI globals that changed
+    # since the last snapshot; the child applies them, renders, and keeps
+    # animating (fades, message timeouts) on its own using the returned delay.
+    def __init__(self, init_fn, frame_fn, cpu=3):
+        import multiprocessing
+        ctx = multiprocessing.get_context("fork")
+        self._rx, self._tx = ctx.Pipe(duplex=False)
+        self._last = {}
+        self.proc = ctx.Process(target=self._run, args=(init_fn, frame_fn, cpu), daemon=True)
+        self.proc.start()
+        self._rx.close()
+        # Keep the parent (and every thread it starts later) off the render core
+        try:
+            others = os.sched_getaffinity(0) - {cpu}
+            if others: os.sched_setaffinity(0, others)
+        except Exception: pass
+
+    def send(self, snapshot):
+        changed = {k: v for k, v in snapshot.items() if k not in self._last or self._last[k] != v}
+        if not changed: return
+        self._last.update(changed)
+        try: self._tx.send(changed)
+        except Exception as e: print("render process gone:", e)
+
+    def _run(self, init_fn, frame_fn, cpu):
+        self._tx.close()
+        try: os.sched_setaffinity(0, {cpu})
+        except Exception: pass
+        init_fn()
+        changes, wake = {}, None
+        while True:
+            if self._rx.poll(wake):
+                try:
+                    changes.update(self._rx.recv())
+                    while self._rx.poll(): changes.update(self._rx.recv())
+                except EOFError:
+                    return
+            wake = frame_fn(changes); changes = {}
+
+# ---------------------- BENCHMARK ----------------------
+# python3 display_engine.py --bench  (one menu frame drawn with ImageDraw.text,
+# with the sprite cache, and with the sprite cache on the RGB565 framebuffer;
+# each includes handing the full frame to a display stand-in)
+class _NullDisplay:
+    _rotation = 90
+    def image_to_data(self, image, rotation=0):
+        # Same conversion st7789.ST7789.image_to_data() does on every display()
+        pb = numpy.rot90(numpy.array(image.convert("RGB")), rotation // 90).astype("uint16")
+        return (((pb[..., [0]] & 0xF8) << 8) | ((pb[..., [1]] & 0xFC) << 3) | ((pb[..., [2]] & 0xF8) >> 3)).byteswap().tobytes()
+    def display(self, image):
+        self.set_window(); data = self.image_to_data(image, self._rotation)
+        for i in range(0, len(data), 4096): self.data(data[i:i + 4096])
+    def set_window(self, *args): pass
+    def data(self, data): pass
+
+def _bench(frames=300):
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 18)
+        font_tiny = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 14)
+    except:
+        font = font_tiny = ImageFont.load_default()
+    menu = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "MIXER", "RECORD", "METRONOME", "VOLUME", "POWER", "SHUTDOWN"]
+
+    def frame(n, draw, sprites):
+        sel = n % len(menu); start = max(0, min(sel - 2, len(menu) - 5))
+        draw.rectangle((0, 0, 239, 239), fill=(0, 0, 0))
+        draw.rectangle((0, 0, 239, 25), fill=(30, 30, 30))
+        draw.rectangle((0, 26, 239, 55), fill=(50, 50, 50))
+        if sprites:
+            sprites.text((10, 4), "TIME: 3:12", font_tiny, (255, 255, 255), (30, 30, 30))
+            sprites.text((10, 31), "MAIN SCREEN", font, (255, 255, 255), (50, 50, 50))
+        else:
+            draw.text((10, 4), "TIME: 3:12", font=font_tiny, fill=(255, 255, 255))
+            draw.text((10, 31), "MAIN SCREEN", font=font, fill=(255, 255, 255))
+        for i, line in enumerate(menu[start:start + 5], start=start):
+            y = 62 + (i - start) * 28
+            fg, bg = ((0, 0, 0), (255, 255, 255)) if i == sel else ((255, 255, 255), (0, 0, 0))
+            if i == sel: draw.rectangle([10, y, 230, y + 26], fill=bg)
+            if sprites: sprites.text((15, y + 2), line, font, fg, bg)
+            else: draw.text((15, y + 2), line, font=font, fill=fg)
+
+    Framebuffer565(1, 1)  # imports numpy
+    for mode in ("ImageDraw.text", "sprite cache", "sprite cache + RGB565 framebuffer"):
+        if mode.endswith("framebuffer"):
+            img = draw = Framebuffer565(240, 240)
+        else:
+            img = Image.new("RGB", (240, 240)); draw = ImageDraw.Draw(img)
+        sprites = SpriteCache(img) if mode != "ImageDraw.text" else None
+        renderer = RegionRenderer(_NullDisplay(), img, draw)
+        t0 = time.perf_counter()
+        for n in range(frames):
+            frame(n, draw, sprites); renderer.push_all()
+        ms = (time.perf_counter() - t0) * 1000 / frames
+        print(f"{mode}: {ms:.3f} ms/frame")
+        if sprites:
+            print(f"  cache: {len(sprites._items)} sprites, {sprites.bytes} bytes, {sprites.hits} hits, {sprites.misses} misses")
+
+if __name__ == '__main__':
+    if "--bench" in sys.argv: _bench()
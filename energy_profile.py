@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Energy profiler for the fast_boot variants
+# Runs scripted scenarios against a variant and samples the UPS (C) INA219
+# at a high rate while they run; writes average mW and projected runtime per scenario.
+#
+# On the Pi (stop monkey-midi.service first, it owns the display and ALSA):
+#   sudo python3 energy_profile.py --variant fast_boot_monkey_midi_savemix
+# Off-device, with a simulated INA219 whose load follows this process's CPU time:
+#   python3 energy_profile.py --fake --seconds 5 --json now.json --baseline before.json
+
+import sys, os, time, threading, json, types, argparse, importlib, datetime
+from display_engine import _NullDisplay, Framebuffer565
+from ups_monitor import UPS_C
+
+# ---------------------- FAKE SMBUS ----------------------
+class FakeSMBus:
+    # INA219 stand-in. Power is a fixed base plus a per-core figure times the
+    # CPU this process actually burned since the last read, plus Wi-Fi and
+    # backlight when on; the battery drains by the charge drawn. Like the real
+    # chip, current and power read 0 until the calibration register is set.
+    def __init__(self, base_mw=800.0, core_mw=450.0, wifi_mw=120.0, backlight_mw=110.0,
+                 capacity_mah=1000.0, v_full=4.15, v_empty=3.4, r_ohm=0.15):
+        self.base_mw = base_mw; self.core_mw = core_mw; self.wifi_mw = wifi_mw; self.backlight_mw = backlight_mw
+        self.capacity_mah = capacity_mah; self.v_full = v_full; self.v_empty = v_empty; self.r_ohm = r_ohm
+        self.wifi = True; self.backlight = True
+        self.regs = {0x05: 0}; self.drawn_mah = 0.0
+        self.v = v_full; self.ma = 0.0; self.mw = base_mw
+        self._t = time.perf_counter(); self._cpu = time.process_time()
+        self.lock = threading.Lock()
+
+    def _update(self):
+        t, cpu = time.perf_counter(), time.process_time()
+        dt = t - self._t
+        if dt <= 0: return
+        cores = (cpu - self._cpu) / dt
+        self._t, self._cpu = t, cpu
+        self.mw = self.base_mw + self.core_mw * cores + (self.wifi_mw if self.wifi else 0) + (self.backlight_mw if self.backlight else 0)
+        ocv = self.v_empty + (self.v_full - self.v_empty) * max(0.0, 1 - self.drawn_mah / self.capacity_mah)
+        self.ma = self.mw / ocv
+        self.v = ocv - self.ma / 1000 * self.r_ohm
+        self.drawn_mah += self.ma * dt / 3600
+
+    @staticmethod
+    def _swap(w): return ((w << 8) & 0xFF00) | ((w >> 8) & 0x00FF)
+
+    def read_word_data(self, addr, reg):
+        with self.lock:
+            if reg == 0x02:
+                self._update(); w = (int(self.v / 0.004) << 3) | 0x2  # CNVR set
+            elif reg == 0x05:
+                w = self.regs[0x05]
+            elif self.regs[0x05] != 4096:
+                w = 0
+            elif reg == 0x04:
+                w = int(round(-self.ma / UPS_C.CURRENT_LSB_MA)) & 0xFFFF
+            elif reg == 0x03:
+                w = int(round(self.mw / UPS_C.POWER_LSB_MW)) & 0xFFFF
+            else:
+                w = 0
+            return self._swap(w)
+
+    def write_word_data(self, addr, reg, value):
+        with self.lock: self.regs[reg] = self._swap(value)
+
+# Stands in for the st7789 module so a variant's own init_display() runs headless
+def _headless_st7789(bus):
+    class ST7789(_NullDisplay):
+        def __init__(self, **kw):
+            self._rotation = kw.get("rotation", 90)
+            Framebuffer565(1, 1)  # imports numpy for image_to_data
+        def begin(self): pass
+        def command(self, data): pass
+        def set_backlight(self, on): bus.backlight = bool(on)
+    mod = types.ModuleType("st7789")
+    mod.ST7789 = ST7789; mod.BG_SPI_CS_FRONT = 1; mod.BG_SPI_CS_BACK = 0
+    return mod
+
+# Synth stand-in off-device without pyfluidsynth: live notes and the metronome
+# still run the app's own callback and render paths, only the audio is missing
+class _NullSynth:
+    def __getattr__(self, name): return lambda *a, **kw: 0
+
+# ---------------------- SAMPLER ----------------------
+class EnergyProbe:
+    # Reads bus voltage and current at `rate_hz` while a scenario runs
+    def __init__(self, ups, rate_hz=50):
+        self.ups = ups; self.period = 1.0 / rate_hz
+
+    def run(self, name, fn, ctx):
+        v_sum = ma_sum = mw_sum = 0.0; n = 0; mw_max = 0.0
+        ctx.stop.clear()
+        worker = threading.Thread(target=fn, args=(ctx,), daemon=True)
+        t0 = time.perf_counter(); worker.start()
+        next_t = t0
+        while time.perf_counter() - t0 < ctx.seconds:
+            try:
+                v = (self.ups.read_word(UPS_C.REG_BUS) >> 3) * 0.004
+                ma = -self.ups.read_signed(UPS_C.REG_CURRENT) * UPS_C.CURRENT_LSB_MA
+            except: v = ma = None
+            if v is not None:
+                mw = v * ma
+                v_sum += v; ma_sum += ma; mw_sum += mw; n += 1; mw_max = max(mw_max, mw)
+            next_t += self.period
+            time.sleep(max(0.0, next_t - time.perf_counter()))
+        ctx.stop.set(); worker.join(2.0)
+        secs = time.perf_counter() - t0
+        if not n: return {"scenario": name, "seconds": secs, "samples": 0}
+        ma = ma_sum / n
+        return {"scenario": name, "seconds": round(secs, 2), "samples": n, "avg_v": round(v_sum / n, 3),
+                "avg_ma": round(ma, 1), "avg_mw": round(mw_sum / n, 1), "max_mw": round(mw_max, 1),
+                "runtime_min": round(60.0 * self.ups.curve.capacity() / ma, 1) if ma > 0 else None}
+
+# ---------------------- SCENARIOS ----------------------
+class Context:
+    def __init__(self, app, bus, seconds, notes_per_s, midi_path):
+        self.app = app; self.bus = bus; self.seconds = seconds
+        self.notes_per_s = notes_per_s; self.midi_path = midi_path
+        self.stop = threading.Event(); self._last = 0.0
+
+    def set_wifi(self, on):
+        if self.bus: self.bus.wifi = on
+        else: os.system("sudo rfkill unblock wifi" if on else "sudo rfkill block wifi")
+
+    def send(self, msg):
+        now = time.perf_counter(); delta = now - self._last if self._last else 0.0; self._last = now
+        self.app.midi_callback((msg, delta), None)
+        self.app.redraw.request()
+
+def sc_idle_menu(ctx):
+    ctx.stop.wait()
+
+def sc_keyboard(ctx):
+    notes = [60, 64, 67, 72, 65, 69, 62, 71]
+    period = 1.0 / ctx.notes_per_s; hold = min(0.2, period * 0.8); i = 0
+    while not ctx.stop.is_set():
+        n = notes[i % len(notes)]; i += 1
+        ctx.send([0x90, n, 100]); ctx.stop.wait(hold)
+        ctx.send([0x80, n, 0]); ctx.stop.wait(period - hold)
+
+def sc_midi_file(ctx):
+    ctx.app.fs.play_midi_file(ctx.midi_path)
+    ctx.stop.wait()
+    ctx.app.fs.play_midi_stop()
+
+def sc_metronome(ctx):
+    m = getattr(ctx.app, "metronome", None)
+    ctx.app.metronome_on = True; ctx.app.redraw.request()
+    if m: m.start()
+    ctx.stop.wait()
+    ctx.app.metronome_on = False
+    if m: m.stop()
+
+def sc_wifi_off(ctx):
+    ctx.set_wifi(False)
+    ctx.stop.wait()
+    ctx.set_wifi(True)
+
+# name, function, returns a reason to skip it (or None)
+SCENARIOS = [
+    ("idle menu", sc_idle_menu, lambda ctx: None),
+    ("keyboard", sc_keyboard, lambda ctx: None if ctx.app.fs else "no synth"),
+    ("midi file", sc_midi_file, lambda ctx: None if ctx.app.fs and not isinstance(ctx.app.fs, _NullSynth) and ctx.midi_path else "no synth or .mid file"),
+    ("metronome", sc_metronome, lambda ctx: None if ctx.app.fs and hasattr(ctx.app, "metronome_on") else "no metronome in this variant"),
+    ("wifi off", sc_wifi_off, lambda ctx: None),
+]
+
+# ---------------------- APP SETUP ----------------------
+def start_app(variant, bus):
+    if bus: sys.modules["st7789"] = _headless_st7789(bus)
+    app = importlib.import_module(variant)
+    if bus:
+        # rtmidi/fluidsynth/gpiozero are not needed (or present) off-device
+        from PIL import Image, ImageDraw, ImageFont
+        app.Image, app.ImageDraw, app.ImageFont, app.st7789 = Image, ImageDraw, ImageFont, sys.modules["st7789"]
+        try:
+            import fluidsynth
+            app.fluidsynth = fluidsynth
+        except ImportError: pass
+    else:
+        app.lazy_imports()
+    app.init_display()
+    try: app.init_fluidsynth_lazy()
+    except: pass
+    if bus and not app.fs:
+        app.fs = _NullSynth()
+        if hasattr(app, "metronome"): app.metronome.attach(app.fs)
+    if app.fs and not isinstance(app.fs, _NullSynth) and app.sfid is None:
+        sf2 = sorted(f for f in os.listdir(app.soundfont_folder) if f.endswith(".sf2")) if os.path.isdir(app.soundfont_folder) else []
+        if sf2:
+            app.sfid = app.fs.sfload(os.path.join(app.soundfont_folder, sf2[0]), True)
+            for ch in range(16): app.fs.program_select(ch, app.sfid, 128 if ch == 9 else 0, 0)
+    def render_loop():
+        next_frame = None
+        while True:
+            app.redraw.wait(next_frame); next_frame = app.update_display()
+    threading.Thread(target=render_loop, daemon=True).start()
+    app.redraw.request()
+    return app
+
+def first_midi_file(app):
+    folder = app.midi_file_folder
+    mids = sorted(f for f in os.listdir(folder) if f.endswith(".mid")) if os.path.isdir(folder) else []
+    return os.path.join(folder, mids[0]) if mids else None
+
+# ---------------------- REPORT ----------------------
+def format_report(meta, results, baseline=None):
+    base = {r["scenario"]: r for r in baseline.get("results", [])} if baseline else {}
+    lines = [f"Energy profile: {meta['variant']} ({meta['source']}), {meta['date']}",
+             f"{meta['seconds']:.0f} s per scenario, {meta['rate_hz']} Hz sampling, {meta['capacity_mah']:.0f} mAh battery", "",
+             f"{'scenario':<12} {'avg V':>6} {'avg mA':>7} {'avg mW':>7} {'max mW':>7} {'runtime':>8}" + ("  vs baseline" if base else "")]
+    for r in results:
+        if r.get("skipped"):
+            lines.append(f"{r['scenario']:<12} skipped: {r['skipped']}"); continue
+        if not r["samples"]:
+            lines.append(f"{r['scenario']:<12} no UPS readings"); continue
+        rt = r["runtime_min"]; rt = f"{int(rt // 60)}:{int(rt % 60):02d}" if rt else "-"
+        line = f"{r['scenario']:<12} {r['avg_v']:>6.3f} {r['avg_ma']:>7.1f} {r['avg_mw']:>7.1f} {r['max_mw']:>7.1f} {rt:>8}"
+        b = base.get(r["scenario"])
+        if b and b.get("avg_mw"):
+            line += f"  {r['avg_mw'] - b['avg_mw']:+.1f} mW ({100 * (r['avg_mw'] / b['avg_mw'] - 1):+.1f}%)"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-scenario power draw of a fast_boot variant")
+    ap.add_argument("--variant", default="fast_boot_monkey_midi_wifilean")
+    ap.add_argument("--fake", action="store_true", help="simulated INA219 and headless display (off-device)")
+    ap.add_argument("--seconds", type=float, default=30.0, help="length of each scenario")
+    ap.add_argument("--rate", type=float, default=50.0, help="UPS samples per second")
+    ap.add_argument("--notes", type=float, default=8.0, help="notes per second in the keyboard scenario")
+    ap.add_argument("--scenarios", default=",".join(s[0] for s in SCENARIOS))
+    ap.add_argument("--out", default="energy_report.txt")
+    ap.add_argument("--json", help="also write the results as JSON (use as a later --baseline)")
+    ap.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    args = ap.parse_args()
+
+    bus = FakeSMBus() if args.fake else None
+    ups = UPS_C(bus=bus, profile_path=None if args.fake else os.path.join(os.path.expanduser("~"), "ups_profile.json"))
+    if not ups.bus: sys.exit("no UPS (C) on i2c-1 (use --fake off-device)")
+    ups.calibrate()
+    app = start_app(args.variant, bus)
+    ctx = Context(app, bus, args.seconds, args.notes, first_midi_file(app))
+    probe = EnergyProbe(ups, args.rate)
+
+    wanted = [s.strip() for s in args.scenarios.split(",")]
+    results = []
+    for name, fn, skip in SCENARIOS:
+        if name not in wanted: continue
+        reason = skip(ctx)
+        if reason: results.append({"scenario": name, "skipped": reason}); continue
+        print(f"running {name} ...", flush=True)
+        time.sleep(1.0)  # let the previous scenario's tail settle
+        results.append(probe.run(name, fn, ctx))
+
+    meta = {"variant": args.variant, "source": "fake SMBus" if args.fake else "UPS (C)", "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "seconds": args.seconds, "rate_hz": args.rate, "capacity_mah": ups.curve.capacity()}
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+    report = format_report(meta, results, baseline)
+    print(report, end="")
+    with open(args.out, "w") as f: f.write(report)
+    if args.json:
+        with open(args.json, "w") as f: json.dump({"meta": meta, "results": results}, f, indent=1)
+
+if __name__ == '__main__':
+    main()
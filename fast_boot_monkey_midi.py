@@ -4,6 +4,11 @@
 # Raspberry Pi Zero 2 W
 
 import sys, os, time, threading
+from types import SimpleNamespace
+from display_engine import RegionRenderer, RedrawScheduler, SpriteCache, Framebuffer565, RenderProcess, FramePacer
+from latency_stats import LatencyProbe
+from midi_input import NativeRoute, MidiQueue, PortManager, PortWatcher
+from list_view import ListView, sort_key
 
 # ---------------------- PATHS ----------------------
 directory = os.path.expanduser("~")
@@ -15,9 +20,10 @@ midi_file_folder = os.path.join(directory, "midifiles")
 
 # ---------------------- UI STATE ----------------------
 MESSAGE = ""
-pathes = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "SHUTDOWN"]
+pathes = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "STATS", "SHUTDOWN"]
 files = pathes.copy()
 selectedindex = 0
+browser = ListView(7)  # visible window and initials of files; files is never copied into it
 operation_mode = "main screen"
 shutting_down = False
 
@@ -33,9 +39,25 @@ button_up = button_down = button_select = button_back = None
 disp = None
 WIDTH = HEIGHT = 240
 img = draw = font = None
-
-DISPLAY_MIN_INTERVAL = 0.06
-_last_display_time = 0.0
+renderer = sprites = None
+
+FRAME_ACTIVE_S = 0.06  # frame interval while buttons/MIDI are in use or an overlay fades
+FRAME_IDLE_S = 1.0     # frame interval once idle
+IDLE_AFTER_S = 10.0    # seconds without input before going idle
+BLANK_AFTER_S = 120.0  # seconds without input before the backlight goes off (0 = never)
+BUTTON_REPEAT_S = 0.25  # a held up/down repeats this often; lists scroll faster, then by initial (list_view.py)
+FRAMEBUFFER_565 = False  # draw straight into a panel-native RGB565 buffer instead of a PIL image
+RENDER_PROCESS = False  # render + SPI in a child process on its own core (see ui_snapshot)
+MIDI_NATIVE_ROUTE = False  # FluidSynth reads the keyboard itself; midi_callback only taps (see midi_input.py)
+route = NativeRoute()
+MIDI_THIN_S = 0.01  # CC / bend / pressure values this close to the last one sent are dropped unless they moved (0 = off)
+MIDI_DROP_AFTERTOUCH = False  # drop channel and poly pressure outright
+MIDI_PORT_CONFIG = {}  # port name part -> {"remap": {in ch: out ch}, "filter": InputFilter kwargs or None}, e.g. {"nanoPAD": {"remap": {0: 9}}}
+LATENCY_DUMP = os.path.join(directory, "latency_dump.txt")  # written from STATS > DUMP
+redraw = RedrawScheduler()
+pacer = FramePacer(redraw.request, FRAME_ACTIVE_S, FRAME_IDLE_S, IDLE_AFTER_S, BLANK_AFTER_S)
+render_proc = None
+in_render_process = False  # set in the render child, which gets main-process state from ui_snapshot
 
 # ---------------------- MIDI / DISPLAY STATE ----------------------
 channel_presets = {}
@@ -54,6 +76,10 @@ keyboard_overlay_start_time = 0.0
 soundfont_paths, soundfont_names = [], []
 midi_paths, midi_names = [], []
 
+midi_manager = None
+port_watcher = None
+latency_probe = None
+
 # ---------------------- LAZY IMPORTS ----------------------
 def lazy_imports():
     global rtmidi, fluidsynth, st7789
@@ -76,14 +102,14 @@ def init_buttons():
     global button_up, button_down, button_select, button_back
     from gpiozero import Button
 
-    button_up = Button(16)
-    button_down = Button(24)
+    button_up = Button(16, hold_time=BUTTON_REPEAT_S, hold_repeat=True)
+    button_down = Button(24, hold_time=BUTTON_REPEAT_S, hold_repeat=True)
     button_select = Button(5)
     button_back = Button(6)
 
 # ---------------------- DISPLAY ----------------------
 def init_display():
-    global disp, img, draw, font
+    global disp, img, draw, font, renderer, sprites
 
     disp = st7789.ST7789(
         width=240,
@@ -97,21 +123,31 @@ def init_display():
     )
     disp.begin()
 
-    img = Image.new("RGB", (WIDTH, HEIGHT), (0, 0, 0))
-    draw = ImageDraw.Draw(img)
+    if FRAMEBUFFER_565:
+        img = draw = Framebuffer565(WIDTH, HEIGHT)
+    else:
+        img = Image.new("RGB", (WIDTH, HEIGHT), (0, 0, 0))
+        draw = ImageDraw.Draw(img)
     try:
         font = ImageFont.truetype(
             "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 18
         )
     except:
         font = ImageFont.load_default()
+    renderer = RegionRenderer(disp, img, draw)
+    sprites = SpriteCache(img)
+    pacer.backlight = disp.set_backlight
 
 # ---------------------- AUDIO ----------------------
 def init_fluidsynth_lazy():
     global fs
     if fs is None:
         fs = fluidsynth.Synth()
+        if MIDI_NATIVE_ROUTE:
+            route.prepare(fs)
         fs.start(driver="alsa")
+        if MIDI_NATIVE_ROUTE and route.src:
+            route.connect()  # new synth, new sequencer client
 
 # ---------------------- SF2 PRESET SUPPORT ----------------------
 try:
@@ -174,87 +210,104 @@ def select_first_presets_for_monkey():
         channel_presets[fs_ch] = mapping.get((0, prog), f"Preset {prog}") if ok else f"Preset {prog}"
 
 # ---------------------- SAFE MIDI ----------------------
-class SafeMidiIn:
-    def __init__(self):
-        self.midiin = rtmidi.MidiIn()
-        self.port_name = None
-        self.callback = None
-        self.lock = threading.Lock()
-
-    def set_callback(self, cb):
-        self.callback = cb
-        if self.midiin.is_port_open():
-            self.midiin.set_callback(self._cb)
-
-    def _cb(self, msg, ts):
-        if self.callback:
-            self.callback(msg, ts)
-
+class SafeMidiIn(PortManager):
+    # Choosing a port opens it next to the ones already open and remembers it;
+    # choosing an open one again closes and forgets it
     def open_port_by_name_async(self, name):
         def t():
-            with self.lock:
-                ports = self.midiin.get_ports()
-                if name in ports:
-                    if self.midiin.is_port_open():
-                        self.midiin.close_port()
-                    self.midiin.open_port(ports.index(name))
-                    self.midiin.set_callback(self._cb)
-                    self.port_name = name
-                    global MESSAGE
-                    MESSAGE = "Connected MIDI"
+            if name in self.ports:
+                port_watcher.forget(name)
+                self.close(name)
+                on_port_change("close", name)
+            else:
+                port_watcher.remember(name)
+                if self.open(name):
+                    on_port_change("open", name)
         threading.Thread(target=t, daemon=True).start()
 
-    def list_ports(self):
-        return self.midiin.get_ports()
+def on_port_change(kind, name):
+    # kind: "open", "close" (from the menu) or "lost" (unplugged; port_watcher reopens it when it is back)
+    global MESSAGE
+    if MIDI_NATIVE_ROUTE:
+        if kind == "open":
+            route.connect(name)
+        else:
+            route.disconnect(name)
+    MESSAGE = {"open": "Connected MIDI", "close": "Closed MIDI", "lost": "MIDI unplugged"}[kind]
+    redraw.request()
 
 # ---------------------- MIDI CALLBACK ----------------------
-def midi_callback(message_data, timestamp):
-    message, _ = message_data
+def midi_callback(message_data, timestamp=None):
+    # Events that do not come from an open port (energy_profile.py); ports push into their own ring
+    t_cb = time.perf_counter()
+    message, delta = message_data  # rtmidi: (bytes, seconds since the previous message)
+    midi_queue.push(message, t_cb, latency_probe.arrival(delta) if latency_probe else 0.0)
+    if latency_probe:
+        latency_probe.callback(t_cb)
+
+def midi_dispatch(message, t_cb, lag, src=None):
+    # Synth side, first for every batch; skipped for a port FluidSynth reads itself
+    if not fs or (src and route.routes(src.name)):
+        return
     status = message[0] & 0xF0
     ch = message[0] & 0x0F
     n1 = message[1] if len(message) > 1 else 0
     n2 = message[2] if len(message) > 2 else 0
 
+    if status == 0x90 and n2 > 0:
+        fs.noteon(ch, n1, n2)  # the queue records the latency
+    elif status == 0x90 or status == 0x80:
+        fs.noteoff(ch, n1)
+    elif status == 0xB0:
+        fs.cc(ch, n1, n2)
+    elif status == 0xE0:
+        fs.pitch_bend(ch, (n2 << 7) + n1 - 8192)
+    elif status == 0xC0:
+        fs.program_change(ch, n1)
+
+def midi_tap(batch):
+    # UI side, after the synth has seen the whole batch
     global current_midi_channel, current_program_change
     global drum_overlay_shown, drum_overlay_start_time
     global keyboard_overlay_channel, keyboard_overlay_start_time
 
-    with state_lock:
-        current_midi_channel = ch
-        if status == 0xC0:
-            current_program_change = n1
+    pacer.activity()
+    for message, t_cb, lag, src in batch:
+        status = message[0] & 0xF0
+        ch = message[0] & 0x0F
+        n1 = message[1] if len(message) > 1 else 0
+        n2 = message[2] if len(message) > 2 else 0
+
+        with state_lock:
+            current_midi_channel = ch
+            if status == 0xC0:
+                current_program_change = n1
 
-    # --- Note On / Off handling ---
-    if status == 0x90:
-        if n2 > 0:
-            fs.noteon(ch, n1, n2)
+        if status == 0x90 and n2 > 0:
             # Show overlay only on first note press per channel
+            # (expiry is checked here too, the renderer may live in another process)
+            now = time.time()
             if ch == 9:  # drum
-                if not drum_overlay_shown:
+                if not drum_overlay_shown or now - drum_overlay_start_time >= 4.0:
                     drum_overlay_shown = True
-                    drum_overlay_start_time = time.time()
+                    drum_overlay_start_time = now
+                    redraw.request()
             else:
-                if keyboard_overlay_channel != ch:
+                if keyboard_overlay_channel != ch or now - keyboard_overlay_start_time >= 4.0:
                     keyboard_overlay_channel = ch
-                    keyboard_overlay_start_time = time.time()
-        else:
-            fs.noteoff(ch, n1)
-    elif status == 0x80:
-        fs.noteoff(ch, n1)
-    elif status == 0xB0:
-        fs.cc(ch, n1, n2)
-    elif status == 0xE0:
-        fs.pitch_bend(ch, (n2 << 7) + n1 - 8192)
-    elif status == 0xC0:
-        fs.program_change(ch, n1)
-        channel_presets[ch] = f"Prog {n1}"
+                    keyboard_overlay_start_time = now
+                    redraw.request()
+        elif status == 0xC0:
+            channel_presets[ch] = f"Prog {n1}"
+
+midi_queue = MidiQueue(midi_dispatch, midi_tap)
 
 # ---------------------- FILE SCANS ----------------------
 def scan_soundfonts():
     global soundfont_paths, soundfont_names
     p, l = [], []
     if os.path.isdir(soundfont_folder):
-        for f in os.listdir(soundfont_folder):
+        for f in sorted(os.listdir(soundfont_folder), key=sort_key):
             if f.endswith('.sf2'):
                 p.append(os.path.join(soundfont_folder, f))
                 l.append(f.replace('.sf2', ''))
@@ -264,109 +317,131 @@ def scan_midifiles():
     global midi_paths, midi_names
     p, l = [], []
     if os.path.isdir(midi_file_folder):
-        for f in os.listdir(midi_file_folder):
+        for f in sorted(os.listdir(midi_file_folder), key=sort_key):
             if f.endswith('.mid'):
                 p.append(os.path.join(midi_file_folder, f))
                 l.append(f.replace('.mid', ''))
     midi_paths, midi_names = p, l
 
 # ---------------------- DISPLAY UPDATE ----------------------
+# Returns how long until the next frame is needed (None = wait for a request)
 def update_display():
-    global _last_display_time, draw, img
-    global drum_overlay_shown, drum_overlay_start_time
-    global keyboard_overlay_channel, keyboard_overlay_start_time
+    global drum_overlay_shown, keyboard_overlay_channel, files
 
-    if draw is None or img is None:
-        return
+    if renderer is None:
+        return None
+    if operation_mode == "STATS" and not in_render_process:
+        files = stats_rows()  # the render process gets them in the snapshot
 
     now = time.time()
-    if now - _last_display_time < DISPLAY_MIN_INTERVAL:
-        return
-    _last_display_time = now
-
-    draw.rectangle((0, 0, WIDTH, HEIGHT), fill=(0, 0, 0))
+    wait = pacer.due(now, animating=drum_overlay_shown or keyboard_overlay_channel is not None)
+    if wait != 0:
+        return wait
 
     if shutting_down:
-        draw.text((10, HEIGHT//2 - 10), MESSAGE, font=font, fill=(0, 255, 0))
-        try:
-            disp.display(img)
-        except Exception as e:
-            print("disp.display failed:", e)
-        return
+        renderer.render([
+            ("shutdown", (0, 0, WIDTH, HEIGHT), MESSAGE,
+             lambda: draw.text((10, HEIGHT//2 - 10), MESSAGE, font=font, fill=(0, 255, 0))),
+        ])
+        return pacer.done(None, now)
 
-    # --- Draw menu ---
-    if operation_mode == "main screen":
-        start_index = 0
-        end_index = len(files)
-    else:
-        start_index = max(0, selectedindex - 6)
-        end_index = min(len(files), start_index + 7)
+    regions = []
+
+    # --- Menu rows ---
+    browser.show(files)
+    start_index, rows = browser.window(selectedindex)
 
-    for i, line in enumerate(files[start_index:end_index], start=start_index):
+    for i, line in enumerate(rows, start=start_index):
         y = 30 + (i - start_index) * 30
-        if i == selectedindex:
-            draw.rectangle([10, y, WIDTH - 10, y + 30], fill=(255, 255, 255))
-            draw.text((10, y), line, font=font, fill=(0, 0, 0))
-        else:
-            draw.text((10, y), line, font=font, fill=(255, 255, 255))
+        selected = i == selectedindex
+        regions.append((f"row{i - start_index}", (0, y, WIDTH, y + 30), (line, selected),
+                        lambda y=y, line=line, selected=selected: _draw_row(y, line, selected)))
 
-    draw.text((10, 0), MESSAGE, font=font, fill=(255, 0, 0))
-    overlay_y = HEIGHT - 30
+    if MESSAGE:
+        regions.append(("message", (0, 0, WIDTH, 30), MESSAGE,
+                        lambda: sprites.text((10, 0), MESSAGE, font, (255, 0, 0))))
 
-    # --- DRUM OVERLAY WITH SMOOTH FADE ---
+    # --- Channel overlay with smooth fade (keyboard wins over drums) ---
+    overlay = None
     if drum_overlay_shown:
         elapsed = now - drum_overlay_start_time
         if elapsed < 4.0:
-            alpha = int(255 * (1 - elapsed / 4.0))
-            disp_ch = get_display_channel(9)
-            preset_name = channel_presets.get(9, "Drums")
-            color = (0, alpha, 0)
-            draw.rectangle((0, overlay_y, WIDTH, HEIGHT), fill=(0, 0, 0))
-            draw.text((10, overlay_y + 4), f"CH {disp_ch} : {preset_name}", font=font, fill=color)
+            overlay = (int(255 * (1 - elapsed / 4.0)), f"CH {get_display_channel(9)} : {channel_presets.get(9, 'Drums')}")
         else:
             drum_overlay_shown = False
-
-    # --- KEYBOARD OVERLAY WITH SMOOTH FADE ---
     if keyboard_overlay_channel is not None:
         elapsed = now - keyboard_overlay_start_time
         if elapsed < 4.0:
-            alpha = int(255 * (1 - elapsed / 4.0))
-            disp_ch = get_display_channel(keyboard_overlay_channel)
             preset_name = channel_presets.get(keyboard_overlay_channel, f"Prog {current_program_change}")
-            color = (0, alpha, 0)
-            draw.rectangle((0, overlay_y, WIDTH, HEIGHT), fill=(0, 0, 0))
-            draw.text((10, overlay_y + 4), f"CH {disp_ch} : {preset_name}", font=font, fill=color)
+            overlay = (int(255 * (1 - elapsed / 4.0)), f"CH {get_display_channel(keyboard_overlay_channel)} : {preset_name}")
         else:
             keyboard_overlay_channel = None
+    if overlay:
+        overlay_y = HEIGHT - 30
+        def d_overlay():
+            # Black strip first: the last list row lies under it and would show through the fading text
+            draw.rectangle((0, overlay_y, WIDTH - 1, HEIGHT - 1), fill=(0, 0, 0))
+            draw.text((10, overlay_y + 4), overlay[1], font=font, fill=(0, overlay[0], 0))
+        regions.append(("overlay", (0, overlay_y, WIDTH, HEIGHT), overlay, d_overlay))
 
     # --- MIDI connection status ---
     if 'midi_manager' in globals() and midi_manager is not None:
         if operation_mode in ["main screen", "MIDI KEYBOARD"]:
             status_text = f"MIDI: {midi_manager.port_name}" if midi_manager.port_name else "MIDI: Connecting..."
-            draw.text((10, HEIGHT - 55), status_text, font=font, fill=(255, 255, 0))
+            regions.append(("status", (0, HEIGHT - 55, WIDTH, HEIGHT - 30), status_text,
+                            lambda: sprites.text((10, HEIGHT - 55), status_text, font, (255, 255, 0))))
 
-    try:
-        disp.display(img)
-    except Exception as e:
-        print("disp.display failed:", e)
+    renderer.render(regions)
+    # Keep frames coming only while the overlay is fading (or once a second on STATS)
+    return pacer.done(FRAME_ACTIVE_S if overlay else 1.0 if operation_mode == "STATS" else None, now)
+
+def _draw_row(y, line, selected):
+    if selected:
+        draw.rectangle([10, y, WIDTH - 10, y + 29], fill=(255, 255, 255))
+        sprites.text((10, y), line, font, (0, 0, 0), (255, 255, 255), clip=(10, y, WIDTH - 9, y + 30))
+    else:
+        sprites.text((10, y), line, font, (255, 255, 255))
+
+# ---------------------- LATENCY STATS ----------------------
+def stats_rows():
+    # STATS screen: note-on latency per stage (ms), then the probe controls
+    st = latency_probe.stages() if latency_probe else {}
+    rows = ["stage  p50   p99   max"]
+    for name in LatencyProbe.STAGES:
+        r = st.get(name)
+        if r:
+            rows.append(f"{name[:5]:<5} {r['p50']:4.1f} {r['p99']:5.1f} {r['max']:5.1f}")
+        else:
+            rows.append(f"{name[:5]:<5}   --")
+    return rows + [f"PROBE: {'ON' if LatencyProbe.enabled else 'OFF'}", "DUMP", "RESET"]
+
+def stats_select(sel):
+    global files, pathes, MESSAGE
+    if sel.startswith("PROBE"):
+        LatencyProbe.enabled = not LatencyProbe.enabled
+    elif sel == "DUMP" and latency_probe:
+        MESSAGE = "Dumped" if latency_probe.dump(LATENCY_DUMP) else "Dump failed"
+    elif sel == "RESET" and latency_probe:
+        latency_probe.reset()
+    files = pathes = stats_rows()
 
 # ---------------------- BUTTON HANDLERS ----------------------
-def handle_up():
+def handle_up(held=0.0):
+    # held: seconds a held button has been down (its repeats), 0 for a press
     global selectedindex
-    selectedindex = max(0, selectedindex - 1)
-    update_display()
+    browser.show(files)
+    selectedindex = browser.move(selectedindex, -1, held)
 
-def handle_down():
+def handle_down(held=0.0):
     global selectedindex
-    selectedindex = min(len(files) - 1, selectedindex + 1)
-    update_display()
+    browser.show(files)
+    selectedindex = browser.move(selectedindex, 1, held)
 
 def handle_back():
     global operation_mode, files, pathes, selectedindex
     operation_mode = "main screen"
-    files = pathes = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "SHUTDOWN"]
+    files = pathes = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "STATS", "SHUTDOWN"]
     selectedindex = 0
-    update_display()
 
 def handle_select():
     global operation_mode, files, pathes, selectedindex, MESSAGE
@@ -378,13 +453,13 @@ def handle_select():
     if operation_mode == "main screen":
         operation_mode = sel
         if sel == "SOUND FONT":
-            files = soundfont_names.copy()
-            pathes = soundfont_paths.copy()
+            files = soundfont_names
+            pathes = soundfont_paths
             if not files:
                 MESSAGE = "No SF2 files"
         elif sel == "MIDI FILE":
-            files = midi_names.copy()
-            pathes = midi_paths.copy()
+            files = midi_names
+            pathes = midi_paths
             if not files:
                 MESSAGE = "No MIDI files"
         elif sel == "MIDI KEYBOARD":
@@ -394,14 +469,18 @@ def handle_select():
                 pathes = files = []
             if not files:
                 MESSAGE = "No MIDI ports"
+        elif sel == "STATS":
+            files = pathes = stats_rows()
         elif sel == "SHUTDOWN":
             shutting_down = True
             MESSAGE = "Shutting down..."
-            update_display()
+            redraw.request()
             time.sleep(4)
             os.system("sudo /bin/systemctl poweroff")
             return
         selectedindex = 0
+    elif operation_mode == "STATS":
+        stats_select(sel)
     else:
         if operation_mode == "SOUND FONT" and files:
             loaded_sf2_path = pathes[selectedindex]
@@ -422,32 +501,89 @@ def handle_select():
                 midi_manager.open_port_by_name_async(pathes[selectedindex])
         handle_back()
 
+# ---------------------- RENDER PROCESS ----------------------
+def list_window():
+    # Only the visible rows go to the render process, whatever the length of the list
+    browser.show(stats_rows() if operation_mode == "STATS" else files)
+    return browser.window(selectedindex)
+
+# Everything update_display() reads, copied so in-place edits show up as changes
+def ui_snapshot():
+    snap = {
+        "MESSAGE": MESSAGE, "list_window": list_window(), "selectedindex": selectedindex,
+        "operation_mode": operation_mode, "shutting_down": shutting_down,
+        "channel_presets": dict(channel_presets), "current_program_change": current_program_change,
+        "drum_overlay_shown": drum_overlay_shown, "drum_overlay_start_time": drum_overlay_start_time,
+        "keyboard_overlay_channel": keyboard_overlay_channel, "keyboard_overlay_start_time": keyboard_overlay_start_time,
+        "activity": pacer.last,
+    }
+    if midi_manager is not None:
+        snap["midi_port"] = midi_manager.port_name
+    return snap
+
+def _render_init():
+    global in_render_process; in_render_process = True
+    lazy_imports()
+    init_display()
+
+def _render_frame(changes):
+    global midi_manager
+    if "midi_port" in changes:
+        # The child only needs the port name, not the rtmidi object
+        midi_manager = SimpleNamespace(port_name=changes.pop("midi_port"))
+    if "activity" in changes:
+        pacer.last = changes.pop("activity")
+    if "list_window" in changes:
+        browser.fixed = changes.pop("list_window")
+    globals().update(changes)
+    return update_display()
+
 # ---------------------- BACKGROUND INIT ----------------------
 def background_init():
+    global latency_probe
     lazy_imports()
     init_buttons()
-    init_display()
+    if not RENDER_PROCESS:
+        init_display()
+    latency_probe = LatencyProbe()
+    midi_queue.probe = latency_probe
 
     threading.Thread(target=scan_soundfonts, daemon=True).start()
     threading.Thread(target=scan_midifiles, daemon=True).start()
 
-    button_up.when_pressed = handle_up
-    button_down.when_pressed = handle_down
-    button_select.when_pressed = handle_select
-    button_back.when_pressed = handle_back
+    button_up.when_pressed = pacer.wrap(handle_up)
+    button_down.when_pressed = pacer.wrap(handle_down)
+    button_up.when_held = pacer.wrap(lambda: handle_up(button_up.active_time or 0.0))
+    button_down.when_held = pacer.wrap(lambda: handle_down(button_down.active_time or 0.0))
+    button_select.when_pressed = pacer.wrap(handle_select)
+    button_back.when_pressed = pacer.wrap(handle_back)
 
     global midi_manager
-    midi_manager = SafeMidiIn()
-    midi_manager.set_callback(midi_callback)
+    midi_manager = SafeMidiIn(rtmidi, midi_queue, MIDI_PORT_CONFIG, probe=latency_probe, window_s=MIDI_THIN_S, drop=(0xA0, 0xD0) if MIDI_DROP_AFTERTOUCH else ())
+
+    global port_watcher
+    port_watcher = PortWatcher(midi_manager, os.path.join(directory, "midi_ports.json"), on_port_change)
+    port_watcher.start()  # reopens the remembered keyboards now and whenever they are plugged back in
 
-    update_display()
+    redraw.request()
 
 # ---------------------- MAIN ----------------------
 def main():
+    global render_proc
+    if RENDER_PROCESS:
+        # Fork before any other thread exists
+        render_proc = RenderProcess(_render_init, _render_frame)
     threading.Thread(target=background_init, daemon=True).start()
+    next_frame = None
     while True:
-        time.sleep(0.05)  # faster updates for smoother fade
-        update_display()
+        redraw.wait(next_frame)  # sleeps until a state change or a running fade
+        if render_proc:
+            render_proc.send(ui_snapshot())
+            next_frame = 1.0 if operation_mode == "STATS" else None
+        elif latency_probe:
+            next_frame = latency_probe.frame(update_display)  # notes dispatched meanwhile count as "drawing"
+        else:
+            next_frame = update_display()
 
 if __name__ == '__main__':
     main()
@@ -1,104 +1,71 @@
 #!/usr/bin/env python3
 # Monkey MIDI Player - FINAL OPTIMIZED VERSION
 
-import sys, os, time, threading, smbus, datetime
-import mido 
+import sys, os, time, threading, datetime
+from display_engine import RegionRenderer, RedrawScheduler, SpriteCache, Framebuffer565, RenderProcess, FramePacer
+from latency_stats import LatencyProbe
+from ups_monitor import UPS_C
+from power_profiles import PowerManager, PROFILES
+from midi_input import NativeRoute, MidiQueue, PortManager, PortWatcher
+from midi_recorder import MidiRecorder
+from metronome import Metronome
+from transport import Transport, ClockOut
+from midi_event_cache import EventCache
+from midi_library import MidiLibrary
+from list_view import ListView, sort_key
 
 # --- 1. BOOT DELAY ---
 time.sleep(2)
 
+# ---------------------- PATHS & UI STATE ----------------------
+directory = os.path.expanduser("~")
+if directory == "/root": directory = "/home/pi"
+soundfont_folder = os.path.join(directory, "sf2")
+midi_file_folder = os.path.join(directory, "midifiles")
+
+# ---------------------- TEMPO CLOCK ----------------------
+# Metronome, recorder ticks and MIDI Clock out all follow it; a playing file brings its own tempo map
+transport = Transport(cache=EventCache(os.path.join(midi_file_folder, ".eventcache")))  # compiled files: no mido parse on PLAY
+clock_out = ClockOut(transport)
+
 # ---------------------- RECORDING ENGINE ----------------------
-class MidiRecorder:
-    def __init__(self):
-        self.recording = False
-        self.mid = None
-        self.track = None
-        self.start_time = 0
-        self.last_event_time = 0
-
-    def start(self):
-        self.mid = mido.MidiFile()
-        self.track = mido.MidiTrack()
-        self.mid.tracks.append(self.track)
-        self.recording = True
-        self.start_time = time.time()
-        self.last_event_time = self.start_time
-
-    def stop(self, filename):
-        if not self.recording: return
-        self.recording = False
-        self.mid.save(filename)
-
-    def add_event(self, msg):
-        if self.recording:
-            now = time.time()
-            delta = int(mido.second2tick(now - self.last_event_time, self.mid.ticks_per_beat, 500000))
-            msg.time = delta
-            self.track.append(msg)
-            self.last_event_time = now
-
-recorder = MidiRecorder()
+recorder = MidiRecorder(os.path.join(directory, "rec_journal.bin"), transport)  # journal flushed every second while recording
+
+def on_recording_saved(path, ok):
+    global MESSAGE, msg_start_time
+    if ok: library.update(path)
+    MESSAGE = "Saved Rec" if ok else "Rec failed"; msg_start_time = time.time(); redraw.request()
+
+def recover_recording():
+    # A take cut short by a power loss or a service restart is left in the journal
+    global MESSAGE, msg_start_time
+    path = recorder.recover(midi_file_folder); library.open()  # the index rescans after the recovered take is in place
+    if path: MESSAGE = "Rec recovered"; msg_start_time = time.time(); redraw.request()
 
 # ---------------------- METRONOME ENGINE ----------------------
 metronome_on = False
 bpm = 120
 metro_vol = 80 
+metro_beats = 4
 metro_adjusting = False
-
-def metronome_worker():
-    while True:
-        if metronome_on and fs:
-            try:
-                fs.noteon(9, 76, metro_vol) 
-                time.sleep(0.05)
-                fs.noteoff(9, 76)
-                time.sleep((60.0 / bpm) - 0.05)
-            except: time.sleep(0.1)
-        else:
-            time.sleep(0.2)
-
-threading.Thread(target=metronome_worker, daemon=True).start()
+file_bpm = None  # tempo of the playing file, shown instead of bpm
+metronome = Metronome(transport, velocity=metro_vol)
 
 # ---------------------- WAVESHARE UPS (C) ----------------------
-class UPS_C:
-    def __init__(self, addr=0x43):
-        self.bus = None; self.addr = addr; self.readings = []; self.last_time_str = "0:00"
-        try: self.bus = smbus.SMBus(1)
-        except: pass
-    def get_voltage(self):
-        if not self.bus: return 0.0
-        try:
-            read = self.bus.read_word_data(self.addr, 0x02)
-            swapped = ((read << 8) & 0xFF00) | ((read >> 8) & 0x00FF)
-            v = (swapped >> 3) * 0.004
-            self.readings.append(v)
-            if len(self.readings) > 20: self.readings.pop(0)
-            return sorted(self.readings)[len(self.readings)//2]
-        except: return 0.0
-    def get_time_left(self):
-        v = self.get_voltage(); p = max(0, min(1, (v - 3.4) / (4.15 - 3.4)))
-        total_minutes = p * (280 if LOW_POWER_MODE else 210)
-        return f"{int(total_minutes // 60)}:{int(total_minutes % 60):02d}"
-    def get_percentage_raw(self):
-        v = self.get_voltage(); p = (v - 3.4) / (4.15 - 3.4) * 100
-        return max(0, min(100, int(p)))
-
-ups = UPS_C()
-
-# ---------------------- PATHS & UI STATE ----------------------
-directory = os.path.expanduser("~")
-if directory == "/root": directory = "/home/pi"
-soundfont_folder = os.path.join(directory, "sf2")
-midi_file_folder = os.path.join(directory, "midifiles")
+# minutes: linear estimate used until the load of a mode has been measured
+ups = UPS_C(minutes={"MAX": 210, "ECO": 280, "GIG": 240}, mode="MAX", profile_path=os.path.join(directory, "ups_profile.json"))
 
 MESSAGE = ""; msg_start_time = 0
-MAIN_MENU = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "MIXER", "RECORD", "METRONOME", "VOLUME", "POWER", "SHUTDOWN"]
+MAIN_MENU = ["MIDI KEYBOARD", "SOUND FONT", "MIDI FILE", "MIXER", "RECORD", "METRONOME", "VOLUME", "POWER", "STATS", "SHUTDOWN"]
 files = MAIN_MENU.copy()
 pathes = MAIN_MENU.copy()
 selectedindex = 0
+browser = ListView()  # visible window and initials of files; files is never copied into it
 operation_mode = "main screen"
 shutting_down = False
+POWER_PROFILE = "MAX"  # applied profile; LOW_POWER_MODE follows it
 LOW_POWER_MODE = False
+power = PowerManager()
 volume_level = 0.5 
 selected_file_path = ""
 rename_string = ""
@@ -114,11 +81,29 @@ Image = ImageDraw = ImageFont = None
 fs = None; sfid = None; loaded_sf2_path = None; disp = None
 WIDTH = HEIGHT = 240
 img = draw = font = font_tiny = None
-_last_display_time = 0.0
+renderer = sprites = None
+redraw = RedrawScheduler()
+UPS_SAMPLE_S = 2.0  # INA219 poll period; the header is redrawn only when the reading moves
+FRAME_IDLE_S = 1.0     # frame interval once idle
+IDLE_AFTER_S = 10.0    # seconds without input before going idle
+BLANK_AFTER_S = 120.0  # seconds without input before the backlight goes off (halved in low power mode, 0 = never)
+BUTTON_REPEAT_S = 0.25  # a held up/down repeats this often; lists scroll faster, then by initial (list_view.py)
+pacer = FramePacer(redraw.request, PROFILES[POWER_PROFILE]["frame_s"], FRAME_IDLE_S, IDLE_AFTER_S, BLANK_AFTER_S)
+FRAMEBUFFER_565 = False  # draw straight into a panel-native RGB565 buffer instead of a PIL image
+RENDER_PROCESS = False  # render + SPI in a child process on its own core (see ui_snapshot)
+MIDI_NATIVE_ROUTE = False  # FluidSynth reads the keyboard itself; the callback below only taps (see midi_input.py)
+route = NativeRoute()
+MIDI_THIN_S = 0.01  # CC / bend / pressure values this close to the last one sent are dropped unless they moved (0 = off)
+MIDI_DROP_AFTERTOUCH = False  # drop channel and poly pressure outright
+MIDI_PORT_CONFIG = {}  # port name part -> {"remap": {in ch: out ch}, "filter": InputFilter kwargs or None}, e.g. {"nanoPAD": {"remap": {0: 9}}}
+MIDI_CLOCK_OUT = None  # output port name part (e.g. "UM-ONE") to send MIDI Clock / Start / Stop to
+LATENCY_DUMP = os.path.join(directory, "latency_dump.txt")  # written from STATS > DUMP
+render_proc = None; latency_probe = None; port_watcher = None
+in_render_process = False  # set in the render child, which gets main-process state from ui_snapshot
 channel_presets = {}
 drum_overlay_shown = False; drum_overlay_start_time = 0.0
 keyboard_overlay_channel = None; keyboard_overlay_start_time = 0.0
-soundfont_paths, soundfont_names = [], []; midi_paths, midi_names = [], []
+soundfont_paths, soundfont_names = [], []; midi_listing = ([], [])  # (paths, names), one reference so a reader never sees halves of two listings
 
 def lazy_imports():
     global rtmidi, fluidsynth, st7789, Image, ImageDraw, ImageFont
@@ -128,21 +113,24 @@ def lazy_imports():
 def init_buttons():
     global button_up, button_down, button_select, button_back
     from gpiozero import Button
-    button_up, button_down = Button(16), Button(24)
+    button_up, button_down = Button(16, hold_time=BUTTON_REPEAT_S, hold_repeat=True), Button(24, hold_time=BUTTON_REPEAT_S, hold_repeat=True)
     button_select, button_back = Button(5), Button(6)
 
 def init_display():
-    global disp, img, draw, font, font_tiny
+    global disp, img, draw, font, font_tiny, renderer, sprites
     try:
         disp = st7789.ST7789(width=240, height=240, rotation=90, port=0, cs=st7789.BG_SPI_CS_FRONT, dc=9, backlight=13, spi_speed_hz=40_000_000)
         disp.begin()
-        img = Image.new("RGB", (WIDTH, HEIGHT), (0, 0, 0))
-        draw = ImageDraw.Draw(img)
+        if FRAMEBUFFER_565: img = draw = Framebuffer565(WIDTH, HEIGHT)
+        else: img = Image.new("RGB", (WIDTH, HEIGHT), (0, 0, 0)); draw = ImageDraw.Draw(img)
         try: 
             font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 18)
             font_tiny = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 14)
         except: 
             font = ImageFont.load_default(); font_tiny = ImageFont.load_default()
+        renderer = RegionRenderer(disp, img, draw)
+        sprites = SpriteCache(img)
+        pacer.backlight = disp.set_backlight
     except: pass
 
 def init_fluidsynth_lazy():
@@ -151,7 +139,11 @@ def init_fluidsynth_lazy():
         try:
             fs = fluidsynth.Synth()
             fs.setting('synth.gain', volume_level)
+            fs.setting('synth.polyphony', PROFILES[POWER_PROFILE]["polyphony"])
+            if MIDI_NATIVE_ROUTE: route.prepare(fs)
             fs.start(driver="alsa")
+            if MIDI_NATIVE_ROUTE and route.src: route.connect()  # new synth, new sequencer client
+            metronome.attach(fs)
         except: pass
 
 def build_sf2_preset_map(path):
@@ -184,63 +176,75 @@ def select_first_presets_for_monkey():
         fs.program_change(f_ch, prog)
         channel_presets[f_ch] = mapping.get((0, prog), f"Preset {prog}") if ok else f"Preset {prog}"
 
-class SafeMidiIn:
-    def __init__(self):
-        self.midiin = rtmidi.MidiIn(); self.port_name = None; self.callback = None
-    def set_callback(self, cb):
-        self.callback = cb
-        if self.midiin.is_port_open(): self.midiin.set_callback(self._cb)
-    def _cb(self, msg, ts):
-        if self.callback: self.callback(msg, ts)
+class SafeMidiIn(PortManager):
+    # Choosing a port opens it next to the ones already open and remembers it; choosing an open one again closes and forgets it
     def open_port_by_name_async(self, name):
         def t():
-            ports = self.midiin.get_ports()
-            if name in ports:
-                if self.midiin.is_port_open(): self.midiin.close_port()
-                self.midiin.open_port(ports.index(name))
-                self.midiin.set_callback(self._cb); self.port_name = name
-                global MESSAGE, msg_start_time; MESSAGE = "Connected MIDI"; msg_start_time = time.time()
+            if name in self.ports:
+                port_watcher.forget(name); self.close(name); on_port_change("close", name)
+            else:
+                port_watcher.remember(name)
+                if self.open(name): on_port_change("open", name)
         threading.Thread(target=t, daemon=True).start()
-    def list_ports(self): return self.midiin.get_ports()
 
-def midi_callback(message_data, timestamp):
-    message, _ = message_data; status, ch = message[0] & 0xF0, message[0] & 0x0F
+def on_port_change(kind, name):
+    # kind: "open", "close" (from the menu) or "lost" (unplugged; port_watcher reopens it when it is back)
+    global MESSAGE, msg_start_time
+    if MIDI_NATIVE_ROUTE: route.connect(name) if kind == "open" else route.disconnect(name)
+    MESSAGE = {"open": "Connected MIDI", "close": "Closed MIDI", "lost": "MIDI unplugged"}[kind]
+    msg_start_time = time.time(); redraw.request()
+
+def midi_callback(message_data, timestamp=None):
+    # Events that do not come from an open port (energy_profile.py); ports push into their own ring
+    t_cb = time.perf_counter(); message, delta = message_data
+    midi_queue.push(message, t_cb, latency_probe.arrival(delta) if latency_probe else 0.0)
+    if latency_probe: latency_probe.callback(t_cb)
+
+def midi_dispatch(message, t_cb, lag, src=None):
+    # src: the InputPort it came from (None: pushed by energy_profile.py); a port FluidSynth reads itself is skipped
+    synth = None if src and route.routes(src.name) else fs
+    if not synth: return
+    status, ch = message[0] & 0xF0, message[0] & 0x0F
     n1, n2 = message[1] if len(message) > 1 else 0, message[2] if len(message) > 2 else 0
-    if recorder.recording:
-        if status == 0x90: recorder.add_event(mido.Message('note_on', channel=ch, note=n1, velocity=n2))
-        elif status == 0x80: recorder.add_event(mido.Message('note_off', channel=ch, note=n1, velocity=n2))
-        elif status == 0xB0: recorder.add_event(mido.Message('control_change', channel=ch, control=n1, value=n2))
-    global drum_overlay_shown, drum_overlay_start_time, keyboard_overlay_channel, keyboard_overlay_start_time
     if status == 0x90 and n2 > 0:
-        if fs: fs.noteon(ch, n1, n2)
-        if ch == 9: drum_overlay_shown, drum_overlay_start_time, keyboard_overlay_channel = True, time.time(), None
-        else: keyboard_overlay_channel, keyboard_overlay_start_time, drum_overlay_shown = ch, time.time(), False
-    elif status == 0x90 or status == 0x80: 
-        if fs: fs.noteoff(ch, n1)
-    elif status == 0xB0 and fs: fs.cc(ch, n1, n2)
-    elif status == 0xE0 and fs: fs.pitch_bend(ch, (n2 << 7) + n1 - 8192)
-    elif status == 0xC0 and fs: 
-        fs.program_change(ch, n1); channel_presets[ch] = f"Prog {n1}"
+        synth.noteon(ch, n1, n2)  # the queue records the latency
+    elif status == 0x90 or status == 0x80: synth.noteoff(ch, n1)
+    elif status == 0xB0: synth.cc(ch, n1, n2)
+    elif status == 0xE0: synth.pitch_bend(ch, (n2 << 7) + n1 - 8192)
+    elif status == 0xC0: synth.program_change(ch, n1)
+
+def midi_tap(batch):
+    global drum_overlay_shown, drum_overlay_start_time, keyboard_overlay_channel, keyboard_overlay_start_time
+    pacer.activity()
+    for message, t_cb, lag, src in batch:
+        status, ch = message[0] & 0xF0, message[0] & 0x0F
+        n1, n2 = message[1] if len(message) > 1 else 0, message[2] if len(message) > 2 else 0
+        if recorder.recording: recorder.add(message, t_cb - lag)  # arrival time, not when the batch drained
+        if status == 0x90 and n2 > 0:
+            if ch == 9: drum_overlay_shown, drum_overlay_start_time, keyboard_overlay_channel = True, time.time(), None
+            else: keyboard_overlay_channel, keyboard_overlay_start_time, drum_overlay_shown = ch, time.time(), False
+        elif status == 0xC0 and fs: channel_presets[ch] = f"Prog {n1}"
+
+midi_queue = MidiQueue(midi_dispatch, midi_tap)
 
 def scan_soundfonts():
     global soundfont_paths, soundfont_names
     p, l = [], []
     if os.path.isdir(soundfont_folder):
-        for f in os.listdir(soundfont_folder):
+        for f in sorted(os.listdir(soundfont_folder), key=sort_key):
             if f.endswith('.sf2'): p.append(os.path.join(soundfont_folder, f)); l.append(f.replace('.sf2', ''))
     soundfont_paths, soundfont_names = p, l
 
 def scan_midifiles():
-    global midi_paths, midi_names
-    p, l = [], []
-    if os.path.isdir(midi_file_folder):
-        m_files = sorted(os.listdir(midi_file_folder))
-        for f in m_files:
-            if f.endswith('.mid'): p.append(os.path.join(midi_file_folder, f)); l.append(f.replace('.mid', ''))
-    midi_paths, midi_names = p, l
-
-def handle_up():
-    global selectedindex, volume_level, rename_char_idx, channel_volumes, mixer_selected_ch, bpm, metro_vol, metro_adjusting
+    # The listing comes from the library index, no listdir here; the index thread calls it when files change
+    global midi_listing
+    midi_listing = library.listing
+
+library = MidiLibrary(midi_file_folder, os.path.join(directory, "midi_library.db"), on_change=scan_midifiles)  # opened by recover_recording()
+
+def handle_up(held=0.0):
+    # held: seconds a held button has been down (its repeats), 0 for a press
+    global selectedindex, volume_level, rename_char_idx, channel_volumes, mixer_selected_ch, bpm, metro_vol, metro_beats, metro_adjusting
     if operation_mode == "VOLUME":
         volume_level = min(1.0, volume_level + 0.05)
         if fs: fs.setting('synth.gain', volume_level)
@@ -254,14 +258,15 @@ def handle_up():
         else: mixer_selected_ch = max(0, mixer_selected_ch - 1)
     elif operation_mode == "METRONOME":
         if metro_adjusting:
-            if selectedindex == 1: bpm = min(240, bpm + 5)
-            elif selectedindex == 2: metro_vol = min(127, metro_vol + 5)
+            if selectedindex == 1: bpm = min(240, bpm + 5); transport.set_bpm(bpm)
+            elif selectedindex == 2: metro_vol = min(127, metro_vol + 5); metronome.velocity = metro_vol
+            elif selectedindex == 3: metro_beats = min(12, metro_beats + 1); transport.set_beats(metro_beats)
         else:
             selectedindex = max(0, selectedindex - 1)
-    else: selectedindex = max(0, selectedindex - 1)
+    else: browser.show(files); selectedindex = browser.move(selectedindex, -1, held)
 
-def handle_down():
-    global selectedindex, volume_level, rename_char_idx, channel_volumes, mixer_selected_ch, bpm, metro_vol, metro_adjusting
+def handle_down(held=0.0):
+    global selectedindex, volume_level, rename_char_idx, channel_volumes, mixer_selected_ch, bpm, metro_vol, metro_beats, metro_adjusting
     if operation_mode == "VOLUME":
         volume_level = max(0.0, volume_level - 0.05)
         if fs: fs.setting('synth.gain', volume_level)
@@ -275,11 +280,12 @@ def handle_down():
         else: mixer_selected_ch = min(9, mixer_selected_ch + 1)
     elif operation_mode == "METRONOME":
         if metro_adjusting:
-            if selectedindex == 1: bpm = max(40, bpm - 5)
-            elif selectedindex == 2: metro_vol = max(0, metro_vol - 5)
+            if selectedindex == 1: bpm = max(40, bpm - 5); transport.set_bpm(bpm)
+            elif selectedindex == 2: metro_vol = max(0, metro_vol - 5); metronome.velocity = metro_vol
+            elif selectedindex == 3: metro_beats = max(1, metro_beats - 1); transport.set_beats(metro_beats)
         else:
-            selectedindex = min(2, selectedindex + 1)
-    else: selectedindex = min(len(files) - 1, selectedindex + 1)
+            selectedindex = min(3, selectedindex + 1)
+    else: browser.show(files); selectedindex = browser.move(selectedindex, 1, held)
 
 def handle_back():
     global operation_mode, files, pathes, selectedindex, rename_string, mixer_adjusting, metro_adjusting
@@ -290,8 +296,8 @@ def handle_back():
         if len(rename_string) > 0: rename_string = rename_string[:-1]
         else: operation_mode = "FILE ACTION"; files = ["PLAY", "STOP", "RENAME", "DELETE", "BACK"]
     elif operation_mode == "FILE ACTION":
-        operation_mode = "MIDI FILE"; scan_midifiles(); files, pathes = midi_names.copy(), midi_paths.copy()
-    elif operation_mode in ["MIXER", "METRONOME", "VOLUME", "MIDI FILE", "SOUND FONT", "MIDI KEYBOARD"]:
+        operation_mode = "MIDI FILE"; scan_midifiles(); pathes, files = midi_listing
+    elif operation_mode in ["MIXER", "METRONOME", "VOLUME", "MIDI FILE", "SOUND FONT", "MIDI KEYBOARD", "STATS"]:
         operation_mode = "main screen"; files = MAIN_MENU.copy()
     else:
         operation_mode = "main screen"; files = MAIN_MENU.copy()
@@ -299,15 +305,18 @@ def handle_back():
 
 def handle_select():
     global operation_mode, files, pathes, selectedindex, MESSAGE, msg_start_time, fs, sfid
-    global rename_string, rename_char_idx, mixer_adjusting, metronome_on, selected_file_path, loaded_sf2_path, metro_adjusting
+    global rename_string, rename_char_idx, mixer_adjusting, metronome_on, selected_file_path, loaded_sf2_path, metro_adjusting, shutting_down
     
     if operation_mode == "MIXER": mixer_adjusting = not mixer_adjusting; return
     
     if operation_mode == "METRONOME":
-        if selectedindex == 0: metronome_on = not metronome_on
+        if selectedindex == 0:
+            metronome_on = not metronome_on
+            metronome.start() if metronome_on else metronome.stop()
         else: metro_adjusting = not metro_adjusting
         return
         
+    if operation_mode == "STATS": stats_select(files[selectedindex]); return
     if not files and operation_mode != "RENAME": return
     if operation_mode != "RENAME": sel = files[selectedindex]
     if operation_mode == "main screen":
@@ -318,31 +327,37 @@ def handle_select():
             else:
                 ts = datetime.datetime.now().strftime("%H%M%S")
                 path = os.path.join(midi_file_folder, f"rec_{ts}.mid")
-                recorder.stop(path); MESSAGE = "Saved Rec"; scan_midifiles()
+                recorder.stop(path, on_recording_saved); MESSAGE = "Saving..."
             msg_start_time = time.time(); return
         if sel == "VOLUME": operation_mode = "VOLUME"; return
         if sel == "POWER": toggle_power_mode(); return
+        if sel == "STATS": operation_mode = "STATS"; files = stats_rows(); selectedindex = 0; return
         operation_mode = sel
-        if sel == "SOUND FONT": scan_soundfonts(); files, pathes = soundfont_names.copy(), soundfont_paths.copy()
-        elif sel == "MIDI FILE": scan_midifiles(); files, pathes = midi_names.copy(), midi_paths.copy()
+        if sel == "SOUND FONT": scan_soundfonts(); files, pathes = soundfont_names, soundfont_paths
+        elif sel == "MIDI FILE": scan_midifiles(); pathes, files = midi_listing
         elif sel == "MIDI KEYBOARD": files = pathes = midi_manager.list_ports()
-        elif sel == "SHUTDOWN": shutting_down = True; update_display(); time.sleep(1); os.system("sudo poweroff"); return
+        elif sel == "SHUTDOWN":
+            shutting_down = True; redraw.request(); time.sleep(1)  # the render loop puts up the halt screen
+            os.system("sudo poweroff"); return
         selectedindex = 0
     elif operation_mode == "MIDI FILE":
         selected_file_path = pathes[selectedindex]; operation_mode = "FILE ACTION"
+        info = library.info(selected_file_path)
+        if info: d = int(info["duration"]); MESSAGE = f"{d // 60}:{d % 60:02d}  {info['bpm']:g} BPM"; msg_start_time = time.time()
         files = ["PLAY", "STOP", "RENAME", "DELETE", "BACK"]; selectedindex = 0
     elif operation_mode == "FILE ACTION":
         if sel == "PLAY": 
             if sfid is None: MESSAGE = "LOAD SF2 FIRST"
-            else: init_fluidsynth_lazy(); fs.play_midi_file(selected_file_path); MESSAGE = "Playing"
+            else: init_fluidsynth_lazy(); fs.play_midi_file(selected_file_path); transport.play_file(selected_file_path); MESSAGE = "Playing"
             msg_start_time = time.time()
         elif sel == "STOP":
-            if fs: fs.delete(); fs = None; init_fluidsynth_lazy()
+            if fs: metronome.attach(None); fs.delete(); fs = None; init_fluidsynth_lazy()
+            transport.stop_file()
             if loaded_sf2_path: sfid = fs.sfload(loaded_sf2_path, True); select_first_presets_for_monkey()
             MESSAGE = "Stopped"; msg_start_time = time.time()
         elif sel == "RENAME": operation_mode = "RENAME"; rename_string = os.path.basename(selected_file_path).replace(".mid", ""); rename_char_idx = 0
         elif sel == "DELETE":
-            try: os.remove(selected_file_path); MESSAGE = "Deleted"; scan_midifiles(); handle_back()
+            try: os.remove(selected_file_path); library.remove(selected_file_path); MESSAGE = "Deleted"; scan_midifiles(); handle_back()
             except: MESSAGE = "Error"
             msg_start_time = time.time()
         elif sel == "BACK": handle_back()
@@ -350,7 +365,7 @@ def handle_select():
         char = rename_chars[rename_char_idx]
         if char == "OK":
             new_path = os.path.join(midi_file_folder, rename_string.strip() + ".mid")
-            try: os.rename(selected_file_path, new_path); MESSAGE = "Renamed"
+            try: os.rename(selected_file_path, new_path); library.rename(selected_file_path, new_path); MESSAGE = "Renamed"
             except: MESSAGE = "Error"
             operation_mode = "FILE ACTION"; files = ["PLAY", "STOP", "RENAME", "DELETE", "BACK"]
         else: rename_string += char
@@ -361,43 +376,84 @@ def handle_select():
         elif operation_mode == "MIDI KEYBOARD": midi_manager.open_port_by_name_async(pathes[selectedindex])
         msg_start_time = time.time(); handle_back()
 
+# ---------------------- LATENCY STATS ----------------------
+# STATS screen: note-on latency per stage (ms), then the probe controls
+def stats_rows():
+    st = latency_probe.stages() if latency_probe else {}
+    rows = ["stage  p50   p99   max"]
+    for name in LatencyProbe.STAGES:
+        r = st.get(name)
+        rows.append(f"{name[:5]:<5} {r['p50']:4.1f} {r['p99']:5.1f} {r['max']:5.1f}" if r else f"{name[:5]:<5}   --")
+    j = metronome.jitter.summary()  # time between clicks vs the beat period
+    rows.append(f"click {j['p50']:4.1f} {j['p99']:5.1f} {j['max']:5.1f}" if j else "click   --")
+    return rows + [f"PROBE: {'ON' if LatencyProbe.enabled else 'OFF'}", "DUMP", "RESET"]
+
+def stats_select(sel):
+    global files, MESSAGE, msg_start_time
+    if sel.startswith("PROBE"): LatencyProbe.enabled = not LatencyProbe.enabled
+    elif sel == "DUMP" and latency_probe: MESSAGE = "Dumped" if latency_probe.dump(LATENCY_DUMP) else "Dump failed"; msg_start_time = time.time()
+    elif sel == "RESET" and latency_probe: latency_probe.reset(); metronome.jitter.reset(); metronome.error.reset()
+    files = stats_rows()
+
+# ---------------------- POWER PROFILES ----------------------
+# Cycles MAX -> ECO -> GIG; the OS writes happen off the button thread
 def toggle_power_mode():
-    global LOW_POWER_MODE, MESSAGE, msg_start_time
-    LOW_POWER_MODE = not LOW_POWER_MODE
-    if LOW_POWER_MODE:
-        os.system("sudo tvservice -o > /dev/null 2>&1")
-        os.system("sudo rfkill block wifi")
-        MESSAGE = "Lean: ON (No WiFi)"
-    else:
-        os.system("sudo tvservice -p > /dev/null 2>&1")
-        os.system("sudo rfkill unblock wifi")
-        MESSAGE = "Lean: OFF (WiFi On)"
-    msg_start_time = time.time()
+    global MESSAGE, msg_start_time
+    names = list(PROFILES); name = names[(names.index(power.target or POWER_PROFILE) + 1) % len(names)]
+    MESSAGE = f"Power: {name}..."; msg_start_time = time.time()
+    power.apply(name, on_power_applied)
+
+def on_power_applied(name, failed):
+    # Everything in-process switches together once the OS side is done
+    global POWER_PROFILE, LOW_POWER_MODE, MESSAGE, msg_start_time
+    prof = PROFILES[name]
+    POWER_PROFILE, LOW_POWER_MODE = name, prof["low_power"]
+    if fs: fs.setting('synth.polyphony', prof["polyphony"])
+    ups.set_mode(name)
+    MESSAGE = f"Power: {name}" if not failed else f"{name}: {len(failed)} failed"
+    msg_start_time = time.time(); redraw.request()
 
 # ---------------------- DISPLAY ENGINE ----------------------
+# Returns how long until the next frame is needed (None = wait for a request)
 def update_display():
-    global _last_display_time, draw, img, MESSAGE, operation_mode
-    if draw is None: return
+    global files, file_bpm
+    if renderer is None: return None
+    if not in_render_process:
+        if operation_mode == "STATS": files = stats_rows()
+        if operation_mode == "METRONOME": file_bpm = transport.file_bpm()
+    if shutting_down:
+        def d_halt():
+            draw.rectangle((0, 0, 240, 240), fill=(0, 0, 0))
+            sprites.text((45, 100), "SYSTEM HALT", font, (255, 0, 0), (0, 0, 0))
+            sprites.text((35, 140), "SAFE TO UNPLUG", font_tiny, (255, 255, 255), (0, 0, 0))
+        renderer.render([("halt", (0, 0, 240, 240), True, d_halt)])
+        return None
     now = time.time()
-    if now - _last_display_time < (0.15 if LOW_POWER_MODE else 0.06): return
-    _last_display_time = now
+    pacer.active_s, pacer.blank_after = PROFILES[POWER_PROFILE]["frame_s"], BLANK_AFTER_S / 2 if LOW_POWER_MODE else BLANK_AFTER_S
+    wait = pacer.due(now, animating=metronome_on and operation_mode == "METRONOME")
+    if wait != 0: return wait
+    wake = None
 
     accent = (255, 255, 0) if LOW_POWER_MODE else (255, 255, 255)
     header_fill = (60, 60, 0) if LOW_POWER_MODE else (30, 30, 30)
     title_fill = (90, 90, 0) if LOW_POWER_MODE else (50, 50, 50)
-
-    draw.rectangle((0, 0, WIDTH, HEIGHT), fill=(0, 0, 0))
+    regions = []
 
     # Header
-    draw.rectangle((0, 0, 240, 26), fill=header_fill)
-    draw.text((10, 4), f"TIME: {ups.get_time_left()}", font=font_tiny, fill=accent)
-    pct = ups.get_percentage_raw(); draw.rectangle((195, 5, 230, 19), outline=accent, width=2)
-    if pct > 0: draw.rectangle((197, 7, 197 + int(31*(pct/100)), 17), fill=(0,255,0))
+    time_left, pct = ups.get_time_left(), ups.get_percentage_raw()
+    def d_header():
+        draw.rectangle((0, 0, 239, 25), fill=header_fill)
+        sprites.text((10, 4), f"TIME: {time_left}", font_tiny, accent, header_fill)
+        draw.rectangle((195, 5, 230, 19), outline=accent, width=2)
+        if pct > 0: draw.rectangle((197, 7, 197 + int(31*(pct/100)), 17), fill=(0,255,0))
+    regions.append(("header", (0, 0, 240, 26), (time_left, pct, accent, header_fill), d_header))
 
     # Title
     title_text = "● RECORDING" if recorder.recording else operation_mode.upper()
-    draw.rectangle((0, 26, 240, 56), fill=title_fill)
-    draw.text((10, 31), title_text, font=font, fill=(255,0,0) if recorder.recording else accent)
+    def d_title():
+        draw.rectangle((0, 26, 239, 55), fill=title_fill)
+        sprites.text((10, 31), title_text, font, (255,0,0) if recorder.recording else accent, title_fill)
+    regions.append(("title", (0, 26, 240, 56), (title_text, accent, title_fill), d_title))
 
     if operation_mode == "MIXER":
         for i in range(10):
@@ -405,66 +461,129 @@ def update_display():
             f_ch = get_internal_channel(i); vol = channel_volumes[f_ch]
             name = channel_presets.get(f_ch, f"CH {i+1}")[:12]
             color = accent if i == mixer_selected_ch else (200, 200, 200)
-            if i == mixer_selected_ch and mixer_adjusting: draw.rectangle((5, y, 235, y+16), outline=(0, 255, 0))
-            draw.text((10, y), f"{i}: {name}", font=font_tiny, fill=color)
-            draw.rectangle((150, y+4, 150 + int(vol/1.6), y+12), fill=color)
+            boxed = i == mixer_selected_ch and mixer_adjusting
+            def d_mix(y=y, i=i, name=name, vol=vol, color=color, boxed=boxed):
+                sprites.text((10, y), f"{i}: {name}", font_tiny, color)
+                draw.rectangle((150, y+4, 150 + int(vol/1.6), y+12), fill=color)
+                if boxed: draw.rectangle((5, y, 235, y+16), outline=(0, 255, 0))
+            regions.append((f"mix{i}", (0, y, 240, y + 18), (name, vol, color, boxed), d_mix))
 
     elif operation_mode == "METRONOME":
-        opts = [f"STATUS: {'ON' if metronome_on else 'OFF'}", f"SPEED: {bpm} BPM", f"CLICK VOL: {metro_vol}"]
+        opts = [f"STATUS: {'ON' if metronome_on else 'OFF'}", f"SPEED: {file_bpm} BPM FILE" if file_bpm else f"SPEED: {bpm} BPM", f"CLICK VOL: {metro_vol}", f"METER: {metro_beats}/4"]
         for i, opt in enumerate(opts):
             y = 80 + (i * 40)
             color = accent if i == selectedindex else (200, 200, 200)
             # If adjusting a value, show a green box (like mixer)
-            if i == selectedindex:
-                box_color = (0, 255, 0) if metro_adjusting else color
-                draw.rectangle([10, y-5, WIDTH-10, y+25], outline=box_color, width=2)
-            draw.text((20, y), opt, font=font, fill=color)
-        if metronome_on:
-            draw.ellipse((200, 35, 215, 50), fill=(0, 255, 0) if (time.time() % (60/bpm) < 0.1) else (50, 0, 0))
+            box_color = ((0, 255, 0) if metro_adjusting else color) if i == selectedindex else None
+            def d_opt(y=y, opt=opt, color=color, box_color=box_color):
+                sprites.text((20, y), opt, font, color)
+                if box_color: draw.rectangle([10, y-5, WIDTH-10, y+25], outline=box_color, width=2)
+            regions.append((f"opt{i}", (0, y - 5, 240, y + 26), (opt, color, box_color), d_opt))
+        pos = metronome.position() if metronome_on else None
+        if pos:
+            beat, phase, period = pos; lit = phase < 0.1; fill = ((255, 255, 0) if beat == 0 else (0, 255, 0)) if lit else (50, 0, 0)
+            wake = (0.1 - phase) if lit else (period - phase)  # the grid's period: a playing file's tempo, not the METRONOME setting
+            regions.append(("blink", (200, 35, 216, 51), fill, lambda: draw.ellipse((200, 35, 215, 50), fill=fill)))
 
     elif operation_mode == "RENAME":
-        draw.text((10, 100), rename_string + "_", font=font, fill=(0, 255, 0))
+        regions.append(("rename", (0, 98, 240, 126), rename_string,
+                        lambda: sprites.text((10, 100), rename_string + "_", font, (0, 255, 0))))
         char_curr = rename_chars[rename_char_idx]
-        draw.rectangle((95 if char_curr=="OK" else 105, 145, 155 if char_curr=="OK" else 145, 180), fill=accent)
-        draw.text((105 if char_curr=="OK" else 118, 150), char_curr, font=font, fill=(0,0,0))
+        def d_char():
+            draw.rectangle((95 if char_curr=="OK" else 105, 145, 155 if char_curr=="OK" else 145, 180), fill=accent)
+            sprites.text((105 if char_curr=="OK" else 118, 150), char_curr, font, (0,0,0), accent)
+        regions.append(("char", (0, 145, 240, 181), (char_curr, accent), d_char))
 
     elif operation_mode == "VOLUME":
-        draw.rectangle((30, 130, 210, 160), outline=accent, width=2)
-        v_w = int(176 * volume_level)
-        if v_w > 0: draw.rectangle((32, 132, 32 + v_w, 158), fill=(0, 255, 0))
+        def d_vol():
+            draw.rectangle((30, 130, 210, 160), outline=accent, width=2)
+            v_w = int(176 * volume_level)
+            if v_w > 0: draw.rectangle((32, 132, 32 + v_w, 158), fill=(0, 255, 0))
+        regions.append(("volume", (0, 130, 240, 161), (volume_level, accent), d_vol))
 
     else:
-        view_size = 5
-        start_idx = max(0, min(selectedindex - 2, len(files) - view_size))
-        for i, line in enumerate(files[start_idx:start_idx+view_size], start=start_idx):
+        browser.show(files); start_idx, rows = browser.window(selectedindex)
+        for i, line in enumerate(rows, start=start_idx):
             y = 62 + (i - start_idx) * 28
-            if i == selectedindex: 
-                draw.rectangle([10, y, WIDTH-10, y+26], fill=accent)
-                draw.text((15, y+2), line[:22], font=font, fill=(0,0,0))
-            else:
-                draw.text((15, y+2), line[:22], font=font, fill=accent)
-
+            selected = i == selectedindex
+            def d_row(y=y, line=line, selected=selected):
+                if selected:
+                    draw.rectangle([10, y, WIDTH-10, y+26], fill=accent)
+                    sprites.text((15, y+2), line[:22], font, (0,0,0), accent, clip=(10, y, WIDTH-9, y+27))
+                else:
+                    sprites.text((15, y+2), line[:22], font, accent)
+            regions.append((f"row{i - start_idx}", (0, y, 240, y + 28), (line[:22], selected, accent), d_row))
+
+    if operation_mode == "STATS": wake = 1.0 if wake is None else min(wake, 1.0)
     if MESSAGE and now - msg_start_time < 2.0:
-        draw.rectangle((20, 100, 220, 140), fill=(200, 0, 0)); draw.text((35, 110), MESSAGE, font=font, fill=(255, 255, 255))
-    
-    try: disp.display(img)
-    except: pass
+        def d_msg():
+            draw.rectangle((20, 100, 220, 140), fill=(200, 0, 0)); sprites.text((35, 110), MESSAGE, font, (255, 255, 255), (200, 0, 0), clip=(20, 100, 221, 141))
+        regions.append(("message", (20, 100, 221, 141), MESSAGE, d_msg))
+        wake = msg_start_time + 2.0 - now if wake is None else min(wake, msg_start_time + 2.0 - now)
+
+    renderer.render(regions)
+    return pacer.done(wake, now)
+
+# ---------------------- RENDER PROCESS ----------------------
+def list_window():
+    # Only the visible rows go to the render process, whatever the length of the list
+    browser.show(stats_rows() if operation_mode == "STATS" else files); return browser.window(selectedindex)
+
+# Everything update_display() reads, copied so in-place edits show up as changes
+def ui_snapshot():
+    return {
+        "MESSAGE": MESSAGE, "msg_start_time": msg_start_time, "list_window": list_window(), "selectedindex": selectedindex,
+        "operation_mode": operation_mode, "shutting_down": shutting_down, "LOW_POWER_MODE": LOW_POWER_MODE, "POWER_PROFILE": POWER_PROFILE, "recording": recorder.recording,
+        "channel_presets": dict(channel_presets), "channel_volumes": dict(channel_volumes),
+        "mixer_selected_ch": mixer_selected_ch, "mixer_adjusting": mixer_adjusting,
+        "metronome_on": metronome_on, "bpm": bpm, "metro_vol": metro_vol, "metro_beats": metro_beats, "metro_adjusting": metro_adjusting, "metro_grid": metronome.grid, "file_bpm": transport.file_bpm(),
+        "rename_string": rename_string, "rename_char_idx": rename_char_idx, "volume_level": volume_level,
+        "activity": pacer.last, "ups": (ups.minutes_left, ups.percent),
+    }
+
+def _render_init():
+    global in_render_process; in_render_process = True
+    lazy_imports(); init_display()
+
+def _render_frame(changes):
+    if "activity" in changes: pacer.last = changes.pop("activity")
+    if "ups" in changes: ups.minutes_left, ups.percent = changes.pop("ups")
+    if "metro_grid" in changes: metronome.grid = changes.pop("metro_grid")
+    if "list_window" in changes: browser.fixed = changes.pop("list_window")
+    if "recording" in changes: recorder.recording = changes.pop("recording")
+    globals().update(changes)
+    return update_display()
 
 def background_init():
+    global latency_probe
     try:
-        os.system("sudo rfkill unblock wifi")
-        os.system("sudo tvservice -p > /dev/null 2>&1")
-        lazy_imports(); init_buttons(); init_display()
+        power.apply(POWER_PROFILE)  # Wi-Fi and HDMI on at boot
+        lazy_imports(); init_buttons()
+        if not RENDER_PROCESS: init_display()
+        latency_probe = LatencyProbe(); midi_queue.probe = latency_probe
+        ups.start(UPS_SAMPLE_S, redraw.request)
         threading.Thread(target=scan_soundfonts, daemon=True).start()
-        threading.Thread(target=scan_midifiles, daemon=True).start()
-        button_up.when_pressed, button_down.when_pressed = handle_up, handle_down
-        button_select.when_pressed, button_back.when_pressed = handle_select, handle_back
-        global midi_manager; midi_manager = SafeMidiIn(); midi_manager.set_callback(midi_callback)
+        threading.Thread(target=recover_recording, daemon=True).start()
+        button_up.when_pressed, button_down.when_pressed = pacer.wrap(handle_up), pacer.wrap(handle_down)
+        button_up.when_held = pacer.wrap(lambda: handle_up(button_up.active_time or 0.0))
+        button_down.when_held = pacer.wrap(lambda: handle_down(button_down.active_time or 0.0))
+        button_select.when_pressed, button_back.when_pressed = pacer.wrap(handle_select), pacer.wrap(handle_back)
+        global midi_manager; midi_manager = SafeMidiIn(rtmidi, midi_queue, MIDI_PORT_CONFIG, probe=latency_probe, window_s=MIDI_THIN_S, drop=(0xA0, 0xD0) if MIDI_DROP_AFTERTOUCH else ())
+        global port_watcher; port_watcher = PortWatcher(midi_manager, os.path.join(directory, "midi_ports.json"), on_port_change); port_watcher.start()
+        if MIDI_CLOCK_OUT: clock_out.open(rtmidi, MIDI_CLOCK_OUT)
     except: pass
+    redraw.request()
 
 def main():
+    global render_proc
+    # Fork before any other thread exists (the metronome thread only sleeps until fs is set)
+    if RENDER_PROCESS: render_proc = RenderProcess(_render_init, _render_frame)
     threading.Thread(target=background_init, daemon=True).start()
-    while True: time.sleep(0.05); update_display()
+    next_frame = None
+    while True:
+        redraw.wait(next_frame)
+        if render_proc: render_proc.send(ui_snapshot()); next_frame = 1.0 if operation_mode == "STATS" else None
+        else: next_frame = latency_probe.frame(update_display) if latency_probe else update_display()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# Note latency probe for the rtmidi -> FluidSynth path
+# Shared by the fast_boot_monkey_midi*.py variants
+#
+#   python3 latency_stats.py --bench   cost of the instrumentation per event
+
+import sys, time, threading
+from array import array
+
+# Per-event cost of arrival() + callback() + dispatched() with a parent probe on
+# a Pi Zero 2 W (2.5 % of a core at 1000 notes/s); LatencyProbe.enabled = False
+# brings it down to three attribute checks.
+OVERHEAD_BUDGET_US = 25.0
+
+# ---------------------- ARRIVAL CLOCK ----------------------
+class ArrivalClock:
+    # rtmidi hands the callback (message, delta): the time since the previous message, taken
+    # from ALSA when the event arrived. Summing those deltas gives arrival
+    # times on the driver clock. The smallest (callback time - arrival time)
+    # seen counts as zero delay; anything above it is time the event spent
+    # waiting for the Python callback to run. The floor creeps up slowly so
+    # clock drift between ALSA and perf_counter cannot accumulate.
+    DRIFT = 20e-6  # s per s
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.arrival = None; self.offset = None; self.last = 0.0
+
+    def delay(self, delta, now):
+        if self.arrival is None: self.arrival = now
+        else: self.arrival += delta
+        d = now - self.arrival
+        if self.offset is None or d < self.offset: self.offset = d
+        else: self.offset += (now - self.last) * self.DRIFT
+        self.last = now
+        return d - self.offset
+
+# ---------------------- HISTOGRAM ----------------------
+class Histogram:
+    # HDR-style log-linear buckets over microseconds: exact below 32 us, then
+    # 16 buckets per power of two (at most ~6 % wide) up to ~16 s. Recording
+    # is one int conversion, a bit_length and an array increment.
+    SUB = 16; LIMIT_US = 1 << 24
+    SIZE = 2 * SUB + (24 - 5) * SUB
+
+    def __init__(self):
+        self.counts = array('I', bytes(4 * self.SIZE))
+        self.n = 0; self.max = 0.0
+
+    @classmethod
+    def index(cls, us):
+        if us < 2 * cls.SUB: return us
+        if us >= cls.LIMIT_US: return cls.SIZE - 1
+        shift = us.bit_length() - 5
+        return 2 * cls.SUB + (shift - 1) * cls.SUB + (us >> shift) - cls.SUB
+
+    @classmethod
+    def upper_us(cls, i):
+        # Largest value that lands in bucket i
+        if i < 2 * cls.SUB: return i
+        shift = (i - 2 * cls.SUB) // cls.SUB + 1
+        return ((((i - 2 * cls.SUB) % cls.SUB + cls.SUB) + 1) << shift) - 1
+
+    def record(self, s, i=None):
+        # i: bucket index when the caller already has it (one value going into several histograms)
+        if i is None: i = self.index(max(0, int(s * 1e6)))
+        self.counts[i] += 1; self.n += 1
+        if s > self.max: self.max = s
+
+    def percentile(self, p):
+        # Seconds; upper bucket edge, so never below the true value
+        if not self.n: return 0.0
+        target = max(1, int(self.n * p / 100.0 + 0.5)); seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target: return min(self.upper_us(i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        if not self.n: return None
+        return {"n": self.n, "p50": self.percentile(50) * 1000, "p99": self.percentile(99) * 1000, "max": self.max * 1000}
+
+    def reset(self):
+        for i in range(self.SIZE): self.counts[i] = 0
+        self.n = 0; self.max = 0.0
+
+# ---------------------- LATENCY PROBE ----------------------
+class LatencyProbe:
+    # Always-on latency histograms for note-ons, per stage:
+    #   wait      ALSA arrival -> rtmidi callback entry (estimated, see ArrivalClock)
+    #   callback  time spent inside the rtmidi callback (every message)
+    #   queue     callback entry -> synth dispatch done
+    #   total     ALSA arrival -> synth dispatch done
+    #   drawing   total, for notes dispatched while this process drew a frame
+    # A probe with a parent also records into it, so per-port probes add up
+    # to one overall probe. LatencyProbe.enabled switches every probe off.
+    STAGES = ("wait", "callback", "queue", "total", "drawing")
+    enabled = True
+
+    def __init__(self, name="note", report_s=30.0, parent=None):
+        self.name = name; self.parent = parent
+        self.hist = {s: Histogram() for s in self.STAGES}
+        self.clock = ArrivalClock(); self.drawing = False
+        if report_s: threading.Thread(target=self._report_loop, args=(report_s,), daemon=True).start()
+
+    def arrival(self, delta):
+        # Call first thing in the rtmidi callback; returns the delay so far
+        if not LatencyProbe.enabled: return 0.0
+        return self.clock.delay(delta, time.perf_counter())
+
+    def callback(self, t_cb):
+        # Call last thing in the rtmidi callback
+        if not LatencyProbe.enabled: return
+        dt = time.perf_counter() - t_cb; i = Histogram.index(max(0, int(dt * 1e6))); p = self
+        while p: p.hist["callback"].record(dt, i); p = p.parent
+
+    def dispatched(self, t_cb, lag):
+        # t_cb: perf_counter at callback entry, lag: value arrival() returned
+        if not LatencyProbe.enabled: return
+        q = time.perf_counter() - t_cb; total = lag + q; p = self
+        index = Histogram.index
+        iw, iq, it = index(max(0, int(lag * 1e6))), index(max(0, int(q * 1e6))), index(max(0, int(total * 1e6)))
+        while p:
+            h = p.hist
+            h["wait"].record(lag, iw); h["queue"].record(q, iq); h["total"].record(total, it)
+            if p.drawing: h["drawing"].record(total, it)
+            p = p.parent
+
+    def frame(self, fn):
+        # Runs a display frame with the drawing flag set; returns what fn returns
+        self.drawing = True
+        try: return fn()
+        finally: self.drawing = False
+
+    @property
+    def n(self):
+        return self.hist["total"].n
+
+    def summary(self):
+        return self.hist["total"].summary()
+
+    def stages(self):
+        return {s: self.hist[s].summary() for s in self.STAGES}
+
+    def reset(self):
+        for h in self.hist.values(): h.reset()
+        self.clock.reset()
+
+    def dump(self, path):
+        # Text dump: per stage summary, then the non-empty buckets (upper edge in us, count)
+        try:
+            with open(path, "w") as f:
+                f.write(f"# {self.name} latency, {time.strftime('%Y-%m-%d %H:%M:%S')}, probe {'on' if LatencyProbe.enabled else 'off'}\n")
+                for s in self.STAGES:
+                    h = self.hist[s]; r = h.summary()
+                    if not r: f.write(f"{s}: no samples\n"); continue
+                    f.write(f"{s}: n {r['n']}  p50 {r['p50']:.3f} ms  p99 {r['p99']:.3f} ms  max {r['max']:.3f} ms\n")
+                    f.write("  " + " ".join(f"{Histogram.upper_us(i)}:{c}" for i, c in enumerate(h.counts) if c) + "\n")
+            return True
+        except: return False
+
+    def _report_loop(self, every):
+        seen = 0
+        while True:
+            time.sleep(every)
+            if self.n == seen: continue
+            seen = self.n; r = self.summary()
+            line = f"{self.name} latency ms: p50 {r['p50']:.2f}  p99 {r['p99']:.2f}  max {r['max']:.2f}  ({r['n']} events)"
+            d = self.hist["drawing"].summary()
+            if d: line += f"  while drawing p99 {d['p99']:.2f}"
+            print(line)
+
+# ---------------------- BENCHMARK ----------------------
+def _bench(events=200000):
+    parent = LatencyProbe("all", report_s=0); probe = LatencyProbe("port", report_s=0, parent=parent)
+    def run():
+        t0 = time.perf_counter()
+        for i in range(events):
+            t_cb = time.perf_counter(); lag = probe.arrival(0.001)
+            probe.callback(t_cb); probe.dispatched(t_cb, lag)
+        return (time.perf_counter() - t0) / events
+    base_t0 = time.perf_counter()
+    for i in range(events): t_cb = time.perf_counter()
+    base = (time.perf_counter() - base_t0) / events
+    on = run() - base; LatencyProbe.enabled = False; off = run() - base; LatencyProbe.enabled = True
+    print(f"per event: {on * 1e6:.2f} us on, {off * 1e6:.2f} us off (budget {OVERHEAD_BUDGET_US:.0f} us) {'OK' if on * 1e6 <= OVERHEAD_BUDGET_US else 'OVER BUDGET'}")
+    h = Histogram()
+    for us in (5, 40, 100, 1000, 2500, 15000): h.record(us / 1e6)
+    print("bucket check:", [(us, Histogram.upper_us(Histogram.index(us))) for us in (5, 40, 100, 1000, 2500, 15000)])
+
+if __name__ == '__main__':
+    if "--bench" in sys.argv: _bench()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# List navigation for the menus of the fast_boot variants
+# A ListView keeps no copy of the list it shows (library listings are
+# replaced, never edited) and builds a first-letter index once per list, not
+# per press. Only the rows in its window are drawn, or sent to the render
+# process, so a press costs the same with 20 songs or 5000. A held button
+# repeats faster the longer it is held, then moves one initial at a time.
+#
+#   python3 list_view.py [ROWS]   times presses, held repeats and windows on a long list
+
+import sys, time
+from bisect import bisect_right
+
+def initial(name):
+    c = name[:1].upper()
+    return c if c.isalpha() else "#"
+
+def sort_key(name):
+    # Order the library and soundfont lists are kept in, so each initial is one run of rows
+    return name.casefold()
+
+class ListView:
+    SIZE = 5  # visible rows
+    ACCEL = ((1.5, 1), (3.0, 5))  # held under s: rows per repeat; held longer: one initial per repeat
+
+    def __init__(self, size=SIZE):
+        self.size = size; self.rows = None
+        self.starts = []; self.initials = []  # first row of each run of names with the same initial
+        self.fixed = None  # (first row, visible rows) from the snapshot, in the render process
+
+    def show(self, rows):
+        if rows is self.rows: return
+        self.rows = rows; self.starts = []; self.initials = []
+        for i, name in enumerate(rows):
+            c = initial(name)
+            if not self.initials or c != self.initials[-1]: self.starts.append(i); self.initials.append(c)
+
+    def window(self, sel):
+        # (first visible row, the visible rows), the selection kept in the middle
+        if self.fixed: return self.fixed
+        s = max(0, min(sel - self.size // 2, len(self.rows) - self.size))
+        return s, tuple(self.rows[s:s + self.size])
+
+    def initial_at(self, sel):
+        k = bisect_right(self.starts, sel) - 1
+        return self.initials[k] if k >= 0 else ""
+
+    def move(self, sel, step, held=0.0):
+        # Selection after a press (held 0) or a repeat of a held button (held: seconds it has been down)
+        n = len(self.rows)
+        if not n: return 0
+        for limit, rows in self.ACCEL:
+            if held < limit: return max(0, min(n - 1, sel + step * rows))
+        k = bisect_right(self.starts, sel) - 1
+        if step > 0: return self.starts[k + 1] if k + 1 < len(self.starts) else n - 1
+        return self.starts[k] if sel > self.starts[k] else self.starts[max(0, k - 1)]
+
+# ---------------------- BENCHMARK ----------------------
+def _bench(n=5000):
+    import random
+    names = sorted(("".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_") for _ in range(random.randint(3, 20))) for _ in range(n)), key=sort_key)
+    v = ListView(); t0 = time.perf_counter(); v.show(names); t_index = time.perf_counter() - t0
+    t0 = time.perf_counter(); sel = 0
+    for _ in range(10000): sel = v.move(sel, 1); v.window(sel)
+    t_press = (time.perf_counter() - t0) / 10000
+    presses = 0; sel = 0; held = 0.0; target = int(n * 0.8)
+    while sel < target:
+        nxt = v.move(sel, 1, held)
+        if nxt > target: break
+        sel = nxt; presses += 1; held += 0.25
+    print(f"{n} rows: index {t_index * 1000:.1f} ms, press + window {t_press * 1e6:.1f} us, row {target} after {presses} held repeats ({held:.1f} s), {target - sel} rows into its initial")
+
+if __name__ == '__main__':
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Metronome shared by the fast_boot variants
+# Clicks fall on the beats of the shared Transport, so wake-up latency and
+# the time fs.noteon takes never add up from beat to beat. With pyfluidsynth's
+# Sequencer the clicks are queued LOOKAHEAD_S ahead into FluidSynth's own
+# sequencer, which runs off the synth's sample clock; without it the thread
+# sleeps to each deadline and plays the click itself.
+#
+#   python3 metronome.py --bench SF2 [BPM]   renders clicks and measures the onsets
+
+import sys, time, threading
+from latency_stats import Histogram
+from transport import Transport
+
+class Metronome:
+    LOOKAHEAD_S = 0.3  # how far ahead clicks are queued into the sequencer
+    WAKE_S = 0.1
+    TIME_SCALE = 10000  # sequencer ticks per second
+
+    def __init__(self, transport=None, channel=9, note=77, accent_note=76, velocity=100, click_s=0.05, report_s=30.0):
+        # GM drums: 76 high wood block on beat 1, 77 low wood block on the others
+        self.transport = transport or Transport()
+        self.channel = channel; self.note = note; self.accent_note = accent_note
+        self.velocity = velocity; self.click_s = click_s; self.on = False
+        self.fs = None; self.seq = None; self.dest = None
+        self.beat = 0.0; self.gen = None; self.offset = 0.0  # next beat on the transport, its timeline, click clock - perf_counter
+        self.last = None; self.off = None; self.off_note = note
+        self.grid = None  # (perf_counter of a beat, period, beats, beat in bar) for the display
+        self.error = Histogram()  # how late a click went out (sequencer: how late it was queued)
+        self.jitter = Histogram()  # |time between two clicks - beat length at that point|
+        self._cv = threading.Condition()
+        self.transport.listeners.append(self._changed)
+        threading.Thread(target=self._run, daemon=True).start()
+        if report_s: threading.Thread(target=self._report_loop, args=(report_s,), daemon=True).start()
+
+    def attach(self, fs):
+        # New synth (or None before fs.delete()): the sequencer belongs to the synth it feeds
+        with self._cv:
+            if self.seq:
+                try: self.seq.delete()
+                except: pass
+            self.fs = fs; self.seq = None; self.gen = None
+            if fs:
+                try:
+                    import fluidsynth
+                    self.seq = fluidsynth.Sequencer(time_scale=self.TIME_SCALE, use_system_timer=False)
+                    self.dest = self.seq.register_fluidsynth(fs)
+                except Exception as e: print("metronome: no FluidSynth sequencer, timing clicks from a thread:", e); self.seq = None
+            self._cv.notify()
+
+    def _clock(self):
+        return self.seq.get_tick() / self.TIME_SCALE if self.seq else time.perf_counter()
+
+    def _changed(self):
+        with self._cv: self._cv.notify()
+
+    def _sync(self, now):
+        # Transport timeline changed (tempo, meter, file): carry on from the next beat of the new grid,
+        # at least half a beat after the last click, which may already be queued.
+        # The sequencer clock only moves once per audio block, so the offset is sampled here and kept.
+        tr = self.transport; self.gen = tr.gen; b = tr.beat_at()
+        if self.on and self.last is not None: b = max(b, self.beat - 0.5)
+        self.offset = now - time.perf_counter(); self.beat = tr.grid_beat(b); self.last = None
+
+    def start(self):
+        with self._cv:
+            self.on = True; self.gen = None; self.last = None; self._cv.notify()
+
+    def stop(self):
+        # Clicks already queued (at most LOOKAHEAD_S) still sound
+        with self._cv:
+            self.on = False; self.grid = None; self._cv.notify()
+
+    def position(self, now=None):
+        # (beat in bar from 0, seconds since that beat, seconds per beat) from the grid, or None when off
+        g = self.grid
+        if not g: return None
+        t, period, beats, b = g; d = (time.perf_counter() if now is None else now) - t
+        i = int(d // period)
+        return (b + i) % beats, d - i * period, period
+
+    def _run(self):
+        tr = self.transport
+        while True:
+            with self._cv:
+                while not (self.on and self.fs): self._cv.wait()
+                now = self._clock()
+                if self.off and now >= self.off:
+                    try: self.fs.noteoff(self.channel, self.off_note)
+                    except: pass
+                    self.off = None
+                if self.gen != tr.gen: self._sync(now)
+                due = tr.time_at(self.beat) + self.offset; horizon = now + self.LOOKAHEAD_S if self.seq else now
+                if due > horizon:
+                    self._cv.wait(min(self.WAKE_S, due - horizon, self.off - now if self.off else self.WAKE_S)); continue
+                b = self.beat; self.beat += 1
+                self._click(due, tr.beat_in_bar(b), now, tr.time_at(b) - tr.time_at(b - 1))
+
+    def _click(self, due, beat, now, period):
+        note = self.accent_note if beat == 0 else self.note
+        vel = min(127, self.velocity + 20) if beat == 0 else self.velocity
+        try:
+            if self.seq:
+                tick = int(round(due * self.TIME_SCALE))
+                self.seq.note(tick, self.channel, note, vel, int(self.click_s * self.TIME_SCALE), dest=self.dest, absolute=True)
+                t = tick / self.TIME_SCALE; late = now - due; perf = due - self.offset
+            else:
+                self.fs.noteon(self.channel, note, vel)
+                t = perf = time.perf_counter(); late = t - due
+                self.off = due + self.click_s; self.off_note = note
+        except: return
+        self.error.record(max(0.0, late))
+        if self.last is not None: self.jitter.record(abs(t - self.last - period))
+        self.last = t; self.grid = (perf, period, self.transport.beats, beat)
+
+    def _report_loop(self, every):
+        seen = 0
+        while True:
+            time.sleep(every)
+            if self.jitter.n == seen: continue
+            seen = self.jitter.n; j = self.jitter.summary(); e = self.error.summary()
+            print(f"metronome jitter ms: p50 {j['p50']:.2f}  p99 {j['p99']:.2f}  max {j['max']:.2f}  late max {e['max']:.2f}  ({j['n']} beats, {'sequencer' if self.seq else 'thread'})")
+
+# ---------------------- BENCHMARK ----------------------
+def _bench(sf2, bpm=133, seconds=10, rate=44100, block=256):
+    # Renders in real time without an audio driver and finds the click onsets in the samples
+    import fluidsynth, numpy
+    fs = fluidsynth.Synth(samplerate=float(rate)); sfid = fs.sfload(sf2)
+    fs.program_select(9, sfid, 128, 0)
+    m = Metronome(Transport(bpm), report_s=0); m.attach(fs); m.start()
+    out = []; t0 = time.perf_counter()
+    for i in range(int(seconds * rate / block)):
+        out.append(numpy.abs(numpy.asarray(fs.get_samples(block)[::2], dtype=numpy.int32)))
+        wait = t0 + (i + 1) * block / rate - time.perf_counter()
+        if wait > 0: time.sleep(wait)
+    mode = "sequencer" if m.seq else "thread"; m.stop(); m.attach(None)
+    audio = numpy.concatenate(out); loud = numpy.flatnonzero(audio > audio.max() / 4)
+    onsets = [loud[0]] + [b for a, b in zip(loud, loud[1:]) if b - a > rate * 0.1] if len(loud) else []
+    gaps = numpy.diff(onsets) / rate; period = 60.0 / bpm
+    print(f"{len(onsets)} clicks at {bpm} BPM ({m.jitter.n + 1} scheduled, {mode})")
+    if len(gaps): print(f"inter-beat error ms: max {numpy.abs(gaps - period).max() * 1000:.3f}, mean {numpy.abs(gaps - period).mean() * 1000:.3f}")
+    fs.delete()
+
+if __name__ == '__main__':
+    if "--bench" in sys.argv:
+        a = sys.argv[sys.argv.index("--bench") + 1:]
+        _bench(a[0], int(a[1]) if len(a) > 1 else 133)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Compiled MIDI files for playback
+# A .mid is parsed once (smf_reader) into flat arrays: absolute time in us per event,
+# 3 packed bytes per event (status + data, sysex in a side table) and the
+# tempo map. The result is written to a cache folder next to the library,
+# named after the file's path and checked against its mtime and size, then
+# memory-mapped; playing, seeking or asking for the duration after that
+# costs no parsing at all.
+#
+#   python3 midi_event_cache.py FOLDER [CACHE]   compiles every .mid below FOLDER and times a cached load
+
+import os, sys, mmap, time, struct, hashlib
+import smf_reader
+from array import array
+from bisect import bisect_left, bisect_right
+
+MAGIC = b"MEVC1\0\0\0"
+# events, sysex events, sysex bytes, tempo changes, duration us, source mtime ns, source size, beats per bar (0 = none)
+HEADER = struct.Struct("<8q")
+
+def compile_smf(path, st=None):
+    # Cache image (bytes) of a MIDI file; smf_reader, or mido for files it does not read
+    st = st or os.stat(path)
+    try:
+        smf = smf_reader.read(path); times = smf.times_us(); tm = smf.tempo_map()
+        return _image(st, times, smf.msgs, smf.sx_ev, smf.sx_off, smf.blob, [x[0] for x in tm], [x[1] for x in tm], [x[2] for x in tm], smf.beats)
+    except smf_reader.SMFError as e: print("event cache: reading", path, "with mido:", e)
+    import mido
+    mid = mido.MidiFile(path); tpb = float(mid.ticks_per_beat)
+    times = array('q'); msgs = bytearray(); sx_ev = array('q'); sx_off = array('q', [0]); blob = bytearray()
+    t_s = array('d', [0.0]); t_beat = array('d', [0.0]); t_spb = array('d', [0.5]); beats = 0
+    s = 0.0; tick = 0
+    for msg in mido.merge_tracks(mid.tracks):
+        if msg.time:
+            s += msg.time / tpb * t_spb[-1]; tick += msg.time
+        if msg.is_meta:
+            if msg.type == 'set_tempo':
+                if t_s[-1] == s: t_beat[-1] = tick / tpb; t_spb[-1] = msg.tempo / 1e6
+                else: t_s.append(s); t_beat.append(tick / tpb); t_spb.append(msg.tempo / 1e6)
+            elif msg.type == 'time_signature' and not beats: beats = msg.numerator
+            continue
+        b = msg.bytes(); times.append(int(round(s * 1e6)))
+        if b[0] >= 0xF0:
+            sx_ev.append(len(times) - 1); blob += bytes(b); sx_off.append(len(blob)); msgs += b"\xF0\0\0"
+        else: msgs += bytes(b + [0] * (3 - len(b)))
+    return _image(st, times, msgs, sx_ev, sx_off, blob, t_s, t_beat, t_spb, beats)
+
+def _image(st, times, msgs, sx_ev, sx_off, blob, t_s, t_beat, t_spb, beats):
+    head = HEADER.pack(len(times), len(sx_ev), len(blob), len(t_s), times[-1] if len(times) else 0, st.st_mtime_ns, st.st_size, beats)
+    return b"".join((MAGIC, head, times.tobytes(), sx_ev.tobytes(), sx_off.tobytes(), array('d', t_s).tobytes(), array('d', t_beat).tobytes(),
+                     array('d', t_spb).tobytes(), bytes(msgs), bytes(blob)))
+
+class Song:
+    # A compiled file over bytes or an mmap; every array is a view, nothing is copied
+    def __init__(self, buf):
+        if bytes(buf[:8]) != MAGIC: raise ValueError("not an event cache")
+        self.buf = buf; mv = self._mv = memoryview(buf)
+        n, ns, nb, nt, self.duration_us, self.mtime_ns, self.size, self.beats = HEADER.unpack_from(buf, 8)
+        o = 8 + HEADER.size
+        def take(fmt, count, size):
+            nonlocal o
+            v = mv[o:o + count * size]; o += count * size
+            return v.cast(fmt) if fmt != 'B' else v
+        self.times = take('q', n, 8)  # us from the start
+        self.sx_ev = take('q', ns, 8); self.sx_off = take('q', ns + 1, 8)
+        self.tempo_s = take('d', nt, 8); self.tempo_beat = take('d', nt, 8); self.tempo_spb = take('d', nt, 8)
+        self.msgs = take('B', 3 * n, 1); self.blob = take('B', nb, 1)
+        self.n = n
+
+    @property
+    def duration(self):
+        return self.duration_us / 1e6
+
+    def message(self, i):
+        st = self.msgs[3 * i]
+        if st == 0xF0:
+            k = bisect_left(self.sx_ev, i); return bytes(self.blob[self.sx_off[k]:self.sx_off[k + 1]])
+        return bytes(self.msgs[3 * i:3 * i + (2 if st & 0xF0 in (0xC0, 0xD0) else 3)])
+
+    def index_at(self, seconds):
+        # First event at or after `seconds`
+        return bisect_left(self.times, int(seconds * 1e6))
+
+    def tempo_map(self):
+        # [(seconds, beat, seconds per beat)], as transport.file_tempo_map
+        return list(zip(self.tempo_s, self.tempo_beat, self.tempo_spb))
+
+    def close(self):
+        for v in (self.times, self.sx_ev, self.sx_off, self.tempo_s, self.tempo_beat, self.tempo_spb, self.msgs, self.blob, self._mv): v.release()
+        if isinstance(self.buf, mmap.mmap): self.buf.close()
+
+class EventCache:
+    # folder None: compile in memory every time
+    def __init__(self, folder=None):
+        self.folder = folder
+
+    def cache_path(self, path):
+        return os.path.join(self.folder, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16] + ".mev")
+
+    def _map(self, cp):
+        with open(cp, "rb") as f:
+            return Song(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def load(self, path):
+        # Song for a .mid, compiled first if the cache is missing or older than the file
+        st = os.stat(path)
+        if self.folder:
+            cp = self.cache_path(path)
+            try:
+                song = self._map(cp)
+                if song.mtime_ns == st.st_mtime_ns and song.size == st.st_size: return song
+                song.close()
+            except: pass
+        data = compile_smf(path, st)
+        if self.folder:
+            try:
+                os.makedirs(self.folder, exist_ok=True); tmp = cp + ".tmp"
+                with open(tmp, "wb") as f: f.write(data)
+                os.replace(tmp, cp)
+                return self._map(cp)
+            except Exception as e: print("event cache not written:", e)
+        return Song(data)
+
+    def duration(self, path):
+        song = self.load(path); d = song.duration; song.close()
+        return d
+
+# ---------------------- BENCHMARK ----------------------
+def _bench(folder, cache_dir=None):
+    import mido
+    cache = EventCache(cache_dir or os.path.join(folder, ".eventcache"))
+    paths = [os.path.join(d, f) for d, _, fs in os.walk(folder) for f in fs if f.lower().endswith(".mid")]
+    for p in sorted(paths):
+        try:
+            t0 = time.perf_counter(); mido.MidiFile(p); t_mido = time.perf_counter() - t0
+            cache.load(p).close()
+            t0 = time.perf_counter(); song = cache.load(p); d = song.duration; n = song.n; song.close(); t_load = time.perf_counter() - t0
+            print(f"{os.path.basename(p)[:30]:<30} {n:7d} events {d:7.1f} s   mido {t_mido * 1000:8.1f} ms   cached {t_load * 1000:6.2f} ms")
+        except Exception as e: print(os.path.basename(p), "failed:", e)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1: _bench(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
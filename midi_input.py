@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# MIDI input helpers shared by the fast_boot variants
+#
+# PortManager keeps several keyboards / pads open at once, each with its own
+# filter and channel remap, merged into one MidiQueue feeding the synth.
+#
+# Native route: FluidSynth's own ALSA-sequencer MIDI driver is subscribed
+# straight to the keyboard port, so notes reach the synth without passing
+# through Python. The rtmidi callback stays connected as a tap for overlays,
+# the recorder and preset names, but no longer calls the synth.
+#
+#   python3 midi_input.py --bench-route [--load]   key-to-voice latency, callback vs native
+#   python3 midi_input.py --bench-queue            callback cost and note delay behind a CC flood
+#   python3 midi_input.py --test-hotplug           PortWatcher against a virtual port that comes and goes
+
+import sys, os, re, time, json, threading, subprocess
+from array import array
+from latency_stats import LatencyProbe
+
+SEQ_CLIENTS = "/proc/asound/seq/clients"
+
+# Controllers that are never collapsed: bank select, (N)RPN and data entry
+# only mean something as a sequence, 120+ are channel mode messages.
+KEEP_CC = frozenset((0, 6, 32, 38, 96, 97, 98, 99, 100, 101) + tuple(range(120, 128)))
+
+def alsa_addr(port_name):
+    # rtmidi ALSA port names end in "client:port", e.g. "nanoKEY2:nanoKEY2 MIDI 1 20:0"
+    m = re.search(r"(\d+:\d+)$", port_name or "")
+    return m.group(1) if m else None
+
+def seq_ports():
+    # (client id, client name, port id, port name) from the ALSA sequencer's proc listing
+    out = []; client = None
+    try:
+        with open(SEQ_CLIENTS) as f:
+            for line in f:
+                m = re.match(r'Client\s+(\d+)\s*:\s*"(.*)"', line)
+                if m: client = (int(m.group(1)), m.group(2)); continue
+                m = re.match(r'\s+Port\s+(\d+)\s*:\s*"(.*)"', line)
+                if m and client: out.append((client[0], client[1], int(m.group(1)), m.group(2)))
+    except: pass
+    return out
+
+def port_key(port_name):
+    # rtmidi name without the "client:port" suffix, which changes when a device is replugged
+    return re.sub(r"\s+\d+:\d+$", "", port_name or "")
+
+def rtmidi_name(cid, cname, pid, pname):
+    # The name rtmidi's ALSA backend gives the same port
+    return f"{cname}:{pname} {cid}:{pid}"
+
+def wait_for_port(substring, timeout=10, poll_s=0.05, rtmidi=None):
+    # Full name of the first port containing substring, or None after timeout.
+    # Reads the sequencer's proc listing instead of creating rtmidi objects;
+    # without that listing it falls back to rtmidi enumeration, as PortWatcher.
+    end = time.time() + timeout; s = substring.lower()
+    while True:
+        if os.path.exists(SEQ_CLIENTS): names = [rtmidi_name(*p) for p in seq_ports()]
+        else:
+            if rtmidi is None: import rtmidi
+            names = rtmidi.MidiIn().get_ports() + rtmidi.MidiOut().get_ports(); poll_s = max(poll_s, 0.5)
+        for name in names:
+            if s in name.lower(): return name
+        if time.time() >= end: return None
+        time.sleep(poll_s)
+
+# ---------------------- NATIVE ROUTE ----------------------
+class NativeRoute:
+    # With several keyboards open, each is subscribed on its own. Channel
+    # remaps and filters of PortManager do not apply on this path.
+    def __init__(self, client_id="monkey"):
+        self.client_id = client_id
+        self.pairs = {}  # rtmidi port name -> (src, dst) ALSA addresses currently subscribed
+        self.srcs = []   # rtmidi names of the keyboard ports to follow
+        self.active = False  # some port is subscribed
+
+    @property
+    def src(self):
+        return self.srcs[-1] if self.srcs else None
+
+    def prepare(self, fs):
+        # Call before fs.start(): fixes the synth's sequencer client name so it can be found
+        fs.setting('midi.driver', 'alsa_seq')
+        fs.setting('midi.alsa_seq.id', self.client_id)
+
+    def synth_addr(self):
+        for cid, cname, pid, pname in seq_ports():
+            if cname == f"FLUID Synth ({self.client_id})": return f"{cid}:{pid}"
+        return None
+
+    def routes(self, port_name):
+        # True when FluidSynth reads this port itself; its events must not be played again from Python
+        return port_name in self.pairs
+
+    def connect(self, port_name=None):
+        # Subscribe the synth to port_name, or re-subscribe all ports after the synth was recreated
+        names = [port_name] if port_name else list(self.srcs)
+        dst = self.synth_addr(); ok = False
+        for name in names:
+            if name not in self.srcs: self.srcs.append(name)
+            self._unsubscribe(name)
+            src = alsa_addr(name)
+            if not src or not dst: continue
+            try:
+                if subprocess.run(["aconnect", src, dst], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=2).returncode == 0:
+                    self.pairs[name] = (src, dst); ok = True
+            except: pass
+        self.active = bool(self.pairs)
+        return ok
+
+    def _unsubscribe(self, name):
+        pair = self.pairs.pop(name, None)
+        if pair:
+            try: subprocess.run(["aconnect", "-d", *pair], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=2)
+            except: pass
+
+    def disconnect(self, port_name=None):
+        # One port, or all of them
+        for name in [port_name] if port_name else list(self.srcs):
+            self._unsubscribe(name)
+            if name in self.srcs: self.srcs.remove(name)
+        self.active = bool(self.pairs)
+
+# ---------------------- INPUT FILTER ----------------------
+class InputFilter:
+    # First stage in the rtmidi callback. Clock, active sensing and sysex are
+    # dropped inside rtmidi (ignore_types) and never reach Python. Continuous
+    # data (CC, pitch bend, channel and poly pressure) is thinned per channel
+    # and controller: a value arriving within `window_s` of the last one
+    # forwarded is dropped unless it moved by at least `step` (bend: `bend_step`)
+    # or is an end stop (0, max, bend centre), so the synth never rests more
+    # than a step away from where the controller stopped. Pedals and KEEP_CC
+    # always pass.
+    NEVER_THIN = KEEP_CC | frozenset(range(64, 70))
+
+    def __init__(self, sysex=True, timing=True, active_sense=True, window_s=0.01, step=2, bend_step=64, drop=(), report_s=30.0):
+        self.sysex = sysex; self.timing = timing; self.active_sense = active_sense
+        self.window_s = window_s; self.step = step; self.bend_step = bend_step
+        self.drop = frozenset(drop)  # status nibbles to drop outright, e.g. (0xA0, 0xD0) for aftertouch
+        self.last = {}  # (status byte, controller/note or -1) -> (time forwarded, value)
+        self.forwarded = self.thinned = self.dropped = 0; self.carry = 0.0
+        if report_s: threading.Thread(target=self._report_loop, args=(report_s,), daemon=True).start()
+
+    def apply(self, midiin):
+        # Call after every open_port()
+        try: midiin.ignore_types(sysex=self.sysex, timing=self.timing, active_sense=self.active_sense)
+        except: pass
+
+    def accept(self, msg, now):
+        st = msg[0] & 0xF0
+        if st in self.drop: self.dropped += 1; return False
+        if self.window_s and len(msg) > 1:
+            if st == 0xB0 and len(msg) > 2 and msg[1] not in self.NEVER_THIN: key, v, top, step = (msg[0], msg[1]), msg[2], 127, self.step
+            elif st == 0xE0 and len(msg) > 2: key, v, top, step = (msg[0], -1), (msg[2] << 7) | msg[1], 16383, self.bend_step
+            elif st == 0xD0: key, v, top, step = (msg[0], -1), msg[1], 127, self.step
+            elif st == 0xA0 and len(msg) > 2: key, v, top, step = (msg[0], msg[1]), msg[2], 127, self.step
+            else: key = None
+            if key:
+                prev = self.last.get(key)
+                if prev and now - prev[0] < self.window_s and abs(v - prev[1]) < step and v not in (0, top) and not (st == 0xE0 and v == 8192):
+                    self.thinned += 1; return False
+                self.last[key] = (now, v)
+        self.forwarded += 1
+        return True
+
+    def pass_through(self, message_data, now):
+        # rtmidi (message, delta) -> the same, or None when dropped. Deltas of dropped
+        # messages are added to the next one so arrival times downstream stay right.
+        msg, delta = message_data
+        if not self.accept(msg, now): self.carry += delta; return None
+        if self.carry: delta += self.carry; self.carry = 0.0
+        return msg, delta
+
+    def summary(self):
+        n = self.forwarded + self.thinned + self.dropped
+        return {"forwarded": self.forwarded, "thinned": self.thinned, "dropped": self.dropped, "pct_removed": 100.0 * (n - self.forwarded) / n if n else 0.0}
+
+    def _report_loop(self, every):
+        seen = 0
+        while True:
+            time.sleep(every)
+            n = self.forwarded + self.thinned + self.dropped
+            if n == seen: continue
+            seen = n; r = self.summary()
+            print(f"midi filter: {r['forwarded']} forwarded, {r['thinned']} thinned, {r['dropped']} dropped ({r['pct_removed']:.0f}% removed)")
+
+# ---------------------- INGEST QUEUE ----------------------
+class _Ring:
+    # Preallocated single-producer/single-consumer ring; one per rtmidi input
+    def __init__(self, queue, size, owner=None):
+        self.queue = queue; self.owner = owner
+        self.size = size; self.mask = size - 1  # size: power of two
+        self.msgs = [None] * size
+        self.t_in = array('d', bytes(8 * size)); self.lag = array('d', bytes(8 * size))
+        self.head = 0; self.tail = 0  # head only moved by the consumer, tail only by push()
+        self.pushed = self.dropped = 0
+
+    def push(self, msg, t_in, lag=0.0):
+        # rtmidi thread: constant time, no locks unless the consumer is asleep
+        i = self.tail
+        if i - self.head >= self.size: self.dropped += 1; return False
+        j = i & self.mask
+        self.msgs[j] = msg; self.t_in[j] = t_in; self.lag[j] = lag
+        self.tail = i + 1; self.pushed += 1
+        q = self.queue
+        if q.idle: q._wake.set()
+        if not q._thread: q.start()
+        return True
+
+    def take(self, out):
+        head, tail = self.head, self.tail
+        for i in range(head, tail):
+            j = i & self.mask
+            out.append((self.msgs[j], self.t_in[j], self.lag[j], self.owner))
+        self.head = tail
+        return tail - head
+
+class MidiQueue:
+    # Rings between the rtmidi threads and one consumer thread. push() only
+    # fills a preallocated slot and moves the tail, so the rtmidi callback
+    # costs the same for every event and never waits on a lock the consumer
+    # holds. Every input gets its own ring (ring()); push() on the queue
+    # itself uses a default one. The consumer takes everything queued as one
+    # batch, merged across rings in arrival order (t_in - lag), and hands it
+    # to dispatch(msg, t_in, lag, src) for the synth first (src: the InputPort, None for push()), then to tap(batch) for
+    # UI and recorder state. Within a batch, repeats of the same controller
+    # (or pitch bend) on a channel with no other event in between collapse to
+    # the last value, so a CC1/CC64 flood turns into one synth call instead
+    # of delaying the note behind it.
+    def __init__(self, dispatch, tap=None, size=1024, probe=None):
+        self.dispatch = dispatch; self.tap = tap; self.size = size
+        self.probe = probe  # LatencyProbe for note-ons pushed without an owner
+        self.idle = True; self._wake = threading.Event(); self._thread = None
+        self.coalesced = self.batches = 0; self.dead = [0, 0]  # pushed/dropped of removed rings
+        self.rings = [_Ring(self, size)]
+
+    def ring(self, owner=None):
+        # owner: its .probe gets the note-ons of this ring instead of the queue's probe
+        r = _Ring(self, self.size, owner)
+        self.rings = self.rings + [r]  # replaced, never mutated: the consumer iterates without a lock
+        return r
+
+    def remove(self, r):
+        self.rings = [x for x in self.rings if x is not r]
+        self.dead[0] += r.pushed; self.dead[1] += r.dropped
+
+    def push(self, msg, t_in, lag=0.0):
+        return self.rings[0].push(msg, t_in, lag)
+
+    def start(self):
+        if self._thread: return
+        self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+
+    def _thin(self, batch):
+        # Newest first: keep the last value of each controller since the previous non-controller event
+        out = []; seen = set()
+        for ev in reversed(batch):
+            m = ev[0]; st = m[0] & 0xF0
+            if st == 0xE0 or (st == 0xB0 and len(m) > 2 and m[1] not in KEEP_CC):
+                key = (m[0], m[1] if st == 0xB0 else -1)
+                if key in seen: self.coalesced += 1; continue
+                seen.add(key)
+            else: seen.clear()
+            out.append(ev)
+        out.reverse()
+        return out
+
+    def _pending(self):
+        return any(r.head != r.tail for r in self.rings)
+
+    def _run(self):
+        while True:
+            self._wake.clear(); self.idle = True
+            if not self._pending(): self._wake.wait(1.0)
+            self.idle = False
+            batch = []; sources = 0
+            for r in self.rings:
+                if r.take(batch): sources += 1
+            if not batch: continue
+            if sources > 1: batch.sort(key=lambda ev: ev[1] - ev[2])
+            self.batches += 1
+            for m, t_in, lag, owner in self._thin(batch):
+                try:
+                    self.dispatch(m, t_in, lag, owner)
+                    if m[0] & 0xF0 == 0x90 and len(m) > 2 and m[2]:
+                        probe = owner.probe if owner else self.probe
+                        if probe: probe.dispatched(t_in, lag)
+                except Exception as e: print("midi dispatch failed:", e)
+            if self.tap:
+                try: self.tap(batch)
+                except Exception as e: print("midi tap failed:", e)
+
+    def stats(self):
+        rings = self.rings
+        return {"pushed": self.dead[0] + sum(r.pushed for r in rings), "dropped": self.dead[1] + sum(r.dropped for r in rings),
+                "coalesced": self.coalesced, "batches": self.batches}
+
+# ---------------------- PORT MANAGER ----------------------
+class InputPort:
+    # One open rtmidi input with its own filter, channel remap, ring and stats
+    def __init__(self, name, midiin, input_filter=None, remap=None, probe=None):
+        self.name = name; self.midiin = midiin; self.filter = input_filter
+        self.remap = remap or {}  # input channel (0-15) -> synth channel
+        self.probe = LatencyProbe(name, report_s=0, parent=probe)  # also its own arrival clock
+        self.ring = None; self.messages = 0
+
+class PortManager:
+    # Keeps any number of rtmidi inputs open at once, all merged into one
+    # MidiQueue. config maps a substring of the port name to that port's
+    # settings: {"remap": {in ch: out ch}, "filter": InputFilter kwargs, or
+    # None for no filter}; filter_kw are the defaults for every port. Port
+    # probes also record into `probe`.
+    def __init__(self, rtmidi, queue, config=None, report_s=30.0, probe=None, **filter_kw):
+        self.rtmidi = rtmidi; self.queue = queue; self.config = config or {}; self.filter_kw = filter_kw
+        self.probe = probe
+        self.scanner = rtmidi.MidiIn(); self.ports = {}; self.lock = threading.Lock()
+        if report_s: threading.Thread(target=self._report_loop, args=(report_s,), daemon=True).start()
+
+    @property
+    def port_name(self):
+        return " + ".join(self.ports) if self.ports else None
+
+    def list_ports(self):
+        return self.scanner.get_ports()
+
+    def settings(self, name):
+        for key, conf in self.config.items():
+            if key in name: return conf
+        return {}
+
+    def open(self, name):
+        # Returns the InputPort, or None when the port is not there (any more)
+        with self.lock:
+            if name in self.ports: return self.ports[name]
+            names = self.scanner.get_ports()
+            if name not in names: return None
+            conf = self.settings(name)
+            fkw = conf.get("filter", self.filter_kw)
+            midiin = self.rtmidi.MidiIn(); midiin.open_port(names.index(name))
+            port = InputPort(name, midiin, InputFilter(report_s=0, **fkw) if fkw is not None else None, conf.get("remap"), self.probe)
+            if port.filter: port.filter.apply(midiin)
+            port.ring = self.queue.ring(port)
+            midiin.set_callback(self._cb, port)
+            self.ports = {**self.ports, name: port}
+            return port
+
+    def close(self, name=None):
+        # One port, or all of them
+        with self.lock:
+            for n in [name] if name else list(self.ports):
+                port = self.ports.get(n)
+                if not port: continue
+                self.ports = {k: v for k, v in self.ports.items() if k != n}
+                try: port.midiin.cancel_callback(); port.midiin.close_port()
+                except: pass
+                self.queue.remove(port.ring)
+
+    def _cb(self, message_data, port):
+        # rtmidi thread of this port
+        t_cb = time.perf_counter()
+        if port.filter:
+            message_data = port.filter.pass_through(message_data, t_cb)
+            if not message_data: return
+        msg, delta = message_data
+        if port.remap and msg[0] < 0xF0:
+            ch = port.remap.get(msg[0] & 0x0F)
+            if ch is not None: msg[0] = (msg[0] & 0xF0) | ch  # rtmidi hands over a fresh list per message
+        port.ring.push(msg, t_cb, port.probe.arrival(delta))
+        port.messages += 1
+        port.probe.callback(t_cb)
+
+    def summary(self):
+        out = []
+        for port in self.ports.values():
+            r = {"name": port.name, "messages": port.messages, "callback": port.probe.hist["callback"].summary(),
+                 "latency": port.probe.summary(), "filter": port.filter.summary() if port.filter else None}
+            out.append(r)
+        return out
+
+    def _report_loop(self, every):
+        seen = {}
+        while True:
+            time.sleep(every)
+            for r in self.summary():
+                n = r["messages"] - seen.get(r["name"], 0)
+                if not n: continue
+                seen[r["name"]] = r["messages"]
+                line = f"midi in {r['name']}: {n / every:.1f} msg/s"
+                if r["callback"]: line += f"  callback p99 {r['callback']['p99'] * 1000:.0f} us (max {r['callback']['max'] * 1000:.0f})"
+                if r["latency"]: line += f"  note p50 {r['latency']['p50']:.2f} ms p99 {r['latency']['p99']:.2f} ms"
+                if r["filter"]: line += f"  filtered {r['filter']['pct_removed']:.0f}%"
+                print(line)
+
+# ---------------------- PORT WATCHER ----------------------
+class PortWatcher:
+    # Remembers the ports chosen by name (without the client:port suffix,
+    # kept in `path`) and keeps them open on a PortManager across unplugging.
+    # The sequencer's port list is read from /proc every `poll_s` (no rtmidi
+    # objects, a few us); when it changes and has been stable for
+    # `debounce_s`, gone ports are closed and remembered ones that are back
+    # are reopened. on_change(kind, name) is called with "open" or "lost".
+    def __init__(self, manager, path=None, on_change=None, poll_s=0.05, debounce_s=0.02):
+        self.manager = manager; self.path = path; self.on_change = on_change
+        self.poll_s = poll_s; self.debounce_s = debounce_s
+        self.wanted = []; self.events = 0; self._thread = None; self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r') as f: self.wanted = [str(k) for k in json.load(f).get("ports", [])]
+        except: pass
+
+    def save(self):
+        if not self.path: return
+        try:
+            with open(self.path, 'w') as f: json.dump({"ports": self.wanted}, f)
+        except: pass
+
+    def remember(self, name):
+        k = port_key(name)
+        if k not in self.wanted: self.wanted.append(k); self.save()
+
+    def forget(self, name):
+        k = port_key(name)
+        if k in self.wanted: self.wanted.remove(k); self.save()
+
+    def sync(self):
+        # Close what disappeared, open what is wanted and present. Returns the names opened.
+        with self._lock:
+            present = self.manager.list_ports(); opened = []
+            for name in list(self.manager.ports):
+                if name not in present:
+                    self.manager.close(name); self._notify("lost", name)
+            keys = {port_key(n) for n in self.manager.ports}
+            for name in present:
+                k = port_key(name)
+                if k in self.wanted and k not in keys and self.manager.open(name):
+                    keys.add(k); opened.append(name); self._notify("open", name)
+            return opened
+
+    def _notify(self, kind, name):
+        self.events += 1
+        if self.on_change:
+            try: self.on_change(kind, name)
+            except Exception as e: print("port watcher callback failed:", e)
+
+    def start(self):
+        if self._thread: return
+        self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+
+    def _run(self):
+        proc = os.path.exists(SEQ_CLIENTS)
+        last = seq_ports() if proc else None
+        self.sync()
+        while True:
+            if not proc:
+                time.sleep(1.0); self.sync(); continue  # no ALSA sequencer listing: plain rtmidi enumeration
+            time.sleep(self.poll_s)
+            now = seq_ports()
+            if now == last: continue
+            while True:
+                time.sleep(self.debounce_s)
+                again = seq_ports()
+                if again == now: break
+                now = again
+            last = now; self.sync()
+
+# ---------------------- BENCHMARK ----------------------
+# Sends notes from a virtual port and times how long until FluidSynth has a
+# voice for them, once through an rtmidi callback that calls fs.noteon (the
+# current path) and once through the native route. --load adds a pure-Python
+# thread standing in for render work competing for the GIL.
+def _measure(out, fs, notes):
+    lat = []
+    for i in range(notes):
+        t0 = time.perf_counter(); out.send_message([0x90, 60, 100])
+        while fs.get_active_voice_count() == 0 and time.perf_counter() - t0 < 0.1:
+            time.sleep(0)
+        lat.append(time.perf_counter() - t0)
+        out.send_message([0x80, 60, 0]); out.send_message([0xB0, 120, 0])  # all sound off
+        t1 = time.perf_counter()
+        while fs.get_active_voice_count() and time.perf_counter() - t1 < 0.5: time.sleep(0.001)
+        time.sleep(0.005 + (i % 7) * 0.002)
+    lat.sort()
+    return lat
+
+def _bench_route(notes=200, load=False, sf2=None):
+    import fluidsynth, rtmidi
+    route = NativeRoute("monkey-bench")
+    fs = fluidsynth.Synth(); route.prepare(fs); fs.start(driver="alsa")
+    if not sf2:
+        folder = os.path.join(os.path.expanduser("~"), "sf2")
+        found = sorted(f for f in os.listdir(folder) if f.endswith(".sf2")) if os.path.isdir(folder) else []
+        if not found: sys.exit("no .sf2 found, pass --sf2 PATH")
+        sf2 = os.path.join(folder, found[0])
+    sfid = fs.sfload(sf2, True); fs.program_select(0, sfid, 0, 0)
+    out = rtmidi.MidiOut(); out.open_virtual_port("monkey-bench")
+    time.sleep(0.2)
+    mi = rtmidi.MidiIn(); ports = mi.get_ports()
+    name = next(p for p in ports if "monkey-bench" in p)
+
+    stop = threading.Event()
+    if load:
+        def spin():
+            while not stop.is_set(): sum(i * i for i in range(2000))
+        threading.Thread(target=spin, daemon=True).start()
+
+    def cb(message_data, data):
+        m, _ = message_data; st, ch = m[0] & 0xF0, m[0] & 0x0F
+        if st == 0x90 and m[2] > 0: fs.noteon(ch, m[1], m[2])
+        elif st in (0x80, 0x90): fs.noteoff(ch, m[1])
+        elif st == 0xB0: fs.cc(ch, m[1], m[2])
+    mi.open_port(ports.index(name)); mi.set_callback(cb)
+    results = {"callback": _measure(out, fs, notes)}
+    mi.close_port()
+    if not route.connect(name): sys.exit("aconnect to the FluidSynth port failed")
+    results["native"] = _measure(out, fs, notes)
+    route.disconnect(); stop.set()
+
+    print(f"key -> voice latency over {notes} notes{' with a busy Python thread' if load else ''}:")
+    for path, lat in results.items():
+        n = len(lat)
+        print(f"  {path:<8} p50 {lat[n // 2] * 1000:.2f} ms  p99 {lat[min(n - 1, int(n * 0.99))] * 1000:.2f} ms  max {lat[-1] * 1000:.2f} ms")
+    fs.delete()
+
+def _bench_queue(events=20000):
+    # No hardware: a synth stub that costs ~50 us per call like fs.cc/noteon on a Zero 2 W,
+    # a CC1 flood at ~1 kHz and a note-on every 50 ms pushed from a producer thread
+    def busy(s):
+        t = time.perf_counter() + s
+        while time.perf_counter() < t: pass
+    delays = []
+    def dispatch(msg, t_in, lag, src):
+        busy(50e-6)
+        if msg[0] & 0xF0 == 0x90: delays.append(time.perf_counter() - t_in)
+    q = MidiQueue(dispatch); cost = []
+    for i in range(events):
+        msg = [0x90, 60, 100] if i % 50 == 0 else [0xB0, 1, i & 127]
+        t0 = time.perf_counter(); q.push(msg, t0); cost.append(time.perf_counter() - t0)
+        time.sleep(1e-3)
+    time.sleep(0.2)
+    for name, v in (("push (rtmidi thread)", cost), ("note-on queue -> synth", delays)):
+        v.sort(); n = len(v)
+        print(f"{name:<24} p50 {v[n // 2] * 1e6:8.1f} us  p99 {v[min(n - 1, int(n * 0.99))] * 1e6:8.1f} us  max {v[-1] * 1e6:8.1f} us")
+    print(q.stats())
+
+def _test_hotplug(rounds=5):
+    # A virtual rtmidi output stands in for the keyboard: it is closed and
+    # re-created (new client id each time) and the watcher has to reopen it
+    import rtmidi
+    got = []
+    q = MidiQueue(lambda msg, t_in, lag, src: got.append(msg))
+    pm = PortManager(rtmidi, q, report_s=0)
+    w = PortWatcher(pm); w.remember("monkey-hotplug:monkey-hotplug"); w.start()
+    for i in range(rounds):
+        out = rtmidi.MidiOut(name="monkey-hotplug"); t0 = time.perf_counter(); out.open_virtual_port("monkey-hotplug")
+        while not pm.ports and time.perf_counter() - t0 < 2: time.sleep(0.001)
+        t_open = time.perf_counter() - t0
+        if not pm.ports: sys.exit(f"round {i}: port not reopened")
+        n = len(got); out.send_message([0x90, 60, 100]); time.sleep(0.05)
+        print(f"round {i}: reopened after {t_open * 1000:.0f} ms as {pm.port_name!r}, note {'received' if len(got) > n else 'LOST'}")
+        out.close_port(); del out; time.sleep(0.3)
+        if pm.ports: sys.exit(f"round {i}: closed port still open")
+
+if __name__ == '__main__':
+    if "--test-hotplug" in sys.argv:
+        _test_hotplug()
+    elif "--bench-queue" in sys.argv:
+        _bench_queue()
+    elif "--bench-route" in sys.argv:
+        sf2 = sys.argv[sys.argv.index("--sf2") + 1] if "--sf2" in sys.argv else None
+        _bench_route(load="--load" in sys.argv, sf2=sf2)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# Persistent index of the MIDI file library
+# One SQLite row per file: mtime and size, and what analyze() found in it
+# (duration, tempo, tracks, channels, programs, notes, content hash).
+# open() only reads the rows, so the list is there at once however big the
+# library; a rescan on a thread compares every file's mtime and size with its
+# row and only new or changed files are analyzed, in a few worker processes at
+# low priority, so neither the buttons nor the MIDI thread wait for them. The
+# workers are fresh interpreters running this file (fork+exec): forking the
+# threaded player is not safe, and spawn would rerun the player's own startup.
+# Record, delete and rename update the index directly, without a rescan.
+#
+#   python3 midi_library.py FOLDER [DB]   indexes FOLDER and prints what it found
+#   python3 midi_library.py --worker [NICE]   analysis worker: JSON paths on stdin, [path, info] lines on stdout
+
+import os, sys, time, json, queue, sqlite3, hashlib, threading, subprocess
+import smf_reader
+
+FIELDS = ("duration", "bpm", "tracks", "channels", "programs", "notes", "hash")
+COLUMNS = ("path", "mtime_ns", "size") + FIELDS
+SCHEMA = """CREATE TABLE IF NOT EXISTS songs (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER,
+    duration REAL, bpm REAL, tracks INTEGER, channels INTEGER, programs TEXT, notes INTEGER, hash TEXT)"""
+
+def analyze(path):
+    # Metadata of one .mid (runs in a pool worker); a file that cannot be read gets hash "" and no fields
+    st = os.stat(path); info = dict.fromkeys(FIELDS); info.update(mtime_ns=st.st_mtime_ns, size=st.st_size, hash="")
+    try:
+        with open(path, "rb") as f: data = f.read()
+        try:
+            smf = smf_reader.read(data); times = smf.times_us()
+            duration = times[-1] / 1e6 if len(times) else 0.0; tempo = smf.tempo_us[0]; tracks = smf.tracks; msgs = bytes(smf.msgs)
+        except smf_reader.SMFError:
+            import io, mido
+            mid = mido.MidiFile(file=io.BytesIO(data)); duration = mid.length; tracks = len(mid.tracks); tempo = 500000; msgs = bytearray()
+            for m in mido.merge_tracks(mid.tracks):
+                if m.type == 'set_tempo' and not msgs: tempo = m.tempo
+                elif not m.is_meta: b = m.bytes(); msgs += bytes((b + [0, 0])[:3]) if b[0] < 0xF0 else b"\xF0\0\0"
+            msgs = bytes(msgs)
+    except Exception as e:
+        print("midi library:", path, e); return info
+    chans = set(); programs = set(); notes = 0
+    for st, d1, d2 in zip(msgs[0::3], msgs[1::3], msgs[2::3]):
+        if st >= 0xF0: continue
+        chans.add(st & 0x0F); hi = st & 0xF0
+        if hi == 0x90 and d2: notes += 1
+        elif hi == 0xC0: programs.add(d1)
+    info.update(duration=round(duration, 3), bpm=round(60e6 / tempo, 2), tracks=tracks, channels=len(chans),
+                programs=",".join(map(str, sorted(programs))), notes=notes, hash=hashlib.sha1(data).hexdigest())
+    return info
+
+class MidiLibrary:
+    WORKERS = 2  # analysis processes, started per batch and gone when it is done
+    NICE = 10
+    COMMIT_EVERY = 50  # rows per transaction during a big first scan
+
+    def __init__(self, folder, db_path, on_change=None):
+        # on_change(): called from the index thread when the listing or a file's metadata changed
+        self.folder = folder; self.db_path = db_path; self.on_change = on_change
+        self.rows = {}  # path -> {column: value}
+        self.listing = ([], [])  # (paths, names) sorted by file name, any case; replaced, never edited, so readers need no lock
+        self.db = None; self._lock = threading.RLock()  # rows, pending and the database
+        self._full = False; self._pending = set()
+        self._wake = threading.Event(); self.idle = threading.Event(); self.idle.set(); self._thread = None
+
+    # --- database ---
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False); db.execute(SCHEMA)
+        return db
+
+    def open(self):
+        # Rows from the database (no listdir, no parsing), then a rescan in the background
+        with self._lock:
+            try: self.db = self._connect(); rows = self.db.execute("SELECT " + ", ".join(COLUMNS) + " FROM songs").fetchall()
+            except sqlite3.DatabaseError as e:
+                # Corrupt index: it only holds what the files already say, so start again
+                print("midi library: rebuilding index:", e)
+                try: os.remove(self.db_path)
+                except: pass
+                self.db = self._connect(); rows = []
+            self.rows = {r[0]: dict(zip(COLUMNS, r)) for r in rows}
+        self._publish(); self.rescan()
+
+    def _write(self, rows=(), gone=()):
+        with self._lock:
+            if not self.db: return
+            try:
+                if rows: self.db.executemany("INSERT OR REPLACE INTO songs VALUES (%s)" % ", ".join("?" * len(COLUMNS)), [tuple(r[c] for c in COLUMNS) for r in rows])
+                if gone: self.db.executemany("DELETE FROM songs WHERE path = ?", [(p,) for p in gone])
+                self.db.commit()
+            except Exception as e: print("midi library: index not written:", e)
+
+    # --- listing ---
+    def _publish(self):
+        with self._lock: paths = sorted(self.rows, key=lambda p: os.path.basename(p).casefold())
+        self.listing = (paths, [os.path.basename(p)[:-4] for p in paths])
+        if self.on_change:
+            try: self.on_change()
+            except: pass
+
+    def info(self, path):
+        # Metadata of an analyzed file, or None (not analyzed yet, unreadable or not in the library)
+        r = self.rows.get(path)
+        return dict(r) if r and r["hash"] else None
+
+    # --- changes ---
+    def rescan(self):
+        self._full = True; self._kick()
+
+    def update(self, path):
+        # A file was written (a saved take): listed at once, analyzed in the background
+        try: st = os.stat(path)
+        except OSError: return self.remove(path)
+        with self._lock:
+            r = self.rows.get(path)
+            if r and (r["mtime_ns"], r["size"]) == (st.st_mtime_ns, st.st_size): return
+            self.rows[path] = dict(dict.fromkeys(FIELDS), path=path, mtime_ns=st.st_mtime_ns, size=st.st_size); self._pending.add(path)
+        self._publish(); self._kick()
+
+    def remove(self, path):
+        with self._lock:
+            if self.rows.pop(path, None) is None: return
+            self._write(gone=[path])
+        self._publish()
+
+    def rename(self, old, new):
+        # Same content: the analysis moves with it
+        with self._lock:
+            r = self.rows.pop(old, None)
+            if r is not None: r = self.rows[new] = dict(r, path=new); self._write([r], [old])
+        if r is None: return self.update(new)
+        self._publish()
+
+    def _kick(self):
+        self.idle.clear(); self._wake.set()
+        if not self._thread:
+            self._thread = threading.Thread(target=self._run, daemon=True); self._thread.start()
+
+    # --- index thread ---
+    def _run(self):
+        while True:
+            self._wake.wait(); self._wake.clear()
+            if self._full: self._full = False; self._rescan()
+            with self._lock: todo = [p for p in self._pending if p in self.rows]; self._pending.clear()
+            if todo: self._analyze(todo)
+            if not self._wake.is_set(): self.idle.set()
+
+    def _rescan(self):
+        try: names = [f for f in os.listdir(self.folder) if f.endswith('.mid')]
+        except OSError: names = []
+        stats = {}
+        for f in names:
+            p = os.path.join(self.folder, f)
+            try: st = os.stat(p); stats[p] = (st.st_mtime_ns, st.st_size)
+            except OSError: pass
+        changed = False
+        with self._lock:
+            for p, (mtime_ns, size) in stats.items():
+                r = self.rows.get(p)
+                if r and (r["mtime_ns"], r["size"]) == (mtime_ns, size):
+                    if r["hash"] is None: self._pending.add(p)  # listed but never analyzed
+                    continue
+                self.rows[p] = dict(dict.fromkeys(FIELDS), path=p, mtime_ns=mtime_ns, size=size); self._pending.add(p); changed = True
+            gone = [p for p in self.rows if p not in stats]
+            for p in gone: del self.rows[p]
+            if gone: self._write(gone=gone)
+        if changed or gone: self._publish()
+
+    def _analyze(self, todo):
+        results = queue.Queue(); n = min(self.WORKERS, len(todo)); done = []
+        def worker(paths):
+            # All paths go in before the worker writes anything, so neither pipe can fill up on the other
+            try:
+                proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", str(self.NICE)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                with proc.stdin: proc.stdin.writelines(json.dumps(p) + "\n" for p in paths)
+                with proc.stdout:
+                    for line in proc.stdout: results.put(json.loads(line))
+                proc.wait()
+            except Exception as e: print("midi library: analysis stopped:", e)
+            finally: results.put(None)
+        for i in range(n): threading.Thread(target=worker, args=(todo[i::n],), daemon=True).start()
+        while n:
+            item = results.get()
+            if item is None: n -= 1; continue
+            p, info = item
+            with self._lock:
+                r = self.rows.get(p)
+                if r is None or (r["mtime_ns"], r["size"]) != (info["mtime_ns"], info["size"]): continue  # deleted or rewritten meanwhile
+                r.update(info); done.append(r)
+            if len(done) >= self.COMMIT_EVERY: self._write(done); done = []; self._publish()
+        if done: self._write(done)
+        self._publish()
+
+def _worker(nice):
+    # Results go to stdout, so analyze()'s messages go to stderr
+    os.nice(nice); out = sys.stdout; sys.stdout = sys.stderr
+    for p in [json.loads(line) for line in sys.stdin]:
+        try: info = analyze(p)
+        except Exception as e: print("midi library:", p, e); continue
+        out.write(json.dumps([p, info]) + "\n"); out.flush()
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--worker"]: _worker(int(sys.argv[2]) if len(sys.argv) > 2 else MidiLibrary.NICE)
+    elif len(sys.argv) > 1:
+        folder = sys.argv[1]; db = sys.argv[2] if len(sys.argv) > 2 else os.path.join(folder, ".library.db")
+        lib = MidiLibrary(folder, db)
+        t0 = time.perf_counter(); lib.open(); t_open = time.perf_counter() - t0
+        lib.idle.wait(); t_index = time.perf_counter() - t0
+        for p in lib.listing[0]:
+            r = lib.rows[p]
+            print(f"{os.path.basename(p)[:30]:<30} {r['duration'] or 0:7.1f} s {r['bpm'] or 0:6.1f} bpm {r['tracks'] or 0:3d} trk {r['channels'] or 0:2d} ch {r['notes'] or 0:6d} notes  prog {r['programs']}")
+        print(f"{len(lib.rows)} files: listed in {t_open * 1000:.1f} ms, indexed in {t_index * 1000:.0f} ms")
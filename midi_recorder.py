@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Live MIDI recorder shared by the fast_boot variants
+# While recording, add() only copies the status/data bytes and the arrival
+# time into preallocated arrays; the SMF is built in stop() on a background
+# thread, with every tick computed from the take start so nothing drifts.
+# With a journal path, a writer thread appends new events to the journal
+# every FLUSH_S, so a take cut short by a power loss or a service restart is
+# turned into a .mid by recover() on the next boot. With a Transport, ticks
+# and tempo come from its beats and the take starts on the bar it began in,
+# so the file lines up with the metronome or the file that was playing.
+
+import os, time, struct, threading
+from array import array
+
+JOURNAL_MAGIC = b"MREC1\n"
+JOURNAL_EVENT = struct.Struct("<d3s")  # seconds since the take start, status + 2 data bytes
+
+class MidiRecorder:
+    CHUNK = 16384  # events per preallocated block; a long take adds blocks, it never copies
+    TICKS_PER_BEAT = 480
+    TEMPO = 500000  # us per beat (120 BPM) without a transport and for recovered takes
+    FLUSH_S = 1.0  # most of a take a power loss can cost; one write + fsync per flush
+    FLUSH_EVENTS = 4096  # flush early when this many events are waiting
+
+    def __init__(self, journal=None, transport=None):
+        self.recording = False; self.journal = journal; self.transport = transport
+        self.t0 = 0.0; self.n = 0
+        self.times = []; self.data = []  # blocks: array('d') of seconds since t0, bytearray of 3 bytes per event
+        self.saving = None; self.writer = None; self.journaled = 0
+        self.folder = None  # where recover() put the last recovered take
+        self._wake = threading.Event()
+        self._add_block()
+
+    def _add_block(self):
+        self.times.append(array('d', bytes(8 * self.CHUNK))); self.data.append(bytearray(3 * self.CHUNK))
+
+    def start(self, t0=None):
+        # t0: perf_counter time of the take start (default now)
+        for t in (self.saving, self.writer):
+            if t: t.join()  # previous take still saving; it removes the journal when done
+        # A journal left by a take that could not be saved is recovered before it is overwritten
+        if self.journal and self.folder and os.path.exists(self.journal): self.recover(self.folder)
+        self.n = 0; self.journaled = 0; self.t0 = time.perf_counter() if t0 is None else t0
+        self.recording = True
+        if self.journal:
+            self._wake.clear()
+            self.writer = threading.Thread(target=self._write_journal, daemon=True); self.writer.start()
+
+    def add(self, msg, t):
+        # msg: rtmidi bytes, t: perf_counter arrival time. Channel messages only (0x80-0xEF).
+        if not self.recording or not msg or not 0x80 <= msg[0] < 0xF0: return
+        i = self.n; b, j = divmod(i, self.CHUNK)
+        if b == len(self.times): self._add_block()
+        self.times[b][j] = t - self.t0
+        d = self.data[b]; k = 3 * j
+        d[k] = msg[0]; d[k + 1] = msg[1] if len(msg) > 1 else 0; d[k + 2] = msg[2] if len(msg) > 2 else 0
+        self.n = i + 1
+        if i + 1 - self.journaled >= self.FLUSH_EVENTS: self._wake.set()
+
+    def events(self, n=None, first=0):
+        # (seconds since start, [bytes]) for events first..n-1
+        for i in range(first, self.n if n is None else n):
+            b, j = divmod(i, self.CHUNK); d = self.data[b]; k = 3 * j; st = d[k]
+            yield self.times[b][j], [st, d[k + 1]] if st & 0xF0 in (0xC0, 0xD0) else [st, d[k + 1], d[k + 2]]
+
+    # --- journal ---
+    def _write_journal(self):
+        # The preallocated blocks are the buffer: each flush writes what arrived since the last one
+        try: f = open(self.journal, "wb"); f.write(JOURNAL_MAGIC)
+        except Exception as e: print("recording journal off:", e); return
+        with f:
+            while True:
+                self._wake.wait(self.FLUSH_S); self._wake.clear()
+                last = not self.recording; n = self.n
+                if n > self.journaled:
+                    f.write(b"".join(JOURNAL_EVENT.pack(t, bytes(m + [0] * (3 - len(m)))) for t, m in self.events(n, self.journaled)))
+                    self.journaled = n
+                    try: f.flush(); os.fsync(f.fileno())
+                    except: pass
+                if last: return
+
+    @staticmethod
+    def read_journal(path):
+        # Events of a journal; a record torn by the power loss is dropped
+        with open(path, "rb") as f:
+            raw = f.read()
+        if not raw.startswith(JOURNAL_MAGIC): return []
+        out = []; size = JOURNAL_EVENT.size
+        for pos in range(len(JOURNAL_MAGIC), len(raw) - size + 1, size):
+            t, m = JOURNAL_EVENT.unpack_from(raw, pos)
+            out.append((t, list(m[:2]) if m[0] & 0xF0 in (0xC0, 0xD0) else list(m)))
+        return out
+
+    def recover(self, folder):
+        # Boot time: turns a leftover journal into folder/rec_<time>_recovered.mid; returns its path or None
+        self.folder = folder
+        if not self.journal or not os.path.exists(self.journal): return None
+        try:
+            events = self.read_journal(self.journal); path = None
+            if events:
+                stamp = time.strftime("%y%m%d_%H%M%S", time.localtime(os.path.getmtime(self.journal)))
+                path = os.path.join(folder, f"rec_{stamp}_recovered.mid")
+                self.to_midifile(events=events).save(path)
+            os.remove(self.journal)
+            return path
+        except Exception as e:
+            print("recording not recovered:", e); return None
+
+    # --- SMF ---
+    def to_midifile(self, n=None, events=None):
+        # events: [(seconds since start, [bytes])] instead of the take (recovery, always at TEMPO)
+        import mido
+        mid = mido.MidiFile(ticks_per_beat=self.TICKS_PER_BEAT); track = mido.MidiTrack(); mid.tracks.append(track)
+        evs = sorted(self.events(n) if events is None else events, key=lambda e: e[0])
+        tr = self.transport if events is None else None; tpb = self.TICKS_PER_BEAT
+        if tr:
+            b0 = tr.bar_start(tr.beat_at(self.t0))
+            tick_at = lambda t: (tr.beat_at(self.t0 + t) - b0) * tpb
+            metas = [(max(0, int(round((b - b0) * tpb))), mido.MetaMessage('set_tempo', tempo=int(round(spb * 1e6))))
+                     for b, spb in tr.tempo_changes(tr.time_at(b0), self.t0 + (evs[-1][0] if evs else 0.0))]
+        else:
+            per_s = tpb * 1e6 / self.TEMPO; tick_at = lambda t: t * per_s
+            metas = [(0, mido.MetaMessage('set_tempo', tempo=self.TEMPO))]
+        out = metas + [(int(round(tick_at(t))), mido.Message.from_bytes(msg)) for t, msg in evs]
+        out.sort(key=lambda e: e[0])  # stable: a tempo change goes before the notes on its tick
+        # Arrival order can differ by a few us between merged ports, ticks never go backwards
+        last = 0
+        for tick, msg in out:
+            tick = max(last, tick); track.append(msg.copy(time=tick - last)); last = tick
+        track.append(mido.MetaMessage('end_of_track', time=0))
+        return mid
+
+    def stop(self, filename, on_saved=None):
+        # Returns at once; the file is written on a background thread, then on_saved(filename, ok).
+        # The journal is removed only once the .mid is saved.
+        if not self.recording: return False
+        self.recording = False; n = self.n; writer = self.writer
+        self._wake.set()
+        def save():
+            try: self.to_midifile(n).save(filename); ok = True
+            except Exception as e: print("recording not saved:", e); ok = False
+            if writer: writer.join()
+            if ok and self.journal:
+                try: os.remove(self.journal)
+                except: pass
+            self.saving = None
+            if on_saved: on_saved(filename, ok)
+        self.saving = threading.Thread(target=save, daemon=True); self.saving.start()
+        return True
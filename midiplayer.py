@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
-import sys, git, threading, time, os, fluidsynth, st7789, rtmidi, subprocess, select, mido
+import sys, git, threading, time, os, fluidsynth, st7789, rtmidi, subprocess, select
 from gpiozero import Button, DigitalOutputDevice
 from PIL import Image, ImageDraw, ImageFont
+from midi_input import wait_for_port
+from smf_player import FilePlayer
+from midi_event_cache import EventCache
 
 MESSAGE = ""
 directory = os.path.expanduser("~")
@@ -32,6 +35,7 @@ display_type = "square"
 midiin = rtmidi.MidiIn()
 midiout = rtmidi.MidiOut()
 midioutname="FLUIDSYNTH"
+file_player = FilePlayer(EventCache(directory + "/midifiles/.eventcache"))  # MIDI files to an external output, played from its own thread
 input_ports = midiin.get_ports()
 output_ports = midiout.get_ports()
 for i, port in enumerate(input_ports):
@@ -302,15 +306,8 @@ def wait_for_midi_port(port_name_substring, timeout=10):
         Wait until a MIDI port containing `port_name_substring` appears.
         Returns the full port name or None if timeout expires.
         """
-        midi_in = rtmidi.MidiIn()
-        start = time.time()
-        while time.time() - start < timeout:
-            ports = midi_in.get_ports()
-            for p in ports:
-                if port_name_substring.lower() in p.lower():
-                    return p
-            time.sleep(0.5)  # wait a bit before retrying
-        return None
+        # Watches the ALSA sequencer's port list instead of re-enumerating through rtmidi
+        return wait_for_port(port_name_substring, timeout, rtmidi=rtmidi)
 
 def index_of_substring(lst, substring):
     for i, val in enumerate(lst):
@@ -326,6 +323,7 @@ def handle_button(bt):
         selectedindex += 1
     selectedindex = max(0, min(selectedindex, len(files) - 1))
     if str(bt.pin) == "GPIO6":
+        file_player.stop()
         resetsynth()
     if str(bt.pin) == "GPIO5":
         if operation_mode == "main screen":
@@ -355,12 +353,16 @@ def handle_button(bt):
                     wait_for_midi_port(files[selectedindex])
                     # Recalculate index based on actual available output ports
                     selectedindex = index_of_substring(midiout.get_ports(), files[selectedindex])
-                # Close previously opened port
-                if midiout.is_port_open():
-                    midiout.close_port()
-                # Open the selected output port
-                midiout.open_port(selectedindex)
-                midioutname=files[selectedindex]
+                if selectedindex < 0:
+                    print("MIDI output port not found")
+                    selectedindex = 0
+                else:
+                    # Close previously opened port
+                    if midiout.is_port_open():
+                        midiout.close_port()
+                    # Open the selected output port
+                    midiout.open_port(selectedindex)
+                    midioutname=files[selectedindex]
             else:
                 pathes = ["FLUIDSYNTH"]
                 files = ["FLUIDSYNTH"]
@@ -390,10 +392,14 @@ def handle_button(bt):
                     connect_ble_device(pathes[selectedindex])
                     wait_for_midi_port(files[selectedindex])
                     selectedindex = index_of_substring(midiin.get_ports(), files[selectedindex])
-                if midiin.is_port_open():
-                    midiin.close_port()
-                midiin.open_port(selectedindex)
-                midiin.set_callback(midi_callback)
+                if selectedindex < 0:
+                    print("MIDI input port not found")
+                    selectedindex = 0
+                else:
+                    if midiin.is_port_open():
+                        midiin.close_port()
+                    midiin.open_port(selectedindex)
+                    midiin.set_callback(midi_callback)
                 sfid = fs.sfload(soundfontname,True)
                 try:
                     select_first_preset(fs, sfid)
@@ -449,28 +455,22 @@ def handle_button(bt):
                     operation_mode = "main screen"
                     midifilems = pathes[selectedindex]      # MIDI file path
                     portnamems = midioutname               # Full RtMidi port name
-                    # --- MIDO PLAYBACK REPLACEMENT ---
-                    # Find the matching MIDO output port
-                    outport_name = None
-                    for name in mido.get_output_names():
-                        if portnamems in name or name in portnamems:
-                            outport_name = name
-                            break
-                    if outport_name is None:
-                        print("ERROR: Could not find matching MIDO output port!")
+                    # --- BACKGROUND PLAYBACK (smf_player.py) ---
+                    # Choosing the playing file again pauses / resumes it, the back button stops it
+                    if file_player.path == midifilems and file_player.state in ("playing", "paused"):
+                        if file_player.state == "paused":
+                            file_player.resume()
+                        else:
+                            file_player.pause()
                     else:
-                        # Open the output port
-                        outport = mido.open_output(outport_name)
-                        # Load the MIDI file
-                        mid = mido.MidiFile(midifilems)
-                        # Playback loop
-                        start_time = time.time()
-                        for msg in mid:
-                            time.sleep(msg.time)   # msg.time is delta-time in seconds
-                            if not msg.is_meta:
-                                outport.send(msg)
-                        outport.close()
-                    # --- END MIDO PLAYBACK ---
+                        outport = rtmidi.MidiOut()
+                        port_index = index_of_substring(outport.get_ports(), portnamems)
+                        if port_index < 0:
+                            print("ERROR: Could not find matching MIDI output port!")
+                        else:
+                            outport.open_port(port_index)
+                            file_player.play(midifilems, outport.send_message, on_done=outport.close_port)
+                    # --- END BACKGROUND PLAYBACK ---
             previous_operation_mode = operation_mode
     update_display()
 
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Privileged half of power_profiles.py
+# Started once with `sudo -n` and kept running; reads one JSON batch per line
+# on stdin, writes the whitelisted sysfs files / runs the whitelisted
+# commands, and answers with one JSON line on stdout.
+
+import sys, re, json, subprocess
+
+WRITABLE = [re.compile(p) for p in (
+    r"/sys/devices/system/cpu/cpu\d+/cpufreq/scaling_governor",
+    r"/sys/class/leds/[\w:-]+/(trigger|brightness)",
+    r"/sys/class/rfkill/rfkill\d+/soft",
+)]
+VALUE = re.compile(r"[\w-]{1,32}")
+COMMANDS = {("tvservice", "-o"), ("tvservice", "-p")}
+
+def _current(path):
+    # LED triggers read back as "none [mmc0] timer ..."; the bracketed one is active
+    with open(path) as f: s = f.read().strip()
+    m = re.search(r"\[([^\]]+)\]", s)
+    return m.group(1) if m else s
+
+def apply_batch(batch):
+    written, unchanged, failed = [], 0, []
+    for path, value in batch.get("writes", []):
+        value = str(value)
+        if not any(p.fullmatch(path) for p in WRITABLE) or not VALUE.fullmatch(value):
+            failed.append([path, "not allowed"]); continue
+        try:
+            if _current(path) == value: unchanged += 1; continue
+            with open(path, "w") as f: f.write(value)
+            written.append(path)
+        except Exception as e:
+            failed.append([path, str(e)])
+    for cmd in batch.get("run", []):
+        if tuple(cmd) not in COMMANDS:
+            failed.append([" ".join(cmd), "not allowed"]); continue
+        try: subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
+        except Exception as e: failed.append([" ".join(cmd), str(e)])
+    return {"written": written, "unchanged": unchanged, "failed": failed}
+
+def serve():
+    for line in sys.stdin:
+        try: reply = apply_batch(json.loads(line))
+        except Exception as e: reply = {"written": [], "unchanged": 0, "failed": [["batch", str(e)]]}
+        sys.stdout.write(json.dumps(reply) + "\n"); sys.stdout.flush()
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Named power profiles for the fast_boot variants
+# The OS side (governor on every core, Wi-Fi rfkill, HDMI, ACT LED) goes to
+# power_helper.py as one batch from a worker thread; the app side (polyphony,
+# frame rate) is switched by the caller's callback once the batch is done.
+
+import sys, os, glob, json, shutil, subprocess, threading
+import power_helper
+
+PROFILES = {
+    # low_power: yellow UI accent, halved blank timeout, ECO battery estimate
+    "MAX": {"governor": "ondemand", "wifi": True, "hdmi": True, "led": True, "polyphony": 96, "frame_s": 0.06, "low_power": False},
+    "ECO": {"governor": "powersave", "wifi": False, "hdmi": False, "led": False, "polyphony": 48, "frame_s": 0.15, "low_power": True},
+    # Gig: clocks pinned high for steady latency, radios and LED off
+    "GIG": {"governor": "performance", "wifi": False, "hdmi": False, "led": False, "polyphony": 96, "frame_s": 0.1, "low_power": False},
+}
+
+HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "power_helper.py")
+
+def _wlan_rfkill():
+    out = []
+    for d in glob.glob("/sys/class/rfkill/rfkill*"):
+        try:
+            with open(os.path.join(d, "type")) as f:
+                if f.read().strip() == "wlan": out.append(os.path.join(d, "soft"))
+        except: pass
+    return out
+
+class PowerManager:
+    def __init__(self, profiles=PROFILES, led="ACT"):
+        self.profiles = profiles; self.led = led
+        self.target = None  # last requested profile, applied or not
+        self._pending = None; self._cv = threading.Condition()
+        self._proc = None; self._thread = None
+
+    def batch_for(self, prof):
+        writes = [[p, prof["governor"]] for p in sorted(glob.glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor"))]
+        writes += [[p, "0" if prof["wifi"] else "1"] for p in _wlan_rfkill()]
+        led = f"/sys/class/leds/{self.led}"
+        if os.path.isdir(led):
+            writes += [[led + "/trigger", "mmc0"]] if prof["led"] else [[led + "/trigger", "none"], [led + "/brightness", "0"]]
+        run = [["tvservice", "-p" if prof["hdmi"] else "-o"]] if shutil.which("tvservice") else []
+        return {"writes": writes, "run": run}
+
+    def apply(self, name, on_applied=None):
+        # Returns at once; on_applied(name, failed) runs on the worker thread.
+        # A request made while another is in flight replaces any still queued.
+        with self._cv:
+            self.target = name; self._pending = (name, on_applied)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._worker, daemon=True); self._thread.start()
+            self._cv.notify()
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._pending: self._cv.wait()
+                name, cb = self._pending; self._pending = None
+            reply = self._send(self.batch_for(self.profiles[name]))
+            if cb:
+                try: cb(name, reply["failed"])
+                except Exception as e: print("power profile callback failed:", e)
+
+    def _send(self, batch):
+        if os.geteuid() == 0: return power_helper.apply_batch(batch)
+        for attempt in range(2):
+            try:
+                if not self._proc or self._proc.poll() is not None:
+                    self._proc = subprocess.Popen(["sudo", "-n", sys.executable, HELPER], stdin=subprocess.PIPE,
+                                                  stdout=subprocess.PIPE, text=True, bufsize=1)
+                self._proc.stdin.write(json.dumps(batch) + "\n"); self._proc.stdin.flush()
+                line = self._proc.stdout.readline()
+                if line: return json.loads(line)
+            except: pass
+            self._proc = None
+        return {"written": [], "unchanged": 0, "failed": [["helper", "sudo -n power_helper.py not available"]]}
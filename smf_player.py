@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# MIDI file player for external outputs (midiplayer.py)
+# Songs come compiled from midi_event_cache (us timestamps + packed bytes,
+# memory-mapped) and are sent from one background thread, every event at
+# start + its own time on perf_counter: a late wake-up delays that event
+# only, the ones after it are still due at their own times. Stop, pause,
+# resume and seek work from any thread.
+#
+#   python3 smf_player.py FILE [PORT]   plays FILE (to PORT, or nowhere) and prints the timing error
+
+import sys, os, time, threading
+from latency_stats import Histogram
+from midi_event_cache import EventCache
+
+# Sustain off and all notes off on every channel, sent on stop, pause and seek
+ALL_OFF = [bytes((0xB0 | ch, cc, 0)) for cc in (64, 123) for ch in range(16)]
+
+class FilePlayer:
+    MAX_LATE_S = 0.2  # a stall longer than this moves the rest of the song back instead of rushing it out
+
+    def __init__(self, cache=None):
+        self.cache = cache or EventCache()
+        self.path = None; self.state = "stopped"  # "loading", "playing", "paused", "stopped"
+        self.duration = 0.0; self.sent = 0
+        self.error = Histogram()  # send time - due time, per event
+        self.t0 = 0.0; self._paused_at = 0.0; self._token = None; self._thread = None; self._seek = None
+        self._cv = threading.Condition()
+
+    def play(self, path, send, on_done=None):
+        # send(bytes) is called from the player thread; on_done() once the song ends or is stopped
+        old = self._thread; self.stop()
+        if old: old.join(1.0)
+        with self._cv:
+            self.path = path; self.state = "loading"; self.sent = 0; self.error.reset()
+            token = self._token = object()
+            self._thread = threading.Thread(target=self._run, args=(token, path, send, on_done), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cv:
+            self._token = None; self._cv.notify()
+
+    def pause(self):
+        with self._cv:
+            if self.state == "playing": self.state = "paused"; self._paused_at = time.perf_counter(); self._cv.notify()
+
+    def resume(self):
+        with self._cv:
+            if self.state == "paused": self.t0 += time.perf_counter() - self._paused_at; self.state = "playing"; self._cv.notify()
+
+    def seek(self, seconds):
+        with self._cv:
+            self._seek = max(0.0, seconds); self._cv.notify()
+
+    def position(self):
+        # Seconds into the song
+        if self.state in ("stopped", "loading"): return 0.0
+        return (self._paused_at if self.state == "paused" else time.perf_counter()) - self.t0
+
+    def _run(self, token, path, send, on_done):
+        try: song = self.cache.load(path)
+        except Exception as e: print("smf_player: cannot read", path, e); song = None
+        with self._cv:
+            if self._token is token: self.duration = song.duration if song else 0.0; self.t0 = time.perf_counter(); self.state = "playing"
+        i = 0; n = song.n if song else 0; times = song.times if song else (); quiet = False; record = self.error.record
+        while i < n:
+            with self._cv:
+                if self._token is not token: break
+                if self._seek is not None:
+                    # Sounding notes belong to the old position
+                    for m in ALL_OFF: send(m)
+                    i = song.index_at(self._seek); self.t0 = (self._paused_at if self.state == "paused" else time.perf_counter()) - self._seek
+                    self._seek = None; continue
+                if self.state == "paused":
+                    if not quiet:
+                        for m in ALL_OFF: send(m)
+                        quiet = True
+                    self._cv.wait(); continue
+                quiet = False
+                due = self.t0 + times[i] / 1e6; wait = due - time.perf_counter()
+                if wait > 0: self._cv.wait(wait); continue
+                if wait < -self.MAX_LATE_S: self.t0 -= wait; due -= wait
+            try: send(song.message(i))
+            except: pass
+            record(max(0.0, time.perf_counter() - due)); i += 1; self.sent = i
+        for m in ALL_OFF:
+            try: send(m)
+            except: pass
+        if song: song.close()
+        with self._cv:
+            if self._token is token or self._token is None: self.state = "stopped"
+        r = self.error.summary()
+        if r: print(f"{path}: {self.sent}/{n} events, timing error ms p50 {r['p50']:.2f}  p99 {r['p99']:.2f}  max {r['max']:.2f}")
+        if on_done:
+            try: on_done()
+            except: pass
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        send = lambda m: None; out = None
+        if len(sys.argv) > 2:
+            import rtmidi
+            out = rtmidi.MidiOut(); ports = out.get_ports()
+            out.open_port(next(i for i, p in enumerate(ports) if sys.argv[2] in p)); send = out.send_message
+        p = FilePlayer(EventCache(os.path.join(os.path.dirname(os.path.abspath(sys.argv[1])), ".eventcache"))); done = threading.Event()
+        p.play(sys.argv[1], send, done.set); done.wait()
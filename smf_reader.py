@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Standard MIDI File reader for the playback and indexing paths
+# Decodes the track chunks straight from a memoryview of the file (running
+# status, variable-length quantities, sysex, tempo and time signature metas)
+# into typed arrays, without a Python object per event, and merges the tracks
+# by tick with a heap in the same order as mido.merge_tracks. Anything it does
+# not read (SMPTE division, data bytes without a status, a cut-off track)
+# raises SMFError; callers fall back to mido for those files.
+#
+#   python3 smf_reader.py FOLDER   reads every .mid below FOLDER with both and compares time and result
+#   python3 smf_reader.py --check  tempo changes on one tick, within and across tracks, against mido
+
+import os, sys, time, heapq, struct
+from array import array
+from bisect import bisect_right
+
+class SMFError(ValueError):
+    pass
+
+HEAD = struct.Struct(">4sLHHh")
+CHUNK = struct.Struct(">4sL")
+
+class SMF:
+    # tpb: ticks per beat; ticks/msgs: merged channel and sysex events, 3 bytes each (sysex: F0 0 0,
+    # full message in blob[sx_off[k]:sx_off[k + 1]] for event sx_ev[k]); tempo_tick/tempo_us: tempo
+    # changes, the first at tick 0; beats: numerator of the first time signature or 0; tracks: MTrk chunks read
+    def __init__(self, tpb, ticks, msgs, sx_ev, sx_off, blob, tempo_tick, tempo_us, beats, tracks=1):
+        self.tpb = tpb; self.ticks = ticks; self.msgs = msgs; self.tracks = tracks
+        self.sx_ev = sx_ev; self.sx_off = sx_off; self.blob = blob
+        self.tempo_tick = tempo_tick; self.tempo_us = tempo_us; self.beats = beats
+
+    def tempo_map(self):
+        # [(seconds, beat, seconds per beat)], as transport.file_tempo_map
+        out = []; s = 0.0; tick = 0; spb = 0.5
+        for tk, us in zip(self.tempo_tick, self.tempo_us):
+            s += (tk - tick) / self.tpb * spb; tick = tk; spb = us / 1e6
+            out.append((s, tk / self.tpb, spb))
+        return out
+
+    def times_us(self):
+        # array('q') of every event's time in us from the start
+        tm = self.tempo_map(); starts = self.tempo_tick; tpb = float(self.tpb)
+        out = array('q', bytes(8 * len(self.ticks))); k = 0; nxt = starts[1] if len(starts) > 1 else None
+        s, b, spb = tm[0]; base = starts[0]
+        for i, tk in enumerate(self.ticks):
+            if nxt is not None and tk >= nxt:
+                k = bisect_right(starts, tk) - 1; s, b, spb = tm[k]; base = starts[k]
+                nxt = starts[k + 1] if k + 1 < len(starts) else None
+            out[i] = int(round((s + (tk - base) / tpb * spb) * 1e6))
+        return out
+
+def _track(mv, ti, ticks, msgs, sx, tempos, sigs):
+    # One track chunk: channel events into ticks/msgs, sysex into sx as (event, bytes), metas into tempos/sigs
+    n = len(mv); p = 0; tick = 0; status = run = 0  # run: running status of channel messages
+    while p < n:
+        v = 0
+        while True:
+            c = mv[p]; p += 1; v = (v << 7) | (c & 0x7F)
+            if c < 0x80: break
+        tick += v; c = mv[p]
+        if c >= 0x80: p += 1; status = c
+        elif run: status = run
+        else: raise SMFError("data byte without running status")
+        hi = status & 0xF0
+        if hi < 0xF0:
+            run = status
+            if hi == 0xC0 or hi == 0xD0: msgs += bytes((status, mv[p], 0)); p += 1
+            else: msgs += bytes((status, mv[p], mv[p + 1])); p += 2
+            ticks.append(tick); continue
+        if status == 0xFF: kind = mv[p]; p += 1
+        length = 0
+        while True:
+            c = mv[p]; p += 1; length = (length << 7) | (c & 0x7F)
+            if c < 0x80: break
+        if p + length > n: raise SMFError("event runs past the end of the track")
+        if status == 0xFF:
+            if kind == 0x51 and length == 3: tempos.append((tick, ti, (mv[p] << 16) | (mv[p + 1] << 8) | mv[p + 2]))
+            elif kind == 0x58 and length >= 1: sigs.append((tick, ti, mv[p]))
+            p += length; continue  # metas keep the running status, as in mido
+        if status in (0xF0, 0xF7):
+            # As mido: F0 + data + F7, for escapes too
+            data = bytes(mv[p:p + length])
+            if data[:1] == b"\xF0": data = data[1:]
+            if data[-1:] == b"\xF7": data = data[:-1]
+            sx.append((len(ticks), b"\xF0" + data + b"\xF7")); msgs += b"\xF0\0\0"; ticks.append(tick)
+        else: raise SMFError("status %02X" % status)
+        p += length; status = run = 0  # sysex cancels it
+
+def read(path_or_data):
+    # SMF of a file (path or bytes); raises SMFError for what it does not read
+    if isinstance(path_or_data, (bytes, bytearray, memoryview)): data = path_or_data
+    else:
+        with open(path_or_data, "rb") as f: data = f.read()
+    mv = memoryview(data)
+    try:
+        tag, size, fmt, ntracks, division = HEAD.unpack_from(mv, 0)
+        if tag != b"MThd": raise SMFError("not a MIDI file")
+        if division <= 0: raise SMFError("SMPTE time division")
+        tracks = []; tempos = []; sigs = []; p = 8 + size
+        while p + 8 <= len(mv) and len(tracks) < ntracks:
+            tag, size = CHUNK.unpack_from(mv, p); p += 8
+            if tag == b"MTrk":
+                ticks = array('q'); msgs = bytearray(); sx = []
+                _track(mv[p:p + size], len(tracks), ticks, msgs, sx, tempos, sigs)
+                tracks.append((ticks, msgs, sx))
+            p += size
+    except (IndexError, struct.error) as e: raise SMFError("truncated file: %s" % e)
+    finally: mv.release()
+    # Merge: a heap of (tick of the next event, track), ties keep track order like mido.merge_tracks
+    ticks = array('q'); msgs = bytearray(); sx_ev = array('q'); sx_off = array('q', [0]); blob = bytearray()
+    if len(tracks) == 1:
+        t, m, sx = tracks[0]; ticks = t; msgs = m
+        for i, b in sx: sx_ev.append(i); blob += b; sx_off.append(len(blob))
+    else:
+        pos = [0] * len(tracks); nsx = [0] * len(tracks)
+        heap = [(t[0][0], ti) for ti, t in enumerate(tracks) if len(t[0])]; heapq.heapify(heap)
+        while heap:
+            tick, ti = heap[0]; t, m, sx = tracks[ti]; i = pos[ti]
+            # Take the whole run of this track that stays before the next track's event
+            j = i + 1; nt = len(t)
+            if len(heap) > 1:
+                lt, lti = min(heap[1:3])
+                while j < nt and (t[j] < lt or (t[j] == lt and ti < lti)): j += 1
+            else: j = nt
+            k = nsx[ti]
+            while k < len(sx) and sx[k][0] < j:
+                sx_ev.append(len(ticks) + sx[k][0] - i); blob += sx[k][1]; sx_off.append(len(blob)); k += 1
+            nsx[ti] = k
+            ticks += t[i:j]; msgs += m[3 * i:3 * j]; pos[ti] = j
+            if j < nt: heapq.heapreplace(heap, (t[j], ti))
+            else: heapq.heappop(heap)
+    tempos.sort(key=lambda e: (e[0], e[1]))  # on one tick the last change in file order wins, whatever its value
+    tt = array('q', [0]); tu = array('q', [500000])
+    for tick, _, us in tempos:
+        if tick == tt[-1]: tu[-1] = us
+        else: tt.append(tick); tu.append(us)
+    sigs.sort()
+    return SMF(division, ticks, msgs, sx_ev, sx_off, blob, tt, tu, sigs[0][2] if sigs else 0, len(tracks))
+
+# ---------------------- BENCHMARK ----------------------
+def _bench(folder):
+    import mido
+    paths = sorted(os.path.join(d, f) for d, _, fs in os.walk(folder) for f in fs if f.lower().endswith((".mid", ".midi")))
+    total_m = total_r = 0.0; same = 0; fallback = 0
+    for p in paths:
+        try:
+            t0 = time.perf_counter(); mid = mido.MidiFile(p); ref = [m.bytes() for m in mido.merge_tracks(mid.tracks) if not m.is_meta]; t_mido = time.perf_counter() - t0
+        except Exception as e: print(os.path.basename(p), "mido failed:", e); continue
+        try:
+            t0 = time.perf_counter(); smf = read(p); smf.times_us(); t_read = time.perf_counter() - t0
+        except SMFError as e: print(f"{os.path.basename(p)[:30]:<30} falls back to mido: {e}"); fallback += 1; continue
+        got = [list(smf.msgs[3 * i:3 * i + (2 if smf.msgs[3 * i] & 0xF0 in (0xC0, 0xD0) else 3)]) for i in range(len(smf.ticks))]
+        for k, i in enumerate(smf.sx_ev): got[i] = list(smf.blob[smf.sx_off[k]:smf.sx_off[k + 1]])
+        ok = got == ref; same += ok; total_m += t_mido; total_r += t_read
+        print(f"{os.path.basename(p)[:30]:<30} {len(ref):7d} events   mido {t_mido * 1000:8.1f} ms   smf_reader {t_read * 1000:7.1f} ms   x{t_mido / max(t_read, 1e-9):5.1f}  {'same' if ok else 'DIFFERENT'}")
+    if total_r: print(f"{same} of {len(paths)} files identical, {fallback} fall back; mido {total_m:.2f} s, smf_reader {total_r:.2f} s (x{total_m / total_r:.1f})")
+
+def _check():
+    # Type 1 file whose tempo changes share ticks: twice in one track (faster second) and once in each of two tracks
+    import io, mido
+    mid = mido.MidiFile(type=1, ticks_per_beat=480)
+    mid.tracks.append(mido.MidiTrack([mido.MetaMessage('set_tempo', tempo=400000), mido.MetaMessage('set_tempo', tempo=300000),
+                                      mido.Message('note_on', note=60, velocity=100), mido.MetaMessage('set_tempo', tempo=600000, time=480),
+                                      mido.Message('note_off', note=60, time=480)]))
+    mid.tracks.append(mido.MidiTrack([mido.Message('note_on', note=64, velocity=100, time=480), mido.MetaMessage('set_tempo', tempo=200000),
+                                      mido.Message('note_off', note=64, time=480)]))
+    f = io.BytesIO(); mid.save(file=f); data = f.getvalue()
+    ref = {}; tick = 0
+    for m in mido.merge_tracks(mid.tracks):
+        tick += m.time
+        if m.type == 'set_tempo': ref[tick] = m.tempo
+    ref_times = []; s = 0.0
+    for m in mido.MidiFile(file=io.BytesIO(data)):
+        s += m.time
+        if not m.is_meta: ref_times.append(int(round(s * 1e6)))
+    smf = read(data); got = dict(zip(smf.tempo_tick, smf.tempo_us))
+    ok = got == ref and list(smf.times_us()) == ref_times
+    print("tempo map", got, "mido", ref, "times", list(smf.times_us()), "mido", ref_times, "ok" if ok else "DIFFERENT")
+    return ok
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--check"]: sys.exit(0 if _check() else 1)
+    if len(sys.argv) > 1: _bench(sys.argv[1])
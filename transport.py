@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Shared tempo clock for the fast_boot variants
+# One beat timeline on perf_counter, kept as segments (start time, beat at
+# start, seconds per beat). The metronome clicks on it, the recorder turns
+# its event times into ticks with it and ClockOut sends MIDI Clock on it.
+# Free running it follows the METRONOME speed; while a file plays it follows
+# the file's tempo map. Beats count on across every change, so a recording
+# made across a tempo change or a file start still lines up. A file's
+# timeline ends by itself at the file's last event, as FluidSynth's player does.
+
+import math, time, threading
+from bisect import bisect_left, bisect_right
+import smf_reader
+
+def file_tempo_map(path, cache=None):
+    # [(seconds, beat, seconds per beat)] of a MIDI file, its beats per bar (None without a time signature) and its length in seconds
+    if cache:
+        song = cache.load(path); out = (song.tempo_map(), song.beats or None, song.duration); song.close()
+        return out
+    try:
+        smf = smf_reader.read(path); times = smf.times_us()
+        return smf.tempo_map(), smf.beats or None, times[-1] / 1e6 if len(times) else 0.0
+    except smf_reader.SMFError: pass
+    import mido
+    mid = mido.MidiFile(path); tpb = float(mid.ticks_per_beat)
+    out = [(0.0, 0.0, 0.5)]; beats = None; s = 0.0; tick = 0
+    for msg in mido.merge_tracks(mid.tracks):
+        if msg.time:
+            s += msg.time / tpb * out[-1][2]; tick += msg.time
+        if msg.type == 'set_tempo':
+            seg = (s, tick / tpb, msg.tempo / 1e6)
+            if seg[0] == out[-1][0]: out[-1] = seg
+            else: out.append(seg)
+        elif msg.type == 'time_signature' and beats is None: beats = msg.numerator
+    return out, beats, s
+
+class Transport:
+    HISTORY = 4096  # segments kept for recordings that span tempo changes
+
+    def __init__(self, bpm=120, beats=4, cache=None):
+        # cache: midi_event_cache.EventCache the tempo maps of played files come from
+        self.cache = cache; self.bpm = bpm; self.meter = beats; self.beats = beats  # meter: METRONOME setting, beats: in use (a file's own)
+        self.file = None; self.gen = 0  # gen changes whenever the timeline from now on changes
+        self.phase = 0.0  # a beat that is beat 1 of a bar
+        self.segs = ([time.perf_counter()], [0.0], [60.0 / bpm])
+        self.listeners = []; self._lock = threading.Lock(); self._loading = None; self._end = None  # _end: timer that ends the file's timeline
+
+    # --- timeline ---
+    def beat_at(self, t=None):
+        T, B, S = self.segs; t = time.perf_counter() if t is None else t
+        i = max(0, bisect_right(T, t) - 1)
+        return B[i] + (t - T[i]) / S[i]
+
+    def time_at(self, beat):
+        T, B, S = self.segs
+        i = max(0, bisect_right(B, beat) - 1)
+        return T[i] + (beat - B[i]) * S[i]
+
+    def spb_at(self, t=None):
+        T, B, S = self.segs
+        return S[max(0, bisect_right(T, time.perf_counter() if t is None else t) - 1)]
+
+    def file_bpm(self):
+        return int(round(60.0 / self.spb_at())) if self.file else None
+
+    def grid_beat(self, beat, up=True):
+        # Nearest whole beat of the grid at or after (up) or at or before the beat
+        n = beat - self.phase; r = round(n)
+        if abs(n - r) < 1e-9: n = r
+        return self.phase + (math.ceil(n) if up else math.floor(n))
+
+    def bar_start(self, beat):
+        return self.phase + math.floor((beat - self.phase) / self.beats + 1e-9) * self.beats
+
+    def beat_in_bar(self, beat):
+        return int(round(beat - self.phase)) % self.beats
+
+    def tempo_changes(self, t0, t1):
+        # [(beat, seconds per beat)] in force between t0 and t1, the first one at or before t0
+        T, B, S = self.segs
+        i = max(0, bisect_right(T, t0) - 1); j = bisect_right(T, t1)
+        return [(B[k], S[k]) for k in range(i, max(i + 1, j))]
+
+    def _from(self, t, segs, phase=None):
+        # Replaces the timeline from t on; segs: [(seconds after t, beats after t, seconds per beat)]
+        with self._lock:
+            b = self.beat_at(t); T, B, S = self.segs
+            k = bisect_left(T, t); T, B, S = T[:k], B[:k], S[:k]
+            for ds, db, spb in segs: T.append(t + ds); B.append(b + db); S.append(spb)
+            if len(T) > self.HISTORY: T, B, S = T[-self.HISTORY // 2:], B[-self.HISTORY // 2:], S[-self.HISTORY // 2:]
+            if phase is not None: self.phase = b if phase is True else phase
+            self.segs = (T, B, S); self.gen += 1
+        for fn in self.listeners:
+            try: fn()
+            except: pass
+
+    # --- controls ---
+    def set_bpm(self, bpm):
+        # A playing file keeps its own tempo; the speed applies once it stops
+        self.bpm = bpm
+        if not self.file: self._from(time.perf_counter(), [(0.0, 0.0, 60.0 / bpm)])
+
+    def set_beats(self, beats):
+        # The next beat becomes beat 1 of the bar
+        self.meter = beats
+        if not self.file:
+            t = time.perf_counter(); self.beats = beats; self._from(t, [(0.0, 0.0, self.spb_at(t))], self.grid_beat(self.beat_at(t)))
+
+    def play_file(self, path):
+        # Call with fs.play_midi_file(); the tempo map is read on a thread and placed at this moment
+        t = time.perf_counter(); token = self._loading = object(); self._cancel_end()
+        def load():
+            try: segs, beats, length = file_tempo_map(path, self.cache)
+            except Exception as e: print("transport: no tempo map for", path, e); segs, beats, length = [(0.0, 0.0, 0.5)], None, None
+            if self._loading is not token: return
+            self.file = path; self.beats = beats or self.meter
+            self._from(t, [(s, b, spb) for s, b, spb in segs], True)  # the file starts on beat 1
+            if length is not None:
+                # Nothing tells us when FluidSynth's player is done, so the timeline ends with the song's last event
+                self._end = threading.Timer(max(0.0, t + length - time.perf_counter()), self._ended, (token,)); self._end.daemon = True; self._end.start()
+        threading.Thread(target=load, daemon=True).start()
+
+    def _ended(self, token):
+        if self._loading is token: self.stop_file()
+
+    def _cancel_end(self):
+        end = self._end; self._end = None
+        if end: end.cancel()
+
+    def stop_file(self):
+        self._loading = None; self._cancel_end()
+        if not self.file: return
+        self.file = None; self.beats = self.meter
+        self._from(time.perf_counter(), [(0.0, 0.0, 60.0 / self.bpm)])
+
+# ---------------------- MIDI CLOCK OUT ----------------------
+class ClockOut:
+    # MIDI Clock (24 per beat) on the transport's grid to one output port,
+    # Start when a file starts and Stop when it ends. The thread sleeps to
+    # each pulse's deadline; beat times come from the transport, so a late
+    # wake-up delays one pulse but never shifts the ones after it.
+    PPQN = 24
+
+    def __init__(self, transport):
+        self.transport = transport; self.out = None; self.name = None
+        self.pulse = 0.0; self.gen = None; self.playing = False
+        self._cv = threading.Condition()
+        transport.listeners.append(self._changed)
+
+    def open(self, rtmidi, name):
+        # name: part of the output port name; returns the port opened or None
+        try:
+            out = rtmidi.MidiOut()
+            for i, p in enumerate(out.get_ports()):
+                if name.lower() in p.lower():
+                    out.open_port(i); self.out = out; self.name = p
+                    threading.Thread(target=self._run, daemon=True).start()
+                    return p
+        except Exception as e: print("MIDI clock out:", e)
+        return None
+
+    def _changed(self):
+        with self._cv: self._cv.notify()
+
+    def _send(self, msg):
+        try: self.out.send_message(msg)
+        except: pass
+
+    def _run(self):
+        tr = self.transport; step = 1.0 / self.PPQN
+        while True:
+            with self._cv:
+                if self.gen != tr.gen:
+                    self.gen = tr.gen
+                    if bool(tr.file) != self.playing:
+                        self.playing = bool(tr.file); self._send([0xFA] if self.playing else [0xFC])
+                    n = (tr.beat_at() - tr.phase) / step
+                    self.pulse = tr.phase + math.ceil(n - 1e-9) * step
+                wait = tr.time_at(self.pulse) - time.perf_counter()
+                if wait > 0: self._cv.wait(wait); continue
+                self.pulse += step
+            self._send([0xF8])
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# Waveshare UPS (C) monitor shared by the fast_boot variants
+# The INA219 is polled from one background thread; the display only reads cached values
+
+import os, time, threading, json
+from bisect import bisect_left, insort
+
+# ---------------------- RUNNING MEDIAN ----------------------
+class RunningMedian:
+    # Last `size` samples in a ring (age order) plus the same samples kept
+    # sorted with bisect, so a new sample costs one search + one insert and
+    # the median is a plain index. The EMA on top of the median smooths the
+    # steps the median makes when the window slides.
+    def __init__(self, size=20, alpha=0.3):
+        self.size = size; self.alpha = alpha
+        self.ring = []; self.pos = 0; self.sorted = []
+        self.ema = None
+
+    def add(self, v):
+        if len(self.ring) < self.size:
+            self.ring.append(v)
+        else:
+            del self.sorted[bisect_left(self.sorted, self.ring[self.pos])]
+            self.ring[self.pos] = v; self.pos = (self.pos + 1) % self.size
+        insort(self.sorted, v)
+        m = self.median()
+        self.ema = m if self.ema is None else self.ema + self.alpha * (m - self.ema)
+        return self.ema
+
+    def median(self):
+        return self.sorted[len(self.sorted) // 2] if self.sorted else 0.0
+
+# ---------------------- DISCHARGE CURVE ----------------------
+class DischargeCurve:
+    # mAh the battery delivers while the (loaded) voltage falls through each
+    # `step` wide bin between v_empty and v_full. Starts as the old linear
+    # voltage mapping; every bin the voltage crosses top to bottom while
+    # discharging is re-learned from the charge counted across it, so partial
+    # discharges teach the curve too.
+    def __init__(self, capacity_mah=1000, v_empty=3.4, v_full=4.15, step=0.025, alpha=0.3):
+        self.v_empty = v_empty; self.step = step; self.alpha = alpha
+        self.n = int(round((v_full - v_empty) / step))
+        self.bins = [capacity_mah / self.n] * self.n
+        self._k = None; self._enter = None
+
+    def index(self, v):
+        return max(-1, min(self.n, int((v - self.v_empty) // self.step)))
+
+    def capacity(self):
+        return sum(self.bins)
+
+    def remaining(self, v):
+        k = self.index(v)
+        if k < 0: return 0.0
+        if k >= self.n: return self.capacity()
+        return sum(self.bins[:k]) + self.bins[k] * ((v - self.v_empty) / self.step - k)
+
+    def track(self, v, drawn_mah, charging):
+        # Returns True when a bin was re-learned
+        k = self.index(v); learned = False
+        if charging or self._k is None or k > self._k:
+            self._enter = None
+        elif k < self._k:
+            e = self._enter
+            if e and e[0] == self._k == k + 1 and 0 <= e[0] < self.n:
+                got = drawn_mah - e[1]
+                if 0 < got < 4 * self.capacity() / self.n:
+                    self.bins[e[0]] += self.alpha * (got - self.bins[e[0]]); learned = True
+            self._enter = (k, drawn_mah)
+        self._k = k
+        return learned
+
+# ---------------------- WAVESHARE UPS (C) ----------------------
+class UPS_C:
+    # INA219 at 0x43 with a 0.1 ohm shunt. Calibration 4096 gives 0.1 mA per
+    # current LSB and 2 mW per power LSB. The current register reads
+    # negative while running from the battery.
+    REG_BUS, REG_POWER, REG_CURRENT, REG_CAL = 0x02, 0x03, 0x04, 0x05
+    CAL_VALUE = 4096
+    CURRENT_LSB_MA, POWER_LSB_MW = 0.1, 2.0
+    LOAD_TAU_S = 600.0  # averaging time of the learned per-mode load
+    SAVE_EVERY_S = 300.0
+
+    def __init__(self, addr=0x43, minutes=None, bus=None, window=20, profile_path=None, capacity_mah=1000, mode="normal"):
+        # minutes: linear fallback (full-battery runtime per mode) until a load is known
+        self.addr = addr; self.minutes = minutes or {"normal": 210, "eco": 280}; self.bus = bus
+        if self.bus is None:
+            try:
+                import smbus
+                self.bus = smbus.SMBus(1)
+            except: pass
+        self.filter = RunningMedian(window)
+        self.curve = DischargeCurve(capacity_mah)
+        self.loads = {}  # mode -> average mA drawn from the battery in that mode
+        self.mode = mode; self.profile_path = profile_path
+        # Sampler thread writes these; everyone else only reads them
+        self.voltage = 0.0; self.current = None; self.power = None
+        self.drawn_mah = 0.0; self.minutes_left = 0.0; self.percent = 0
+        self.samples = self.errors = 0
+        self._thread = None; self._on_change = None; self._shown = None
+        self._t_last = None; self._t_saved = time.time(); self._dirty = False
+        self.load_profile()
+
+    # --- persistence ---
+    def load_profile(self):
+        if not self.profile_path or not os.path.exists(self.profile_path): return
+        try:
+            with open(self.profile_path, 'r') as f:
+                data = json.load(f)
+            if len(data.get("bins", [])) == self.curve.n: self.curve.bins = [float(b) for b in data["bins"]]
+            self.loads = {k: float(v) for k, v in data.get("loads", {}).items()}
+        except: pass
+
+    def save_profile(self):
+        if not self.profile_path: return
+        try:
+            with open(self.profile_path, 'w') as f:
+                json.dump({"bins": [round(b, 2) for b in self.curve.bins], "loads": {k: round(v, 1) for k, v in self.loads.items()}}, f)
+            self._dirty = False
+        except: pass
+
+    # --- INA219 ---
+    def read_word(self, reg):
+        # INA219 registers are big-endian, SMBus words little-endian
+        read = self.bus.read_word_data(self.addr, reg)
+        return ((read << 8) & 0xFF00) | ((read >> 8) & 0x00FF)
+
+    def read_signed(self, reg):
+        w = self.read_word(reg)
+        return w - 0x10000 if w & 0x8000 else w
+
+    def calibrate(self):
+        try: self.bus.write_word_data(self.addr, self.REG_CAL, ((self.CAL_VALUE & 0xFF) << 8) | (self.CAL_VALUE >> 8))
+        except: pass
+
+    def sample(self):
+        if not self.bus: return False
+        try:
+            v = (self.read_word(self.REG_BUS) >> 3) * 0.004
+        except:
+            self.errors += 1; return False
+        self.voltage = self.filter.add(v); self.samples += 1
+        try:
+            # A brown-out resets the INA219; it then reads 0 current until recalibrated
+            if self.read_word(self.REG_CAL) != self.CAL_VALUE: self.calibrate()
+            self.current = self.read_signed(self.REG_CURRENT) * self.CURRENT_LSB_MA
+            self.power = self.read_word(self.REG_POWER) * self.POWER_LSB_MW
+        except:
+            self.errors += 1; self.current = None
+        now = time.time()
+        if self.current is not None and self._t_last is not None:
+            dt = now - self._t_last; discharge = -self.current
+            if discharge > 0:
+                self.drawn_mah += discharge * dt / 3600.0
+                old = self.loads.get(self.mode, discharge)
+                self.loads[self.mode] = old + min(1.0, dt / self.LOAD_TAU_S) * (discharge - old); self._dirty = True
+            if self.curve.track(self.voltage, self.drawn_mah, discharge <= 0): self.save_profile()
+        self._t_last = now
+        if self._dirty and now - self._t_saved >= self.SAVE_EVERY_S:
+            self._t_saved = now; self.save_profile()
+        self.estimate()
+        return True
+
+    # --- estimate ---
+    def estimate(self):
+        remaining = self.curve.remaining(self.voltage)
+        self.percent = int(100 * remaining / self.curve.capacity())
+        load = self.loads.get(self.mode)
+        if load and load > 1.0:
+            self.minutes_left = 60.0 * remaining / load
+        else:
+            frac = max(0.0, min(1.0, (self.voltage - self.curve.v_empty) / (self.curve.n * self.curve.step)))
+            self.minutes_left = frac * self.minutes.get(self.mode, 0)
+        shown = (int(self.minutes_left), self.percent)
+        if shown != self._shown:
+            self._shown = shown
+            if self._on_change:
+                try: self._on_change()
+                except: pass
+
+    def set_mode(self, mode):
+        # mode: key for the power setup (polyphony, frame rate, Wi-Fi) the load is learned for
+        self.mode = mode; self.estimate()
+
+    def start(self, interval=2.0, on_change=None):
+        # on_change() is called from the sampler thread whenever the shown time or percentage changes
+        if self._thread or not self.bus: return
+        self._on_change = on_change; self.calibrate()
+        def loop():
+            while True:
+                self.sample(); time.sleep(interval)
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def get_voltage(self):
+        return self.voltage
+
+    def get_time_left(self):
+        return f"{int(self.minutes_left // 60)}:{int(self.minutes_left % 60):02d}"
+
+    def get_percentage_raw(self):
+        return self.percent